@@ -0,0 +1,34 @@
+from pathlib import Path
+
+from benchmarks.suite import compare_results, run_suite, save_results
+from benchmarks.synthetic import generate_raw_dataset
+
+# Multiples of JFK's real flight history to benchmark; synthetic raw data for each
+# scale is generated once under BENCHMARK_DIR and reused by later runs.
+SCALES = [1]
+SEED = 0
+BENCHMARK_DIR = "dataset/benchmarks"
+RESULTS_DIR = "benchmarks/results"
+
+# Results to compare against (a JSON file written by an earlier run), and the
+# relative slowdown or memory growth per stage that counts as a regression.
+BASELINE = None
+REGRESSION_THRESHOLD = 0.2
+
+# Stage output is captured unless VERBOSE is set.
+VERBOSE = False
+
+if __name__ == "__main__":
+    for scale in SCALES:
+        raw_dir = Path(BENCHMARK_DIR) / f"raw_{scale:g}x"
+        if not (raw_dir / "weather_2014_2024.csv").exists():
+            generate_raw_dataset(raw_dir, scale=scale, seed=SEED)
+
+        print(f"\n=== Benchmark at {scale:g}× ===")
+        records = run_suite(
+            raw_dir, Path(BENCHMARK_DIR) / f"work_{scale:g}x", quiet=not VERBOSE
+        )
+        results_path = save_results(records, scale, RESULTS_DIR, seed=SEED)
+
+        if BASELINE is not None:
+            compare_results(BASELINE, results_path, threshold=REGRESSION_THRESHOLD)
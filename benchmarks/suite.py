@@ -0,0 +1,219 @@
+import json
+import os
+import platform
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional, Union
+
+import pandas as pd
+import psutil
+
+from preprocessing.amalgamate import amalgamate_flight_data, scan_flight_data
+from preprocessing.augment import preprocess_iem_weather_data
+from preprocessing.impute import impute_and_clean_dataset
+from preprocessing.instrument import Tracer
+from preprocessing.optimize import merge_with_weather, preprocess_flight_data
+from preprocessing.storage import DEFAULT_FORMAT, read_frame, stage_path, write_frame
+
+STAGES = (
+    "amalgamate_flight_data",
+    "scan_flight_data",
+    "preprocess_iem_weather_data",
+    "merge_with_weather",
+    "preprocess_flight_data",
+    "impute_and_clean_dataset",
+)
+
+
+def profile_stage(name: str, fn, *args, quiet: bool = True, **kwargs):
+    """
+    Runs `fn(*args, **kwargs)` in a span of its own `Tracer`, returning its result
+    and a timing/memory record built from the span.
+    """
+    tracer = Tracer(quiet=quiet)
+    try:
+        with tracer.span(name, "benchmark"):
+            result = fn(*args, **kwargs)
+    finally:
+        tracer.close()
+    span = tracer.records[-1]
+
+    record = {
+        "stage": name,
+        "seconds": round(span["wall_seconds"], 4),
+        "peak_rss_mb": span["peak_rss_mb"],
+        "rss_delta_mb": round(span["peak_rss_mb"] - span["rss_start_mb"], 1),
+    }
+    if isinstance(result, pd.DataFrame):
+        record["rows"] = len(result)
+    print(
+        f"⏱️  {name}: {record['seconds']:.2f}s, peak RSS {record['peak_rss_mb']:.0f} MB "
+        f"(+{record['rss_delta_mb']:.0f} MB)"
+    )
+    return result, record
+
+
+def _merge_input(pruned: pd.DataFrame) -> pd.DataFrame:
+    """The flight columns `merge_with_weather` expects, as build_flight_features has them."""
+    df = pruned.rename(columns={"day_of_month": "day"})
+    hhmm = df["scheduled_departure_time"].astype("int64")
+    df["dep_min"] = (hhmm // 100) * 60 + hhmm % 100
+    return df
+
+
+def run_suite(
+    raw_dir: Union[str, Path],
+    work_dir: Union[str, Path],
+    fmt: str = DEFAULT_FORMAT,
+    origin_id: int = 12478,
+    carriers: list[str] = ["AA", "B6", "DL"],
+    destination: int = 12892,
+    impute_chunksize: Optional[int] = 250_000,
+    quiet: bool = True,
+) -> list[dict]:
+    """
+    Times and memory-profiles every stage function on the raw data in `raw_dir`,
+    chaining their outputs through `work_dir` like `pipeline.py` does. Returns one
+    record per entry of `STAGES`.
+    """
+    raw_dir = Path(raw_dir)
+    work_dir = Path(work_dir)
+    work_dir.mkdir(parents=True, exist_ok=True)
+    combined_path = stage_path(work_dir, "jfk_combined", fmt)
+    pruned_path = stage_path(work_dir, "airline_filtered_pruned", fmt)
+    weather_path = stage_path(work_dir, "jfk_weather_processed", fmt)
+    optimized_path = stage_path(work_dir, "jfk_optimized", fmt)
+
+    records = []
+
+    def profile(name, fn, *args, **kwargs):
+        result, record = profile_stage(name, fn, *args, quiet=quiet, **kwargs)
+        records.append(record)
+        return result
+
+    profile(
+        "amalgamate_flight_data",
+        amalgamate_flight_data,
+        raw_dir,
+        combined_path,
+        origin_id=origin_id,
+    )
+    records[-1]["rows"] = len(read_frame(combined_path, stage="combined"))
+
+    profile(
+        "scan_flight_data",
+        scan_flight_data,
+        raw_data_path=raw_dir,
+        output_file=pruned_path,
+        origin_id=origin_id,
+        carriers=carriers,
+        destination=destination,
+    )
+    pruned = read_frame(pruned_path, stage="pruned")
+    records[-1]["rows"] = len(pruned)
+
+    raw_weather = pd.read_csv(raw_dir / "weather_2014_2024.csv")
+    weather = profile(
+        "preprocess_iem_weather_data", preprocess_iem_weather_data, raw_weather
+    )
+    write_frame(weather, weather_path, stage="weather")
+
+    profile("merge_with_weather", merge_with_weather, _merge_input(pruned), weather)
+
+    profile(
+        "preprocess_flight_data",
+        preprocess_flight_data,
+        pruned_path,
+        optimized_path,
+        weather_path=weather_path,
+    )
+    records[-1]["rows"] = len(read_frame(optimized_path, stage="optimized"))
+
+    profile(
+        "impute_and_clean_dataset",
+        impute_and_clean_dataset,
+        optimized_path,
+        chunksize=impute_chunksize,
+    )
+    clean_path = optimized_path.with_name(f"{optimized_path.stem}_clean.{fmt}")
+    records[-1]["rows"] = len(read_frame(clean_path, stage="clean", columns=["label"]))
+
+    return records
+
+
+def environment() -> dict:
+    return {
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "memory_gb": round(psutil.virtual_memory().total / 1024**3, 1),
+    }
+
+
+def save_results(
+    records: list[dict], scale: float, results_dir: Union[str, Path], **metadata
+) -> Path:
+    """Writes `<results_dir>/<timestamp>_<scale>x.json` with the run environment."""
+    timestamp = datetime.now(timezone.utc)
+    results = {
+        "timestamp": timestamp.isoformat(timespec="seconds"),
+        "scale": scale,
+        "environment": environment(),
+        **metadata,
+        "stages": records,
+    }
+    path = Path(results_dir) / f"{timestamp:%Y%m%dT%H%M%S}_{scale:g}x.json"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(results, indent=2))
+    print(f"Benchmark results saved to {path}")
+    return path
+
+
+def compare_results(
+    baseline: Union[str, Path, dict],
+    current: Union[str, Path, dict],
+    threshold: float = 0.2,
+    metrics: tuple[str, ...] = ("seconds", "peak_rss_mb"),
+) -> list[dict]:
+    """
+    Stages whose `metrics` grew by more than `threshold` (relative) from
+    `baseline` to `current`, each a result dict or the path of a saved one.
+    """
+    baseline, current = (
+        results if isinstance(results, dict) else json.loads(Path(results).read_text())
+        for results in (baseline, current)
+    )
+    if baseline["scale"] != current["scale"]:
+        print(
+            f"⚠️  Comparing different scales: {baseline['scale']}× vs {current['scale']}×"
+        )
+
+    before = {record["stage"]: record for record in baseline["stages"]}
+    regressions = []
+    for record in current["stages"]:
+        previous = before.get(record["stage"])
+        if previous is None:
+            continue
+        for metric in metrics:
+            old, new = previous.get(metric), record.get(metric)
+            if old and new is not None and (new - old) / old > threshold:
+                regressions.append(
+                    {
+                        "stage": record["stage"],
+                        "metric": metric,
+                        "baseline": old,
+                        "current": new,
+                        "change": round((new - old) / old, 3),
+                    }
+                )
+
+    for regression in regressions:
+        print(
+            f"❌ {regression['stage']} {regression['metric']}: "
+            f"{regression['baseline']} -> {regression['current']} "
+            f"(+{regression['change']:.0%})"
+        )
+    if not regressions:
+        print(f"✅ No stage regressed by more than {threshold:.0%}")
+    return regressions
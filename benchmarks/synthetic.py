@@ -0,0 +1,393 @@
+from pathlib import Path
+from typing import Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from preprocessing.amalgamate import collect_csv_files
+
+FIRST_YEAR = 2014
+LAST_YEAR = 2024
+EXCLUDED_YEARS = (2020, 2021)
+
+JFK_ORIGIN_ID = 12478
+
+# Departures per month at 1× scale: roughly JFK's history, plus as many flights
+# from other origins for the origin filter to discard
+JFK_FLIGHTS_PER_MONTH = 19_000
+OTHER_FLIGHTS_PER_MONTH = 19_000
+OBSERVATION_INTERVAL = pd.Timedelta(hours=1)
+
+CARRIER_SHARES = {
+    "B6": 0.38,
+    "DL": 0.30,
+    "AA": 0.14,
+    "9E": 0.07,
+    "YX": 0.04,
+    "AS": 0.03,
+    "UA": 0.02,
+    "HA": 0.01,
+    "NK": 0.01,
+}
+
+# Destination airport ID -> (share of JFK departures, distance in miles)
+JFK_DESTINATIONS = {
+    12892: (0.10, 2475),  # LAX
+    14771: (0.07, 2586),  # SFO
+    13204: (0.07, 944),  # MCO
+    11697: (0.06, 1069),  # FLL
+    10721: (0.05, 187),  # BOS
+    10397: (0.05, 760),  # ATL
+    13303: (0.05, 1089),  # MIA
+    12889: (0.04, 2248),  # LAS
+    14843: (0.04, 1598),  # SJU
+    13930: (0.04, 740),  # ORD
+    14747: (0.03, 2422),  # SEA
+    15304: (0.03, 1005),  # TPA
+    14869: (0.03, 1990),  # SLC
+    11292: (0.03, 1626),  # DEN
+    14107: (0.03, 2153),  # PHX
+    10693: (0.02, 765),  # BNA
+    11057: (0.02, 541),  # CLT
+    14492: (0.02, 427),  # RDU
+    11298: (0.02, 1391),  # DFW
+    12953: (0.02, 213),  # BUF
+    10800: (0.02, 2465),  # BUR
+    14679: (0.02, 2446),  # SAN
+    13487: (0.02, 1029),  # MSP
+    12264: (0.02, 228),  # IAD
+    14100: (0.01, 94),  # PHL
+    10785: (0.01, 2704),  # BQN
+    13796: (0.01, 2565),  # OAK
+    14057: (0.01, 2454),  # PDX
+    12266: (0.01, 1417),  # IAH
+    11259: (0.01, 1391),  # DAL
+    10140: (0.01, 1826),  # ABQ
+    13198: (0.01, 1113),  # MCI
+    11433: (0.01, 509),  # DTW
+    10529: (0.01, 106),  # BDL
+}
+OTHER_ORIGINS = [10397, 13930, 12892, 11298, 11292, 14771, 14747, 10721, 12266]
+
+SKY_COVER_SHARES = {
+    "CLR": 0.30,
+    "FEW": 0.22,
+    "SCT": 0.15,
+    "BKN": 0.15,
+    "OVC": 0.16,
+    "VV": 0.02,
+}
+PRESENT_WEATHER_SHARES = {
+    "": 0.72,
+    "-RA": 0.05,
+    "RA": 0.02,
+    "+RA": 0.01,
+    "-RA BR": 0.02,
+    "BR": 0.04,
+    "HZ": 0.03,
+    "FG": 0.01,
+    "-SN": 0.015,
+    "SN": 0.007,
+    "+SN": 0.002,
+    "-DZ": 0.01,
+    "-FZRA": 0.003,
+    "-SHRA": 0.02,
+    "VCSH": 0.02,
+    "TSRA": 0.005,
+    "VCTS": 0.005,
+    "-TSRA BR": 0.005,
+    "BLSN": 0.003,
+    "FZFG": 0.003,
+}
+
+BTS_COLUMNS = [
+    "YEAR",
+    "MONTH",
+    "DAY_OF_MONTH",
+    "DAY_OF_WEEK",
+    "FL_DATE",
+    "OP_UNIQUE_CARRIER",
+    "ORIGIN_AIRPORT_ID",
+    "DEST_AIRPORT_ID",
+    "CRS_DEP_TIME",
+    "DEP_DELAY",
+    "CANCELLED",
+    "DIVERTED",
+    "CRS_ELAPSED_TIME",
+    "DISTANCE",
+]
+
+
+def flight_months(
+    first_year: int = FIRST_YEAR, last_year: int = LAST_YEAR
+) -> list[tuple[int, int]]:
+    """(year, month) of every BTS file, without the excluded COVID years."""
+    return [
+        (year, month)
+        for year in range(first_year, last_year + 1)
+        if year not in EXCLUDED_YEARS
+        for month in range(1, 13)
+    ]
+
+
+def _shares(table: dict) -> tuple[np.ndarray, np.ndarray]:
+    keys = np.array(list(table))
+    weights = np.array(
+        [value[0] if isinstance(value, tuple) else value for value in table.values()]
+    )
+    return keys, weights / weights.sum()
+
+
+def _departure_minutes(rng: np.random.Generator, n: int) -> np.ndarray:
+    """Scheduled departures in minutes, peaking in the morning and evening banks."""
+    bank = rng.choice(3, size=n, p=[0.40, 0.25, 0.35])
+    centers = np.array([8 * 60, 13 * 60, 18 * 60 + 30])[bank]
+    spreads = np.array([90, 120, 110])[bank]
+    minutes = rng.normal(centers, spreads)
+    minutes = np.clip(minutes, 5 * 60, 23 * 60 + 59)
+    return (minutes // 5 * 5).astype(np.int64)
+
+
+def generate_bts_month(
+    year: int, month: int, scale: float = 1.0, seed: Optional[int] = None
+) -> pd.DataFrame:
+    """
+    One synthetic BTS on-time performance file: JFK departures with realistic
+    carrier and destination mixes, banked schedules, and departure delays that
+    grow through the day, plus flights from other origins.
+    """
+    rng = np.random.default_rng([year, month, 0 if seed is None else seed])
+    n_jfk = max(1, int(round(JFK_FLIGHTS_PER_MONTH * scale)))
+    n_other = int(round(OTHER_FLIGHTS_PER_MONTH * scale))
+    n = n_jfk + n_other
+
+    days_in_month = pd.Period(year=year, month=month, freq="M").days_in_month
+    day = rng.integers(1, days_in_month + 1, size=n)
+    dates = pd.to_datetime(
+        pd.DataFrame({"year": year, "month": month, "day": day})
+    ).to_numpy()
+
+    carriers, carrier_weights = _shares(CARRIER_SHARES)
+    destinations, destination_weights = _shares(JFK_DESTINATIONS)
+    distances = np.array([distance for _, distance in JFK_DESTINATIONS.values()])
+
+    dest_index = rng.choice(len(destinations), size=n, p=destination_weights)
+    origin = np.full(n, JFK_ORIGIN_ID, dtype=np.int64)
+    origin[n_jfk:] = rng.choice(OTHER_ORIGINS, size=n_other)
+    distance = distances[dest_index].astype(np.float64)
+    distance[n_jfk:] = rng.integers(150, 2600, size=n_other)
+
+    dep_min = _departure_minutes(rng, n)
+    elapsed = np.round(35 + distance / 7.8 + rng.normal(0, 8, size=n))
+
+    # Most flights leave on time; the late share and tail grow through the day
+    late_share = 0.18 + 0.22 * dep_min / 1440
+    late = rng.random(n) < late_share
+    delay = np.round(rng.normal(-4, 4, size=n))
+    delay[late] = np.round(rng.exponential(18 + 30 * dep_min[late] / 1440))
+
+    cancelled = rng.random(n) < 0.015
+    diverted = ~cancelled & (rng.random(n) < 0.003)
+    delay[cancelled & (rng.random(n) < 0.9)] = np.nan
+    elapsed[rng.random(n) < 0.0002] = np.nan
+
+    # Built from the fields because strftime's %-m/%-d flags are glibc-only
+    fl_date = f"{month}/" + pd.Series(day).astype(str) + f"/{year} 12:00:00 AM"
+    df = pd.DataFrame(
+        {
+            "YEAR": year,
+            "MONTH": month,
+            "DAY_OF_MONTH": day,
+            "DAY_OF_WEEK": pd.DatetimeIndex(dates).dayofweek + 1,
+            "FL_DATE": fl_date,
+            "OP_UNIQUE_CARRIER": rng.choice(carriers, size=n, p=carrier_weights),
+            "ORIGIN_AIRPORT_ID": origin,
+            "DEST_AIRPORT_ID": destinations[dest_index],
+            "CRS_DEP_TIME": (dep_min // 60) * 100 + dep_min % 60,
+            "DEP_DELAY": delay,
+            "CANCELLED": cancelled.astype(np.float64),
+            "DIVERTED": diverted.astype(np.float64),
+            "CRS_ELAPSED_TIME": elapsed,
+            "DISTANCE": distance,
+        },
+        columns=BTS_COLUMNS,
+    )
+    return df.sort_values(["DAY_OF_MONTH", "CRS_DEP_TIME"], kind="stable")
+
+
+def _missing(
+    rng: np.random.Generator, values: np.ndarray, share: float, fmt: str = "{:g}"
+) -> np.ndarray:
+    """Formats `values` as IEM strings, with "M" for a `share` of missing reports."""
+    text = np.array([fmt.format(value) for value in values], dtype=object)
+    text[rng.random(len(values)) < share] = "M"
+    return text
+
+
+def _metar_temperature(celsius: np.ndarray) -> np.ndarray:
+    whole = np.round(celsius).astype(np.int64)
+    return np.where(
+        whole < 0,
+        np.char.add("M", np.char.zfill(np.abs(whole).astype(str), 2)),
+        np.char.zfill(whole.astype(str), 2),
+    )
+
+
+def generate_iem_weather(
+    start: Union[str, pd.Timestamp] = f"{FIRST_YEAR}-01-01",
+    end: Union[str, pd.Timestamp] = f"{LAST_YEAR + 1}-01-01",
+    scale: float = 1.0,
+    seed: Optional[int] = None,
+    station: str = "JFK",
+) -> pd.DataFrame:
+    """
+    Synthetic IEM ASOS observations for `station`: hourly reports up to 1×, more
+    frequent above it, with seasonal temperatures, prevailing westerly winds,
+    cloud layers and METAR strings carrying present weather groups.
+    """
+    rng = np.random.default_rng([0 if seed is None else seed, 1])
+    # Below 1× the weather stays hourly so the ±2h flight join still matches
+    interval = OBSERVATION_INTERVAL / max(scale, 1.0)
+    interval = max(interval, pd.Timedelta(minutes=1)).floor("min")
+    valid = pd.date_range(start, end, freq=interval, inclusive="left") + pd.Timedelta(
+        minutes=51
+    )
+    n = len(valid)
+
+    day_of_year = valid.dayofyear.to_numpy()
+    hour = valid.hour.to_numpy()
+    seasonal = 13 - 11 * np.cos(2 * np.pi * (day_of_year - 20) / 365.25)
+    diurnal = -3 * np.cos(2 * np.pi * (hour - 3) / 24)
+    tmpc = np.round(seasonal + diurnal + rng.normal(0, 4, size=n), 1)
+    dwpc = np.round(tmpc - rng.gamma(2, 3, size=n), 1)
+
+    drct = (np.round(rng.normal(290, 70, size=n) / 10) * 10 % 360).astype(np.int64)
+    sknt = np.round(rng.gamma(2.5, 4.5, size=n)).astype(np.int64)
+    drct[sknt == 0] = 0
+    gusts = (sknt >= 15) & (rng.random(n) < 0.4)
+    gust = sknt + rng.integers(5, 15, size=n)
+
+    weather_codes, weather_weights = _shares(PRESENT_WEATHER_SHARES)
+    wx = rng.choice(weather_codes, size=n, p=weather_weights)
+    wet = np.char.find(wx.astype(str), "RA") >= 0
+    snowy = np.char.find(wx.astype(str), "SN") >= 0
+    p01i = np.where(wet | snowy, np.round(rng.gamma(1.2, 0.05, size=n), 2), 0.0)
+
+    sky_covers, sky_weights = _shares(SKY_COVER_SHARES)
+    skyc1 = rng.choice(sky_covers, size=n, p=sky_weights)
+    skyc1[(wx != "") & (skyc1 == "CLR")] = "OVC"
+    skyl1 = np.round(rng.gamma(2.0, 2000, size=n) / 100) * 100 + 200
+    skyl1[skyc1 == "CLR"] = np.nan
+    vsby = np.where(wx == "", 10.0, rng.choice([0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 7.0], n))
+
+    mslp = np.round(rng.normal(1016, 8, size=n), 1)
+    alti = np.round(mslp * 0.02953, 2)
+
+    wind_group = np.char.add(
+        np.char.zfill(drct.astype(str), 3), np.char.zfill(sknt.astype(str), 2)
+    )
+    wind_group = np.where(
+        gusts,
+        np.char.add(np.char.add(wind_group, "G"), np.char.zfill(gust.astype(str), 2)),
+        wind_group,
+    )
+    sky_group = np.where(
+        skyc1 == "CLR",
+        "CLR",
+        np.char.add(
+            skyc1.astype(str),
+            np.char.zfill((np.nan_to_num(skyl1) // 100).astype(int).astype(str), 3),
+        ),
+    )
+    vsby_group = np.array([f"{value:g}SM" for value in vsby], dtype=object)
+    vsby_group[vsby == 0.25] = "1/4SM"
+    vsby_group[vsby == 0.5] = "1/2SM"
+    metar = (
+        f"K{station} "
+        + pd.Series(valid.strftime("%d%H%M"))
+        + "Z "
+        + pd.Series(wind_group)
+        + "KT "
+        + pd.Series(vsby_group)
+        + " "
+        + pd.Series(wx).map(lambda value: f"{value} " if value else "")
+        + pd.Series(sky_group)
+        + " "
+        + pd.Series(_metar_temperature(tmpc))
+        + "/"
+        + pd.Series(_metar_temperature(dwpc))
+        + " A"
+        + pd.Series(np.round(alti * 100).astype(np.int64).astype(str))
+        + " RMK AO2 SLP"
+        + pd.Series(
+            (np.round(mslp * 10) % 1000).astype(np.int64).astype(str)
+        ).str.zfill(3)
+    )
+
+    df = pd.DataFrame(
+        {
+            "station": station,
+            "valid": valid.strftime("%Y-%m-%d %H:%M"),
+            "tmpc": _missing(rng, tmpc, 0.01),
+            "dwpc": _missing(rng, dwpc, 0.01),
+            "drct": _missing(rng, drct.astype(np.float64), 0.03),
+            "sknt": _missing(rng, sknt.astype(np.float64), 0.01),
+            "p01i": _missing(rng, p01i, 0.02, "{:.2f}"),
+            "alti": _missing(rng, alti, 0.005, "{:.2f}"),
+            "mslp": _missing(rng, mslp, 0.15, "{:.1f}"),
+            "vsby": _missing(rng, vsby, 0.01),
+            "gust": np.where(gusts, gust.astype(str), "M"),
+            "skyc1": skyc1,
+            "skyc2": "M",
+            "skyc3": "M",
+            "skyl1": _missing(rng, skyl1, 0.02, "{:.0f}"),
+            "skyl2": "M",
+            "skyl3": "M",
+            "wxcodes": np.where(wx == "", "M", wx),
+            "ice_accretion_1hr": "M",
+            "ice_accretion_3hr": "M",
+            "ice_accretion_6hr": "M",
+            "metar": metar.to_numpy(),
+        }
+    )
+    # Trace precipitation is reported as "T", clear skies have no cloud height
+    trace = (df["p01i"] == "0.00") & (rng.random(n) < 0.03)
+    df.loc[trace, "p01i"] = "T"
+    df.loc[skyc1 == "CLR", "skyl1"] = "M"
+    return df
+
+
+def generate_raw_dataset(
+    output_dir: Union[str, Path] = "dataset/raw",
+    scale: float = 1.0,
+    first_year: int = FIRST_YEAR,
+    last_year: int = LAST_YEAR,
+    seed: Optional[int] = None,
+) -> dict[str, int]:
+    """
+    Writes a synthetic `dataset/raw` tree: one BTS CSV per month under
+    `<year>/` and the IEM file `weather_2014_2024.csv`. `scale` multiplies the
+    flights per month and, above 1×, the observation frequency (1× is about JFK's
+    real history; fractions make small CI datasets). Months are generated and written
+    one at a time, so memory stays bounded by a single file. Returns row counts.
+    """
+    output_dir = Path(output_dir)
+    flights = 0
+    for year, month in flight_months(first_year, last_year):
+        df = generate_bts_month(year, month, scale=scale, seed=seed)
+        path = output_dir / str(year) / f"On_Time_Reporting_{year}_{month}.csv"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        df.to_csv(path, index=False)
+        flights += len(df)
+
+    weather = generate_iem_weather(
+        f"{first_year}-01-01", f"{last_year + 1}-01-01", scale=scale, seed=seed
+    )
+    weather.to_csv(output_dir / "weather_2014_2024.csv", index=False)
+
+    print(
+        f"Generated {flights:,} flights in "
+        f"{len(collect_csv_files(output_dir)) - 1} BTS files and "
+        f"{len(weather):,} weather observations under {output_dir} ({scale:g}×)"
+    )
+    return {"flights": flights, "observations": len(weather)}
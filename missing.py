@@ -1,4 +1,4 @@
 from preprocessing.impute import impute_and_clean_dataset
 
-file_path = "dataset/processed/jfk_optimized.csv"
+file_path = "dataset/processed/jfk_optimized.parquet"
 clean_df = impute_and_clean_dataset(file_path)
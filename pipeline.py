@@ -1,40 +1,613 @@
-import pandas as pd
-
-from preprocessing.amalgamate import amalgamate_flight_data
-from preprocessing.augment import preprocess_iem_weather_data
-from preprocessing.filter import filter_selected_carriers_and_destination
-from preprocessing.impute import impute_and_clean_dataset
-from preprocessing.optimize import preprocess_flight_data
-from preprocessing.prune import prune_flight_data
-from preprocessing.stats import (
-    analyze_flight_statistics,
-)
+import argparse
+import sys
+from typing import Optional
 
-if __name__ == "__main__":
-    amalgamate_flight_data(
-        raw_data_path="dataset/raw", output_file="dataset/processed/jfk_combined.csv"
+# Heavy modules (pandas, pyarrow, holidays) are imported by the stage that needs
+# them, so `--help` and quick commands such as `stats` start fast.
+
+# Intermediate format ("parquet", "feather" or "csv") and whether to also export
+# the final ML dataset as CSV.
+INTERMEDIATE_FORMAT = "parquet"
+EXPORT_CSV = True
+
+# Also export each final dataset as a float32 feature matrix (X.npy), label vector
+# (y.npy) and features.json under <name>_matrix/, which load_feature_matrix opens
+# memory-mapped for training without parsing.
+EXPORT_MATRIX = True
+
+# Fused mode scans dataset/raw once, applying the filter and prune predicates while
+# reading; the combined/filtered artifacts are then only written on request.
+FUSED_SCAN = True
+WRITE_STAGE_ARTIFACTS = False
+
+# Incremental mode only processes BTS files and IEM rows added since the last
+# incremental run and appends the results to the existing datasets.
+INCREMENTAL = False
+
+# Stage parameters, part of each stage's cache fingerprint.
+ORIGIN_ID = 12478
+CARRIERS = ["AA", "B6", "DL"]
+DESTINATION_ID = 12892
+RUNWAY_HEADING = 40
+RUNWAY_HEADINGS = (40, 130)  # kernels.JFK_RUNWAY_HEADINGS
+WEATHER_TOLERANCE = "2h"
+WEATHER_DIRECTION = "nearest"
+
+# Rows per chunk when imputing, which bounds memory for large datasets; None
+# loads the optimized dataset at once.
+IMPUTE_CHUNKSIZE = 250_000
+
+# Weather archives longer than WEATHER_SHARD_ROWS are cleaned in time-ordered
+# shards across WEATHER_WORKERS processes (None uses every core); the output is
+# the same as a serial run.
+WEATHER_WORKERS = None
+WEATHER_SHARD_ROWS = 250_000
+
+# Multi-route mode partitions the raw flights by (origin, destination, carrier,
+# year) and builds one dataset per route under dataset/processed/routes/ across a
+# process pool. Every origin needs a processed weather table in WEATHER_STATIONS.
+MULTI_ROUTE = False
+ROUTES = [{"origin": ORIGIN_ID, "destination": DESTINATION_ID, "carriers": CARRIERS}]
+
+# Every stage and hot inner step (METAR parsing, weather merge, dummy encoding,
+# imputation) is traced with wall/CPU time, peak RSS, rows in/out and bytes read
+# and written into TRACE_PATH (JSON lines), and into CHROME_TRACE_PATH if set.
+# TRACE_MEMORY adds tracemalloc deltas; QUIET replaces stage output with a
+# summary at the end.
+TRACE_PATH = "dataset/processed/.trace/pipeline.jsonl"
+CHROME_TRACE_PATH = None
+TRACE_MEMORY = False
+QUIET = False
+
+# Every clean dataset is profiled (null counts, ranges, category frequencies and
+# flag rates) as it is written to <name>_profile.json; set PROFILE_BASELINE to a
+# profile saved by an earlier run to report drift from it.
+PROFILE_BASELINE = None
+
+# Stages listed here are recomputed even if their cached outputs are fresh, e.g.
+# {"weather"}; {"all"} forces every stage.
+FORCE_STAGES = set()
+
+# The processed weather of ORIGIN_ID and a calendar of its years are stored in
+# FEATURE_STORE_DIR; the optimize stage joins from it and serve.py looks flights
+# up in it, so training and serving read the same feature rows.
+FEATURE_STORE_DIR = "dataset/processed/feature_store"
+
+RAW_DIR = "dataset/raw"
+RAW_WEATHER_PATH = "dataset/raw/weather_2014_2024.csv"
+PROCESSED_DIR = "dataset/processed"
+
+STAGE_HELP = {
+    "scan": "Scan dataset/raw once, filtering and pruning while reading",
+    "amalgamate": "Combine the raw BTS files departing ORIGIN_ID",
+    "filter": "Keep CARRIERS flying to DESTINATION_ID",
+    "prune": "Drop cancelled/diverted flights and unused columns",
+    "weather": "Clean the IEM archive and add the weather features",
+    "store": "Store the weather and calendar features for training and serving",
+    "optimize": "Build the flight and delay-rate features and merge the weather",
+    "impute": "Impute missing values and write the clean dataset",
+    "routes": "Build one clean dataset per entry of ROUTES",
+    "incremental": "Append raw files and observations added since the last run",
+    "export": "Export the final datasets as CSV",
+    "matrix": "Export the final datasets as float32 feature matrices",
+}
+
+# Stages that write the final datasets, after which `run` checks their labels
+FINAL_STAGES = {"impute", "routes", "incremental"}
+
+
+def stage_order() -> list[str]:
+    """The stages `run` goes through, in order, for the configured mode."""
+    if INCREMENTAL:
+        stages = ["incremental"]
+    elif MULTI_ROUTE:
+        stages = ["weather", "routes"]
+    else:
+        flights = ["scan"] if FUSED_SCAN else ["amalgamate", "filter", "prune"]
+        stages = [*flights, "weather", "store", "optimize", "impute"]
+    if EXPORT_CSV and INTERMEDIATE_FORMAT != "csv":
+        stages.append("export")
+    if EXPORT_MATRIX:
+        stages.append("matrix")
+    return stages
+
+
+class Pipeline:
+    """
+    The stages of the data pipeline, each a method running through the stage
+    cache, so a stage is only recomputed when its inputs, parameters or code
+    changed. Stage modules are imported on first use.
+    """
+
+    def __init__(self, force: set[str] = FORCE_STAGES):
+        from preprocessing.cache import StageCache
+        from preprocessing.storage import stage_path
+
+        fmt = INTERMEDIATE_FORMAT
+        self.combined_path = stage_path(PROCESSED_DIR, "jfk_combined", fmt)
+        self.filtered_path = stage_path(PROCESSED_DIR, "airline_filtered", fmt)
+        self.pruned_path = stage_path(PROCESSED_DIR, "airline_filtered_pruned", fmt)
+        self.weather_path = stage_path(PROCESSED_DIR, "jfk_weather_processed", fmt)
+        self.optimized_path = stage_path(PROCESSED_DIR, "jfk_optimized", fmt)
+        self.clean_path = stage_path(PROCESSED_DIR, "jfk_optimized_clean", fmt)
+        self.route_stats_path = f"{PROCESSED_DIR}/route_stats.json"
+        self.routes_dir = f"{PROCESSED_DIR}/routes"
+        self.partitions_dir = f"{PROCESSED_DIR}/partitions"
+        self.weather_stations = {ORIGIN_ID: self.weather_path}
+        self.cache = StageCache(f"{PROCESSED_DIR}/.cache", force=force)
+        self._store = None
+
+        self.final_paths = [self.clean_path]
+        if MULTI_ROUTE:
+            from preprocessing.partition import route_clean_path
+
+            self.final_paths = [
+                route_clean_path(self.routes_dir, route, fmt) for route in ROUTES
+            ]
+
+    def flight_files(self) -> list:
+        """
+        The raw BTS files, the flight stages' cache inputs; the weather archive
+        under RAW_DIR is left out so new observations do not rerun the scan.
+        """
+        from pathlib import Path
+
+        from preprocessing.amalgamate import collect_csv_files
+
+        return collect_csv_files(
+            RAW_DIR,
+            exclude=["jfk_weather_2014_24.csv", Path(RAW_WEATHER_PATH).name],
+        )
+
+    def scan(self):
+        from preprocessing import amalgamate, prune, stats, storage
+        from preprocessing import filter as filter_module
+        from preprocessing.amalgamate import scan_flight_data
+        from preprocessing.stats import RouteStats
+
+        outputs = [self.pruned_path, self.route_stats_path]
+        if WRITE_STAGE_ARTIFACTS:
+            outputs += [self.combined_path, self.filtered_path]
+        flight_files = self.flight_files()
+        self.cache.run(
+            "scan",
+            lambda: scan_flight_data(
+                raw_data_path=RAW_DIR,
+                output_file=self.pruned_path,
+                origin_id=ORIGIN_ID,
+                carriers=CARRIERS,
+                destination=DESTINATION_ID,
+                combined_file=self.combined_path if WRITE_STAGE_ARTIFACTS else None,
+                filtered_file=self.filtered_path if WRITE_STAGE_ARTIFACTS else None,
+                stats_file=self.route_stats_path,
+                csv_files=flight_files,
+            ),
+            inputs=flight_files,
+            outputs=outputs,
+            params={
+                "origin": ORIGIN_ID,
+                "carriers": CARRIERS,
+                "destination": DESTINATION_ID,
+            },
+            code=[amalgamate, filter_module, prune, stats, storage],
+        )
+        # Route counts were gathered during the scan
+        RouteStats.load(self.route_stats_path).report()
+
+    def amalgamate(self):
+        from preprocessing import amalgamate, storage
+        from preprocessing.amalgamate import amalgamate_flight_data
+        from preprocessing.stats import analyze_flight_statistics
+
+        self.cache.run(
+            "amalgamate",
+            lambda: amalgamate_flight_data(
+                raw_data_path=RAW_DIR,
+                output_file=self.combined_path,
+                origin_id=ORIGIN_ID,
+            ),
+            inputs=self.flight_files(),
+            outputs=[self.combined_path],
+            params={"origin": ORIGIN_ID},
+            code=[amalgamate, storage],
+        )
+        analyze_flight_statistics(self.combined_path)
+
+    def filter(self):
+        from preprocessing import filter as filter_module
+        from preprocessing import storage
+        from preprocessing.filter import filter_selected_carriers_and_destination
+
+        self.cache.run(
+            "filter",
+            lambda: filter_selected_carriers_and_destination(
+                data_file=self.combined_path,
+                carriers=CARRIERS,
+                destination=DESTINATION_ID,
+                output_file=self.filtered_path,
+            ),
+            inputs=[self.combined_path],
+            outputs=[self.filtered_path],
+            params={"carriers": CARRIERS, "destination": DESTINATION_ID},
+            code=[filter_module, storage],
+        )
+
+    def prune(self):
+        from preprocessing import prune, storage
+        from preprocessing.prune import prune_flight_data
+
+        self.cache.run(
+            "prune",
+            lambda: prune_flight_data(
+                input_path=self.filtered_path, output_path=self.pruned_path
+            ),
+            inputs=[self.filtered_path],
+            outputs=[self.pruned_path],
+            code=[prune, storage],
+        )
+
+    def weather(self):
+        from preprocessing import augment, kernels, storage
+
+        self.cache.run(
+            "weather",
+            self._process_weather,
+            inputs=[RAW_WEATHER_PATH],
+            outputs=[self.weather_path],
+            params={
+                "runway_heading": RUNWAY_HEADING,
+                "runway_headings": RUNWAY_HEADINGS,
+            },
+            code=[augment, kernels, storage],
+        )
+
+    def _process_weather(self):
+        import pandas as pd
+
+        from preprocessing.augment import preprocess_iem_weather_data
+        from preprocessing.storage import write_frame
+
+        df = pd.read_csv(RAW_WEATHER_PATH)
+
+        processed_df = preprocess_iem_weather_data(
+            df,
+            runway_heading=RUNWAY_HEADING,
+            runway_headings=RUNWAY_HEADINGS,
+            workers=WEATHER_WORKERS,
+            shard_rows=WEATHER_SHARD_ROWS,
+        )
+
+        write_frame(processed_df, self.weather_path, stage="weather")
+        print(f"\n✅ Processed weather data saved to '{self.weather_path}'")
+
+    @property
+    def feature_store(self):
+        from preprocessing.feature_store import FeatureStore
+
+        if self._store is None:
+            self._store = FeatureStore(FEATURE_STORE_DIR)
+        return self._store
+
+    def store(self):
+        from preprocessing import calendar_features, feature_store, storage
+        from preprocessing.online import feature_matrix
+        from preprocessing.optimize import weather_feature_columns
+
+        self.cache.run(
+            "store",
+            self._write_store,
+            inputs=[self.weather_path],
+            outputs=[
+                *self.feature_store.weather_paths(ORIGIN_ID),
+                *self.feature_store.calendar_paths(),
+            ],
+            params={"station": ORIGIN_ID},
+            code=[
+                feature_store,
+                calendar_features,
+                storage,
+                feature_matrix,
+                weather_feature_columns,
+            ],
+        )
+
+    def _write_store(self):
+        from preprocessing.storage import read_frame
+
+        weather = read_frame(self.weather_path, stage="weather")
+        self.feature_store.write_weather(ORIGIN_ID, weather)
+        # One year either side covers flights joined across the archive's edges
+        years = weather["datetime"].dt.year
+        self.feature_store.write_calendar(int(years.min()) - 1, int(years.max()) + 1)
+
+    def optimize(self):
+        import pandas as pd
+
+        from preprocessing import (
+            augment,
+            calendar_features,
+            delay_history,
+            feature_store,
+            kernels,
+            optimize,
+            storage,
+        )
+        from preprocessing.delay_history import delay_history_path
+        from preprocessing.optimize import preprocess_flight_data
+
+        tolerance = pd.Timedelta(WEATHER_TOLERANCE)
+        store = self.feature_store
+        self.cache.run(
+            "optimize",
+            lambda: preprocess_flight_data(
+                input_path=self.pruned_path,
+                output_path=self.optimized_path,
+                weather_path=store.weather_frame(ORIGIN_ID),
+                tolerance=tolerance,
+                direction=WEATHER_DIRECTION,
+                calendar=store.calendar_frame(),
+            ),
+            inputs=[
+                self.pruned_path,
+                *store.weather_paths(ORIGIN_ID),
+                *store.calendar_paths(),
+            ],
+            outputs=[self.optimized_path, delay_history_path(self.optimized_path)],
+            params={"tolerance": tolerance, "direction": WEATHER_DIRECTION},
+            code=[
+                optimize,
+                augment,
+                calendar_features,
+                delay_history,
+                feature_store,
+                kernels,
+                storage,
+            ],
+        )
+
+    def impute(self):
+        from preprocessing import augment, impute, kernels, quality, storage
+        from preprocessing.impute import (
+            imputation_values_path,
+            impute_and_clean_dataset,
+        )
+        from preprocessing.quality import profile_path
+
+        self.cache.run(
+            "impute",
+            lambda: impute_and_clean_dataset(
+                self.optimized_path,
+                runway_heading=RUNWAY_HEADING,
+                runway_headings=RUNWAY_HEADINGS,
+                chunksize=IMPUTE_CHUNKSIZE,
+            ),
+            inputs=[self.optimized_path],
+            outputs=[
+                self.clean_path,
+                imputation_values_path(self.clean_path),
+                profile_path(self.clean_path),
+            ],
+            params={
+                "runway_heading": RUNWAY_HEADING,
+                "runway_headings": RUNWAY_HEADINGS,
+            },
+            code=[impute, augment, kernels, quality, storage],
+        )
+
+    def routes(self):
+        import pandas as pd
+
+        from preprocessing import (
+            amalgamate,
+            augment,
+            calendar_features,
+            delay_history,
+            impute,
+            kernels,
+            optimize,
+            partition,
+            prune,
+            quality,
+            storage,
+        )
+        from preprocessing import filter as filter_module
+        from preprocessing.partition import build_route_datasets
+
+        tolerance = pd.Timedelta(WEATHER_TOLERANCE)
+        self.cache.run(
+            "routes",
+            lambda: build_route_datasets(
+                raw_data_path=RAW_DIR,
+                routes=ROUTES,
+                weather_paths=self.weather_stations,
+                output_dir=self.routes_dir,
+                partitions_dir=self.partitions_dir,
+                fmt=INTERMEDIATE_FORMAT,
+                tolerance=tolerance,
+                direction=WEATHER_DIRECTION,
+                runway_heading=RUNWAY_HEADING,
+                runway_headings=RUNWAY_HEADINGS,
+            ),
+            inputs=[*self.flight_files(), *self.weather_stations.values()],
+            outputs=self.final_paths,
+            params={
+                "routes": ROUTES,
+                "tolerance": tolerance,
+                "direction": WEATHER_DIRECTION,
+                "runway_heading": RUNWAY_HEADING,
+                "runway_headings": RUNWAY_HEADINGS,
+            },
+            code=[
+                partition,
+                amalgamate,
+                filter_module,
+                prune,
+                optimize,
+                augment,
+                calendar_features,
+                delay_history,
+                impute,
+                quality,
+                kernels,
+                storage,
+            ],
+        )
+        self.final_paths = [path for path in self.final_paths if path.exists()]
+
+    def incremental(self):
+        import pandas as pd
+
+        from preprocessing.incremental import incremental_update
+
+        incremental_update(
+            raw_data_path=RAW_DIR,
+            weather_file=RAW_WEATHER_PATH,
+            processed_dir=PROCESSED_DIR,
+            fmt=INTERMEDIATE_FORMAT,
+            origin_id=ORIGIN_ID,
+            carriers=CARRIERS,
+            destination=DESTINATION_ID,
+            runway_heading=RUNWAY_HEADING,
+            runway_headings=RUNWAY_HEADINGS,
+            tolerance=pd.Timedelta(WEATHER_TOLERANCE),
+            direction=WEATHER_DIRECTION,
+        )
+
+    def export(self):
+        from preprocessing import storage
+        from preprocessing.storage import export_csv
+
+        self.cache.run(
+            "export",
+            lambda: [export_csv(path) for path in self.final_paths],
+            inputs=self.final_paths,
+            outputs=[path.with_suffix(".csv") for path in self.final_paths],
+            code=[storage],
+        )
+
+    def matrix(self):
+        from preprocessing import matrix, storage
+        from preprocessing.matrix import (
+            export_feature_matrix,
+            matrix_dir,
+            matrix_paths,
+        )
+        from preprocessing.online import feature_columns, feature_matrix
+
+        self.cache.run(
+            "matrix",
+            lambda: [export_feature_matrix(path) for path in self.final_paths],
+            inputs=self.final_paths,
+            outputs=[
+                matrix_path
+                for path in self.final_paths
+                for matrix_path in matrix_paths(matrix_dir(path))
+            ],
+            # Only the encoding is used from the online module, not the builder
+            code=[matrix, storage, feature_columns, feature_matrix],
+        )
+
+    def quality_check(self):
+        from preprocessing.quality import DataProfile, profile_dataset, profile_path
+
+        baseline = DataProfile.load(PROFILE_BASELINE) if PROFILE_BASELINE else None
+        for path in self.final_paths:
+            # The profile written with the dataset spares another scan
+            if profile_path(path).exists():
+                profile = DataProfile.load(profile_path(path))
+            else:
+                profile = profile_dataset(path, stage="clean")
+
+            print(f"\n=== Data Quality Check: {path} ===")
+            print("Label distribution:")
+            print(profile.categories["label"].sort_values(ascending=False))
+            if baseline is not None:
+                print(f"\nDrift from {PROFILE_BASELINE}:")
+                profile.drift(baseline)
+        print("\nDataset ready for machine learning!")
+
+
+def print_stats():
+    """Route statistics of the last scan, or of the combined file without one."""
+    from pathlib import Path
+
+    from preprocessing.stats import RouteStats, analyze_flight_statistics
+    from preprocessing.storage import stage_path
+
+    route_stats_path = Path(f"{PROCESSED_DIR}/route_stats.json")
+    combined_path = stage_path(PROCESSED_DIR, "jfk_combined", INTERMEDIATE_FORMAT)
+    if route_stats_path.exists():
+        RouteStats.load(route_stats_path).report()
+    elif combined_path.exists():
+        analyze_flight_statistics(combined_path)
+    else:
+        sys.exit(f"No {route_stats_path} or {combined_path} yet, run `scan` first")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="pipeline.py",
+        description="Builds the flight delay dataset. Without a command every stage "
+        "runs; stages whose inputs, parameters and code are unchanged are skipped.",
     )
+    commands = parser.add_subparsers(dest="command", metavar="command")
+    force_help = "recompute even if the cached outputs are fresh"
 
-    analyze_flight_statistics()
-    filter_selected_carriers_and_destination()
-    prune_flight_data()
+    stages = stage_order()
+    run = commands.add_parser("run", help="Run the stages in order (the default)")
+    run.add_argument("--from", dest="start", choices=stages, help="first stage")
+    run.add_argument("--to", dest="end", choices=stages, help="last stage")
+    run.add_argument("--force", action="store_true", help=force_help)
 
-    df = pd.read_csv("dataset/raw/weather_2014_2024.csv")
+    for stage, description in STAGE_HELP.items():
+        command = commands.add_parser(stage, help=description)
+        command.add_argument("--force", action="store_true", help=force_help)
 
-    processed_df = preprocess_iem_weather_data(df)
+    commands.add_parser("stats", help="Print the route statistics of the last scan")
+    return parser
 
-    processed_df.to_csv("dataset/processed/jfk_weather_processed.csv", index=False)
-    print("\n✅ Processed weather data saved to 'jfk_weather_processed.csv'")
 
-    preprocess_flight_data(
-        input_path="dataset/processed/airline_filtered_pruned.csv",
-        output_path="dataset/processed/jfk_optimized.csv",
+def main(argv: Optional[list[str]] = None):
+    args = build_parser().parse_args(argv)
+    command = args.command or "run"
+
+    if command == "stats":
+        print_stats()
+        return
+
+    stages = [command]
+    if command == "run":
+        order = stage_order()
+        start = order.index(args.start) if getattr(args, "start", None) else 0
+        end = order.index(args.end) if getattr(args, "end", None) else len(order) - 1
+        if start > end:
+            sys.exit(f"--from {args.start} comes after --to {args.end}")
+        stages = order[start : end + 1]
+
+    from preprocessing import instrument
+
+    force = set(FORCE_STAGES)
+    if getattr(args, "force", False):
+        force.update(stages)
+
+    tracer = instrument.configure(
+        path=TRACE_PATH,
+        chrome_trace_path=CHROME_TRACE_PATH,
+        quiet=QUIET,
+        trace_memory=TRACE_MEMORY,
     )
-    file_path = "dataset/processed/jfk_optimized.csv"
-    clean_df = impute_and_clean_dataset(file_path)
-
-    # Optional: Quick data quality check
-    print("\n=== Data Quality Check ===")
-    print("Label distribution:")
-    print(clean_df["label"].value_counts())
-    print("\nDataset ready for machine learning!")
+    pipeline = Pipeline(force=force)
+    for stage in stages:
+        getattr(pipeline, stage)()
+
+    if command == "run" and FINAL_STAGES & set(stages):
+        pipeline.quality_check()
+
+    instrument.shutdown()
+    print("\n=== Stage Trace ===")
+    print(tracer.summary())
+    print(f"Trace written to {TRACE_PATH}")
+
+
+if __name__ == "__main__":
+    main()
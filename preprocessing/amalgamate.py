@@ -1,8 +1,17 @@
+import os
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor, as_completed
+from contextlib import ExitStack
 from pathlib import Path
-from typing import Union
+from typing import Callable, Iterable, Iterator, Optional, Union
 
 import pandas as pd
 
+from preprocessing.filter import select_carriers_and_destination
+from preprocessing.prune import prune_frame
+from preprocessing.stats import CARRIER_COLUMN, DESTINATION_COLUMN, RouteStats
+from preprocessing.storage import FLIGHT_COLUMN_DTYPES, FrameAppender
+
 
 def collect_csv_files(root: Union[str, Path], exclude: list[str] = []) -> list[Path]:
     """Recursively collects all CSVs under `root`, excluding any filenames in `exclude`."""
@@ -16,18 +25,65 @@ def collect_csv_files(root: Union[str, Path], exclude: list[str] = []) -> list[P
     )
 
 
-def load_and_filter_csv(file_path: Path, origin_id: int = 12478) -> pd.DataFrame:
-    """Loads a CSV and filters it by ORIGIN_AIRPORT_ID == origin_id."""
-    df = pd.read_csv(file_path)
-    if "ORIGIN_AIRPORT_ID" in df.columns:
-        return df[df["ORIGIN_AIRPORT_ID"] == origin_id]
-    return pd.DataFrame()  # empty fallback
+def ordered_results(
+    executor: Executor, fn: Callable, items: Iterable, *args, window: int
+) -> Iterator:
+    """
+    Yields `fn(item, *args)` for every item in order. At most `window` tasks are
+    submitted and not yet yielded, so a result that finishes early waits for the
+    items before it without letting results pile up. Memory stays bounded by
+    `window` results instead of growing with the number of items.
+    """
+    pending = deque()
+    for item in items:
+        if len(pending) >= window:
+            yield pending.popleft().result()
+        pending.append(executor.submit(fn, item, *args))
+    while pending:
+        yield pending.popleft().result()
+
+
+def load_and_filter_csv(
+    file_path: Path, origin_id: int = 12478, chunksize: int = 250_000
+) -> pd.DataFrame:
+    """
+    Streams a CSV in chunks, reading only the known flight columns, and keeps rows
+    with ORIGIN_AIRPORT_ID == origin_id.
+    """
+    header = pd.read_csv(file_path, nrows=0).columns
+    if "ORIGIN_AIRPORT_ID" not in header:
+        return pd.DataFrame()  # empty fallback
+
+    usecols = [col for col in header if col in FLIGHT_COLUMN_DTYPES]
+    dtypes = {col: FLIGHT_COLUMN_DTYPES[col] for col in usecols}
+
+    filtered_chunks = [
+        chunk[chunk["ORIGIN_AIRPORT_ID"] == origin_id]
+        for chunk in pd.read_csv(
+            file_path, usecols=usecols, dtype=dtypes, chunksize=chunksize
+        )
+    ]
+    if not filtered_chunks:
+        return pd.DataFrame(columns=usecols)
+    return pd.concat(filtered_chunks, ignore_index=True)
 
 
 def amalgamate_flight_data(
-    raw_data_path: Union[str, Path], output_file: Union[str, Path]
+    raw_data_path: Union[str, Path],
+    output_file: Union[str, Path],
+    origin_id: int = 12478,
+    workers: Optional[int] = None,
+    chunksize: int = 250_000,
 ):
-    """Combines all filtered CSVs into a single file, saves inside dataset/processed."""
+    """
+    Combines all filtered CSVs into a single file, saves inside dataset/processed.
+
+    Files are filtered across a process pool (`workers` defaults to every core) and
+    the results are appended to `output_file` in sorted file order, so the output
+    is the same on every run. A filtered month that finishes early is held until
+    the files before it have been appended; at most `workers` files are in flight
+    or held, so peak memory is bounded by the worker count.
+    """
     raw_path = Path(raw_data_path)
     output_path = Path(output_file)
 
@@ -39,9 +95,193 @@ def amalgamate_flight_data(
     csv_files = collect_csv_files(raw_path, exclude=["jfk_weather_2014_24.csv"])
     print(f"Found {len(csv_files)} CSV files.")
 
-    all_dataframes = [load_and_filter_csv(file) for file in csv_files]
-    combined_df = pd.concat(all_dataframes, ignore_index=True)
-    print(f"Total records after filtering: {len(combined_df)}")
+    workers = workers or os.cpu_count() or 1
+
+    with (
+        ProcessPoolExecutor(max_workers=workers) as executor,
+        FrameAppender(output_path, stage="combined") as appender,
+    ):
+        results = ordered_results(
+            executor,
+            load_and_filter_csv,
+            csv_files,
+            origin_id,
+            chunksize,
+            window=workers,
+        )
+        for file, df in zip(csv_files, results):
+            if df.empty and len(df.columns) == 0:
+                continue
 
-    combined_df.to_csv(output_path, index=False)
+            appender.append(df)
+            print(f"Filtered {file.name}: {len(df):,} records")
+
+    print(f"Total records after filtering: {appender.rows}")
     print(f"Combined data saved to {output_path}")
+
+
+def scan_and_prune_csv(
+    file_path: Path,
+    origin_id: int = 12478,
+    carriers: list[str] = ["AA", "B6", "DL"],
+    destination: int = 12892,
+    chunksize: int = 250_000,
+    keep_stages: tuple[str, ...] = (),
+) -> tuple[dict[str, pd.DataFrame], RouteStats]:
+    """
+    Streams a raw CSV once, applying the origin, carrier/destination and
+    cancelled/diverted predicates plus the `rename_columns` projection per chunk.
+
+    Returns the pruned rows under "pruned", and the intermediate "combined" and
+    "filtered" rows only for the stages listed in `keep_stages`, together with the
+    route counts of every flight from `origin_id`.
+    """
+    stats = RouteStats()
+    header = pd.read_csv(file_path, nrows=0).columns
+    if "ORIGIN_AIRPORT_ID" not in header:
+        return {}, stats
+
+    usecols = [col for col in header if col in FLIGHT_COLUMN_DTYPES]
+    dtypes = {col: FLIGHT_COLUMN_DTYPES[col] for col in usecols}
+
+    stage_chunks = {stage: [] for stage in ("combined", "filtered", "pruned")}
+    for chunk in pd.read_csv(
+        file_path, usecols=usecols, dtype=dtypes, chunksize=chunksize
+    ):
+        combined = chunk[chunk["ORIGIN_AIRPORT_ID"] == origin_id]
+        stats.update(combined)
+        filtered = select_carriers_and_destination(combined, carriers, destination)
+        stage_chunks["pruned"].append(prune_frame(filtered))
+        if "combined" in keep_stages:
+            stage_chunks["combined"].append(combined)
+        if "filtered" in keep_stages:
+            stage_chunks["filtered"].append(filtered)
+
+    frames = {
+        stage: pd.concat(chunks, ignore_index=True)
+        for stage, chunks in stage_chunks.items()
+        if chunks
+    }
+    return frames, stats
+
+
+def scan_flight_data(
+    raw_data_path: Union[str, Path],
+    output_file: Union[str, Path],
+    origin_id: int = 12478,
+    carriers: list[str] = ["AA", "B6", "DL"],
+    destination: int = 12892,
+    combined_file: Optional[Union[str, Path]] = None,
+    filtered_file: Optional[Union[str, Path]] = None,
+    workers: Optional[int] = None,
+    chunksize: int = 250_000,
+    csv_files: Optional[list[Path]] = None,
+    stats_file: Optional[Union[str, Path]] = None,
+) -> RouteStats:
+    """
+    Fused amalgamate → filter → prune: scans `raw_data_path` once and writes the
+    pruned flights to `output_file`.
+
+    The combined and filtered artifacts are only written when `combined_file` or
+    `filtered_file` is given. Passing `csv_files` scans only those files.
+
+    Route counts for `origin_id` are gathered during the same scan and returned
+    (and saved to `stats_file` if given), so `stats.py` does not need the combined
+    artifact.
+    """
+    if csv_files is None:
+        csv_files = collect_csv_files(
+            raw_data_path, exclude=["jfk_weather_2014_24.csv"]
+        )
+    print(f"Found {len(csv_files)} CSV files.")
+
+    stage_files = {
+        "combined": combined_file,
+        "filtered": filtered_file,
+        "pruned": output_file,
+    }
+    stage_files = {stage: path for stage, path in stage_files.items() if path}
+    keep_stages = tuple(stage for stage in stage_files if stage != "pruned")
+
+    workers = workers or os.cpu_count() or 1
+    stats = RouteStats()
+
+    with ExitStack() as stack:
+        appenders = {
+            stage: stack.enter_context(FrameAppender(path, stage=stage))
+            for stage, path in stage_files.items()
+        }
+        executor = stack.enter_context(ProcessPoolExecutor(max_workers=workers))
+        # Results are appended in sorted file order so every run writes the same rows
+        results = ordered_results(
+            executor,
+            scan_and_prune_csv,
+            csv_files,
+            origin_id,
+            carriers,
+            destination,
+            chunksize,
+            keep_stages,
+            window=workers,
+        )
+        for frames, file_stats in results:
+            for stage, df in frames.items():
+                appenders[stage].append(df)
+            stats.merge(file_stats)
+
+    for stage, appender in appenders.items():
+        print(f"{stage.capitalize()} records: {appender.rows:,} -> {appender.path}")
+
+    if stats_file is not None:
+        stats.save(stats_file)
+    return stats
+
+
+def count_routes_csv(
+    file_path: Path, origin_id: int = 12478, chunksize: int = 250_000
+) -> RouteStats:
+    """Route counts of the flights from `origin_id` in one raw CSV."""
+    stats = RouteStats()
+    header = pd.read_csv(file_path, nrows=0).columns
+    usecols = ["ORIGIN_AIRPORT_ID", CARRIER_COLUMN, DESTINATION_COLUMN]
+    if not set(usecols).issubset(header):
+        return stats
+
+    dtypes = {col: FLIGHT_COLUMN_DTYPES[col] for col in usecols}
+    for chunk in pd.read_csv(
+        file_path, usecols=usecols, dtype=dtypes, chunksize=chunksize
+    ):
+        stats.update(chunk[chunk["ORIGIN_AIRPORT_ID"] == origin_id])
+    return stats
+
+
+def scan_route_stats(
+    raw_data_path: Union[str, Path],
+    origin_id: int = 12478,
+    workers: Optional[int] = None,
+    chunksize: int = 250_000,
+    csv_files: Optional[list[Path]] = None,
+) -> RouteStats:
+    """
+    Counts the carrier + destination routes out of `origin_id` in one pass over the
+    raw BTS files, reading three columns and writing no intermediate file. Useful
+    for picking carriers and a destination for a new origin airport.
+    """
+    if csv_files is None:
+        csv_files = collect_csv_files(
+            raw_data_path, exclude=["jfk_weather_2014_24.csv"]
+        )
+
+    workers = workers or os.cpu_count() or 1
+    stats = RouteStats()
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(count_routes_csv, file, origin_id, chunksize)
+            for file in csv_files
+        ]
+        for future in as_completed(futures):
+            stats.merge(future.result())
+
+    print(f"Counted {stats.flights:,} flights from origin {origin_id}")
+    return stats
@@ -1,10 +1,142 @@
+import os
 import re
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from typing import Optional
 
 import numpy as np
 import pandas as pd
 
+from preprocessing import instrument
+from preprocessing.kernels import (
+    JFK_RUNWAY_HEADINGS,
+    add_runway_crosswinds,
+    ceiling_height,
+    cloud_coverage_score,
+    crosswind_component,
+)
+from preprocessing.quality import DataProfile
+from preprocessing.storage import (
+    PRECIPITATION_LABELS,
+    PRESSURE_LABELS,
+    VISIBILITY_LABELS,
+    WIND_SPEED_LABELS,
+)
+
+WEATHER_PHENOMENA = {
+    "RA": "rain",
+    "SN": "snow",
+    "DZ": "drizzle",
+    "SG": "snow_grains",
+    "IC": "ice_crystals",
+    "PL": "ice_pellets",
+    "GR": "hail",
+    "GS": "small_hail",
+    "UP": "unknown_precipitation",
+    "BR": "mist",
+    "FG": "fog",
+    "FU": "smoke",
+    "VA": "volcanic_ash",
+    "DU": "dust",
+    "SA": "sand",
+    "HZ": "haze",
+    "PY": "spray",
+    "PO": "dust_whirls",
+    "SQ": "squalls",
+    "FC": "funnel_cloud",
+    "SS": "sandstorm",
+    "DS": "duststorm",
+    "TS": "thunderstorm",
+    "SH": "showers",
+    "FZ": "freezing",
+    "MI": "shallow",
+    "PR": "partial",
+    "BC": "patches",
+    "DR": "drifting",
+    "BL": "blowing",
+}
+
+INTENSITY_MAP = {"-": "light", "+": "heavy", "VC": "vicinity"}
+
+METAR_WEATHER_PATTERN = re.compile(r"(-|\+|VC)?(MI|PR|BC|DR|BL|SH|TS|FZ)?([A-Z]{2})")
+
+# Trailing windows over the observation series, each aggregated per column as a
+# sum, min, max or delta (latest valid value in the window minus the last one
+# before it), e.g. `history_precipitation_sum_3h` or `history_pressure_delta_3h`.
+WEATHER_HISTORY_PREFIX = "history_"
+WEATHER_HISTORY_WINDOWS = ("1h", "3h", "6h")
+WEATHER_HISTORY_AGGREGATIONS = {
+    "precipitation": "sum",
+    "visibility": "min",
+    "wind_speed": "max",
+    "pressure": "delta",
+    "temperature": "delta",
+}
+
+
+def preprocess_iem_weather_data(
+    df: pd.DataFrame,
+    runway_heading: float = 40,
+    runway_headings: tuple[float, ...] = JFK_RUNWAY_HEADINGS,
+    history_windows: tuple[str, ...] = WEATHER_HISTORY_WINDOWS,
+    workers: Optional[int] = None,
+    shard_rows: int = 250_000,
+) -> pd.DataFrame:
+    """
+    Cleans raw IEM observations and adds the weather features, sorted by datetime.
+
+    Archives longer than `shard_rows` are split into contiguous row shards (the
+    archive is in time order, so each shard covers a time range) that are cleaned
+    across a process pool of `workers` (default: every core). Shards are merged
+    in their original order with the union of the `weather_*` flags before the
+    sort and the trailing-window history, so the result matches a serial run.
+    """
+    initial_count = len(df)
+    workers = workers or os.cpu_count() or 1
+    n_shards = min(workers, -(-initial_count // shard_rows))
+
+    if n_shards > 1:
+        bounds = np.linspace(0, initial_count, n_shards + 1).astype(int)
+        with (
+            instrument.span("weather_shards", shards=n_shards),
+            ProcessPoolExecutor(max_workers=n_shards) as executor,
+        ):
+            shards = list(
+                executor.map(
+                    clean_weather_observations,
+                    [df.iloc[start:end] for start, end in zip(bounds, bounds[1:])],
+                    repeat(runway_heading),
+                    repeat(runway_headings),
+                )
+            )
+        df = concat_weather_shards(shards)
+        print(f"Cleaned {initial_count:,} records in {n_shards} shards")
+    else:
+        df = clean_weather_observations(df, runway_heading, runway_headings)
+
+    removed_count = initial_count - len(df)
+    print(f"Removed {removed_count:,} records from 2020-2021")
+
+    # Stable, so observations sharing a timestamp keep their archive order
+    df = df.sort_values("datetime", kind="stable").reset_index(drop=True)
+    df = add_weather_history(df, history_windows)
+
+    print(f"Final dataset: {len(df):,} records")
+    print(f"Date range: {df['datetime'].min()} to {df['datetime'].max()}")
+
+    return df
+
 
-def preprocess_iem_weather_data(df: pd.DataFrame) -> pd.DataFrame:
+def clean_weather_observations(
+    df: pd.DataFrame,
+    runway_heading: float = 40,
+    runway_headings: tuple[float, ...] = JFK_RUNWAY_HEADINGS,
+) -> pd.DataFrame:
+    """
+    The per-observation steps of `preprocess_iem_weather_data`: renaming, dropping
+    2020-2021, "M"/"T" cleaning, METAR parsing and the derived weather features.
+    Rows keep their input order and index.
+    """
     rename_dict = {
         "valid": "datetime",
         "tmpc": "temperature",
@@ -21,11 +153,7 @@ def preprocess_iem_weather_data(df: pd.DataFrame) -> pd.DataFrame:
 
     df = df.rename(columns=rename_dict)
     df["datetime"] = pd.to_datetime(df["datetime"])
-
-    initial_count = len(df)
     df = df[~df["datetime"].dt.year.isin([2020, 2021])]
-    removed_count = initial_count - len(df)
-    print(f"Removed {removed_count:,} records from 2020-2021")
 
     columns_to_drop = [
         "station",
@@ -64,139 +192,135 @@ def preprocess_iem_weather_data(df: pd.DataFrame) -> pd.DataFrame:
         df["cloud_cover"] = df["cloud_cover"].replace("M", np.nan)
 
     df = extract_weather_type_from_metar(df)
-    df = add_weather_features(df)
+    df = add_weather_features(
+        df, runway_heading=runway_heading, runway_headings=runway_headings
+    )
 
     intermediate_columns = ["metar_report", "cloud_cover"]
-    df = df.drop(columns=[col for col in intermediate_columns if col in df.columns])
+    return df.drop(columns=[col for col in intermediate_columns if col in df.columns])
 
-    df = df.sort_values("datetime").reset_index(drop=True)
 
-    print(f"Final dataset: {len(df):,} records")
-    print(f"Date range: {df['datetime'].min()} to {df['datetime'].max()}")
+def concat_weather_shards(shards: list[pd.DataFrame]) -> pd.DataFrame:
+    """
+    Concatenates cleaned shards in order. Each shard only has flags for the
+    phenomena in its own reports, so every shard gets the sorted union of the
+    `weather_*` columns (False where absent), in the position a serial run has.
+    """
+    flags = sorted(
+        {col for shard in shards for col in shard.columns if col.startswith("weather_")}
+    )
+    columns = [col for col in shards[0].columns if not col.startswith("weather_")]
+    # extract_weather_type_from_metar appends the flags right before the features
+    position = columns.index("temperature_celsius")
+    columns[position:position] = flags
 
-    return df
+    aligned = []
+    for shard in shards:
+        missing = [col for col in columns if col not in shard.columns]
+        shard = shard.assign(**{col: False for col in missing})
+        aligned.append(shard[columns])
+    return pd.concat(aligned)
+
+
+def parse_weather_types(metar) -> set[str]:
+    """Weather phenomena named in a METAR string, e.g. {"light_rain", "mist"}."""
+    if pd.isna(metar):
+        return set()
+
+    found_weather = set()
+    for intensity, descriptor, phenomenon in METAR_WEATHER_PATTERN.findall(metar):
+        if phenomenon in WEATHER_PHENOMENA:
+            weather_name = WEATHER_PHENOMENA[phenomenon]
+
+            if intensity and intensity in INTENSITY_MAP:
+                weather_name = f"{INTENSITY_MAP[intensity]}_{weather_name}"
+
+            if descriptor and descriptor in WEATHER_PHENOMENA:
+                descriptor_name = WEATHER_PHENOMENA[descriptor]
+                weather_name = f"{descriptor_name}_{weather_name}"
+
+            found_weather.add(weather_name)
+
+    return found_weather
 
 
+@instrument.traced("metar_parsing")
 def extract_weather_type_from_metar(df: pd.DataFrame) -> pd.DataFrame:
-    def parse_weather_types(metar):
-        if pd.isna(metar):
-            return set()
-
-        weather_phenomena = {
-            "RA": "rain",
-            "SN": "snow",
-            "DZ": "drizzle",
-            "SG": "snow_grains",
-            "IC": "ice_crystals",
-            "PL": "ice_pellets",
-            "GR": "hail",
-            "GS": "small_hail",
-            "UP": "unknown_precipitation",
-            "BR": "mist",
-            "FG": "fog",
-            "FU": "smoke",
-            "VA": "volcanic_ash",
-            "DU": "dust",
-            "SA": "sand",
-            "HZ": "haze",
-            "PY": "spray",
-            "PO": "dust_whirls",
-            "SQ": "squalls",
-            "FC": "funnel_cloud",
-            "SS": "sandstorm",
-            "DS": "duststorm",
-            "TS": "thunderstorm",
-            "SH": "showers",
-            "FZ": "freezing",
-            "MI": "shallow",
-            "PR": "partial",
-            "BC": "patches",
-            "DR": "drifting",
-            "BL": "blowing",
-        }
-
-        intensity_map = {"-": "light", "+": "heavy", "VC": "vicinity"}
-        found_weather = set()
-
-        pattern = r"(-|\+|VC)?(MI|PR|BC|DR|BL|SH|TS|FZ)?([A-Z]{2})"
-        matches = re.findall(pattern, metar)
-
-        for intensity, descriptor, phenomenon in matches:
-            if phenomenon in weather_phenomena:
-                weather_name = weather_phenomena[phenomenon]
-
-                if intensity and intensity in intensity_map:
-                    weather_name = f"{intensity_map[intensity]}_{weather_name}"
-
-                if descriptor and descriptor in weather_phenomena:
-                    descriptor_name = weather_phenomena[descriptor]
-                    weather_name = f"{descriptor_name}_{weather_name}"
-
-                found_weather.add(weather_name)
-
-        return found_weather
-
-    df["weather_types"] = df["metar_report"].apply(parse_weather_types)
-
-    all_weather_types = set()
-    for types in df["weather_types"]:
-        all_weather_types.update(types)
-
-    for weather_type in sorted(all_weather_types):
-        df[f"weather_{weather_type}"] = df["weather_types"].apply(
-            lambda x: weather_type in x
-        )
+    """
+    Adds one boolean `weather_<type>` column per phenomenon found in any METAR.
+
+    The pattern never matches across whitespace, so each report is split into
+    tokens and every distinct token is parsed only once; the multi-hot matrix is
+    then filled from the (row, type) pairs in one vectorized step.
+    """
+    tokens = df["metar_report"].fillna("").astype(str).str.split()
+    token_counts = tokens.str.len().to_numpy()
+    row_positions = np.repeat(np.arange(len(df)), token_counts)
+    tokens = tokens.explode().dropna().to_numpy()
+
+    token_codes, unique_tokens = pd.factorize(tokens)
+    token_types = [parse_weather_types(token) for token in unique_tokens]
+
+    all_weather_types = sorted(set().union(*token_types))
+    type_index = {weather_type: i for i, weather_type in enumerate(all_weather_types)}
+    token_matrix = np.zeros((len(unique_tokens), len(all_weather_types)), dtype=bool)
+    for code, types in enumerate(token_types):
+        for weather_type in types:
+            token_matrix[code, type_index[weather_type]] = True
+
+    # Expand every token occurrence into the (row, type) pairs of its token
+    pair_tokens, pair_types = np.nonzero(token_matrix)
+    types_per_token = np.bincount(pair_tokens, minlength=len(unique_tokens))
+    first_pair = np.cumsum(types_per_token) - types_per_token
+
+    repeats = types_per_token[token_codes]
+    hit_rows = np.repeat(row_positions, repeats)
+    offsets = np.arange(repeats.sum()) - np.repeat(
+        np.cumsum(repeats) - repeats, repeats
+    )
+    hit_types = pair_types[np.repeat(first_pair[token_codes], repeats) + offsets]
 
-    df = df.drop(columns=["weather_types"])
-    return df
+    flags = np.zeros((len(df), len(all_weather_types)), dtype=bool)
+    flags[hit_rows, hit_types] = True
 
+    flags_df = pd.DataFrame(
+        flags,
+        index=df.index,
+        columns=[f"weather_{weather_type}" for weather_type in all_weather_types],
+    )
+    return pd.concat([df, flags_df], axis=1)
 
-def add_weather_features(df: pd.DataFrame) -> pd.DataFrame:
+
+@instrument.traced("weather_features")
+def add_weather_features(
+    df: pd.DataFrame,
+    runway_heading: float = 40,
+    runway_headings: tuple[float, ...] = JFK_RUNWAY_HEADINGS,
+) -> pd.DataFrame:
     df["temperature_celsius"] = df["temperature"]
     df["freezing_conditions"] = df["temperature"] <= 0
 
     df["wind_speed_category"] = pd.cut(
         df["wind_speed"],
         bins=[0, 10, 20, 30, float("inf")],
-        labels=["calm", "light", "moderate", "strong"],
+        labels=WIND_SPEED_LABELS,
         include_lowest=True,
     )
 
-    def calculate_crosswind(wind_dir, wind_speed, runway_heading=40):
-        if pd.isna(wind_dir) or pd.isna(wind_speed):
-            return np.nan
-        wind_angle = abs(wind_dir - runway_heading)
-        if wind_angle > 180:
-            wind_angle = 360 - wind_angle
-        return wind_speed * np.sin(np.radians(wind_angle))
-
-    df["crosswind_component"] = df.apply(
-        lambda row: calculate_crosswind(row["wind_direction"], row["wind_speed"]),
-        axis=1,
+    df["crosswind_component"] = crosswind_component(
+        df["wind_direction"], df["wind_speed"], runway_heading
     )
+    df = add_runway_crosswinds(df, runway_headings)
 
     df["visibility_category"] = pd.cut(
         df["visibility"],
         bins=[0, 1, 3, 5, 10, float("inf")],
-        labels=["very_poor", "poor", "marginal", "good", "excellent"],
+        labels=VISIBILITY_LABELS,
         include_lowest=True,
     )
 
-    def calculate_cloud_score(row):
-        coverage_map = {"CLR": 0, "SKC": 0, "FEW": 2, "SCT": 4, "BKN": 6, "OVC": 8}
-        layer = row["cloud_cover"]
-        return coverage_map.get(layer, 0) if pd.notna(layer) else 0
-
-    df["cloud_coverage_score"] = df.apply(calculate_cloud_score, axis=1)
-
-    def get_ceiling(row):
-        coverage = row["cloud_cover"]
-        height = row["cloud_height"]
-        if coverage in ["BKN", "OVC"] and pd.notna(height):
-            return height
-        return 99999
-
-    df["ceiling_height"] = df.apply(get_ceiling, axis=1)
+    df["cloud_coverage_score"] = cloud_coverage_score(df["cloud_cover"])
+    df["ceiling_height"] = ceiling_height(df["cloud_cover"], df["cloud_height"])
 
     df["ifr_conditions"] = (df["ceiling_height"] < 1000) | (df["visibility"] < 3)
     df["mvfr_conditions"] = (
@@ -207,7 +331,7 @@ def add_weather_features(df: pd.DataFrame) -> pd.DataFrame:
     df["precipitation_category"] = pd.cut(
         df["precipitation"],
         bins=[0, 0.01, 0.1, 0.5, float("inf")],
-        labels=["none", "trace", "light", "heavy"],
+        labels=PRECIPITATION_LABELS,
         include_lowest=True,
     )
 
@@ -215,57 +339,136 @@ def add_weather_features(df: pd.DataFrame) -> pd.DataFrame:
     df["pressure_category"] = pd.cut(
         df["pressure"],
         bins=[0, 1000, 1013.25, 1030, float("inf")],
-        labels=["very_low", "low", "normal", "high"],
+        labels=PRESSURE_LABELS,
         include_lowest=True,
     )
 
     return df
 
 
-def analyze_weather_data(df: pd.DataFrame):
+def weather_history_column(column: str, aggregation: str, window: str) -> str:
+    return f"{WEATHER_HISTORY_PREFIX}{column}_{aggregation}_{window}"
+
+
+def weather_history_source(name: str) -> Optional[str]:
+    """
+    Column a missing `history_*` value is filled from: the observation's own value
+    for mins and maxes, None (fill with 0) for sums and deltas.
+    """
+    column, aggregation, _ = name[len(WEATHER_HISTORY_PREFIX) :].rsplit("_", 2)
+    return column if aggregation in ("min", "max") else None
+
+
+def fill_weather_history(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Fills `history_*` values left missing by an empty window or a flight without an
+    earlier observation in tolerance: sums and deltas with 0, mins and maxes with
+    the joined observation's value. A history column is then only missing where
+    the weather it summarizes is, so it drops no extra rows in imputation.
+    """
+    for col in df.columns:
+        if col.startswith(WEATHER_HISTORY_PREFIX):
+            source = weather_history_source(col)
+            fill = df[source] if source in df.columns else 0.0
+            df[col] = df[col].fillna(fill)
+    return df
+
+
+def _window_delta(times: np.ndarray, series: pd.Series, window: pd.Timedelta):
+    """
+    Change of `series` over each window: its latest non-missing value in
+    (t - window, t] minus the latest one at or before t - window. Comparing against
+    the report before the window keeps 1h deltas meaningful on hourly METARs,
+    whose (t - 1h, t] window only holds one routine report.
+    """
+    valid = series.notna().to_numpy()
+    valid_times = times[valid]
+    values = series.to_numpy(dtype=np.float64)[valid]
+    if len(values) == 0:
+        return np.full(len(times), np.nan)
+
+    last = np.searchsorted(valid_times, times, side="right") - 1
+    reference = np.searchsorted(valid_times, times - window, side="right") - 1
+    has_values = (reference >= 0) & (last > reference)
+    last = np.clip(last, 0, len(values) - 1)
+    reference = np.clip(reference, 0, len(values) - 1)
+    return np.where(has_values, values[last] - values[reference], np.nan)
+
+
+@instrument.traced("weather_history")
+def add_weather_history(
+    df: pd.DataFrame,
+    windows: tuple[str, ...] = WEATHER_HISTORY_WINDOWS,
+    aggregations: Optional[dict[str, str]] = None,
+) -> pd.DataFrame:
+    """
+    Adds trailing-window aggregates of the observation series sorted by datetime,
+    replacing any existing `history_*` columns.
+
+    Each window covers (t - window, t], so an observation only summarizes itself
+    and earlier reports. Sums, mins and maxes come from time-based rolling
+    windows and deltas from two binary searches over the valid observations, so
+    every window is one vectorized pass over the table.
+    """
+    aggregations = aggregations or WEATHER_HISTORY_AGGREGATIONS
+    df = df.drop(
+        columns=[c for c in df.columns if c.startswith(WEATHER_HISTORY_PREFIX)]
+    )
+    times = pd.to_datetime(df["datetime"]).to_numpy()
+    present = {col: agg for col, agg in aggregations.items() if col in df.columns}
+    indexed = df[list(present)].set_index(pd.DatetimeIndex(times))
+
+    history = {}
+    for window in windows:
+        rolling = indexed.rolling(window)
+        for col, aggregation in present.items():
+            name = weather_history_column(col, aggregation, window)
+            if aggregation == "delta":
+                history[name] = _window_delta(times, indexed[col], pd.Timedelta(window))
+            else:
+                history[name] = getattr(rolling[col], aggregation)().to_numpy()
+
+    return pd.concat([df, pd.DataFrame(history, index=df.index)], axis=1)
+
+
+def analyze_weather_data(df: pd.DataFrame) -> DataProfile:
+    """Prints missing data, condition and weather type rates from one profiling pass."""
+    profile = DataProfile().update(df)
+    rates = profile.true_counts
+
     print("\n=== Weather Data Analysis ===")
-    print(f"Total records: {len(df):,}")
-    print(f"Date range: {df['datetime'].min()} to {df['datetime'].max()}")
+    print(f"Total records: {profile.rows:,}")
+    print(
+        f"Date range: {profile.first.get('datetime')} to {profile.last.get('datetime')}"
+    )
 
     print("\n--- Missing Data Summary ---")
-    missing_summary = df.isnull().sum()
-    missing_summary = missing_summary[missing_summary > 0].sort_values(ascending=False)
+    missing_summary = profile.nulls[profile.nulls > 0].sort_values(ascending=False)
     for col, count in missing_summary.items():
-        percentage = (count / len(df)) * 100
+        percentage = (count / profile.rows) * 100
         print(f"{col}: {count:,} ({percentage:.2f}%)")
 
     print("\n--- Key Weather Conditions ---")
-
-    if "ifr_conditions" in df.columns:
-        ifr_count = df["ifr_conditions"].sum()
-        ifr_percentage = (ifr_count / len(df)) * 100
-        print(f"IFR conditions: {ifr_count:,} records ({ifr_percentage:.2f}%)")
-
-    if "mvfr_conditions" in df.columns:
-        mvfr_count = df["mvfr_conditions"].sum()
-        mvfr_percentage = (mvfr_count / len(df)) * 100
-        print(f"MVFR conditions: {mvfr_count:,} records ({mvfr_percentage:.2f}%)")
-
-    if "has_precipitation" in df.columns:
-        precip_count = df["has_precipitation"].sum()
-        precip_percentage = (precip_count / len(df)) * 100
-        print(
-            f"Records with precipitation: {precip_count:,} ({precip_percentage:.2f}%)"
+    conditions = {
+        "ifr_conditions": "IFR conditions",
+        "mvfr_conditions": "MVFR conditions",
+        "has_precipitation": "Records with precipitation",
+    }
+    for col, label in conditions.items():
+        if col in rates:
+            count = rates[col]
+            print(f"{label}: {count:,} records ({count / profile.rows * 100:.2f}%)")
+
+    weather_counts = rates[rates.index.str.startswith("weather_")]
+    if len(weather_counts):
+        print(f"\n--- Weather Types Found ({len(weather_counts)} types) ---")
+        weather_counts = weather_counts[weather_counts > 0].sort_values(
+            ascending=False, kind="stable"
         )
-
-    weather_columns = [col for col in df.columns if col.startswith("weather_")]
-    if weather_columns:
-        print(f"\n--- Weather Types Found ({len(weather_columns)} types) ---")
-        weather_counts = []
-        for col in weather_columns:
-            count = df[col].sum()
-            if count > 0:
-                weather_counts.append((col.replace("weather_", ""), count))
-
-        weather_counts.sort(key=lambda x: x[1], reverse=True)
-        for weather_type, count in weather_counts[:10]:
-            percentage = (count / len(df)) * 100
-            print(f"{weather_type}: {count:,} ({percentage:.2f}%)")
+        for col, count in weather_counts.head(10).items():
+            percentage = (count / profile.rows) * 100
+            print(f"{col.replace('weather_', '')}: {count:,} ({percentage:.2f}%)")
 
     print(f"\nFinal dataset shape: {df.shape}")
     print(f"Total features: {len(df.columns)}")
+    return profile
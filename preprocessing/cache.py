@@ -0,0 +1,179 @@
+import hashlib
+import inspect
+import json
+from pathlib import Path
+from types import ModuleType
+from typing import Callable, Iterable, Optional, Union
+
+from preprocessing import instrument
+from preprocessing.storage import count_rows
+
+PathLike = Union[str, Path]
+
+
+def _row_flow(paths: Iterable[PathLike]) -> Optional[int]:
+    counts = [count_rows(path) for path in paths]
+    counts = [count for count in counts if count is not None]
+    return sum(counts) if counts else None
+
+
+def _expand(paths: Iterable[PathLike]) -> list[Path]:
+    """Expands directories into their files so a whole raw folder can be an input."""
+    files = []
+    for path in map(Path, paths):
+        if path.is_dir():
+            files.extend(sorted(p for p in path.rglob("*") if p.is_file()))
+        else:
+            files.append(path)
+    return files
+
+
+class StageCache:
+    """
+    Skips pipeline stages whose inputs, parameters and code are unchanged.
+
+    Each stage records a fingerprint (SHA-256 over the content of its input files,
+    its JSON-encoded parameters and the source of the modules it runs) together
+    with hashes of the outputs it produced. A later run with the same fingerprint
+    and untouched outputs reuses them instead of recomputing. File content hashes
+    are memoized by (size, mtime) so unchanged raw data is not re-read.
+    """
+
+    def __init__(
+        self,
+        cache_dir: PathLike = "dataset/processed/.cache",
+        force: Iterable[str] = (),
+    ):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.force = set(force)
+        self._hash_index_path = self.cache_dir / "file_hashes.json"
+        self._hash_index = self._load_json(self._hash_index_path) or {}
+
+    @staticmethod
+    def _load_json(path: Path) -> Optional[dict]:
+        if not path.exists():
+            return None
+        try:
+            return json.loads(path.read_text())
+        except (OSError, json.JSONDecodeError):
+            return None
+
+    def _manifest_path(self, stage: str) -> Path:
+        return self.cache_dir / f"{stage}.json"
+
+    def file_hash(self, path: PathLike) -> Optional[str]:
+        """Content hash of `path`, reusing the memoized value if size and mtime match."""
+        path = Path(path)
+        if not path.exists():
+            return None
+        if path.is_dir():
+            # A partitioned dataset hashes as the names and hashes of its files
+            digest = hashlib.sha256()
+            for part in _expand([path]):
+                digest.update(str(part.relative_to(path)).encode())
+                digest.update(self.file_hash(part).encode())
+            return digest.hexdigest()
+
+        stat = path.stat()
+        key = str(path.resolve())
+        entry = self._hash_index.get(key)
+        if (
+            entry
+            and entry["size"] == stat.st_size
+            and entry["mtime_ns"] == stat.st_mtime_ns
+        ):
+            return entry["sha256"]
+
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+
+        self._hash_index[key] = {
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "sha256": digest.hexdigest(),
+        }
+        self._hash_index_path.write_text(json.dumps(self._hash_index, indent=1))
+        return digest.hexdigest()
+
+    def fingerprint(
+        self,
+        inputs: Iterable[PathLike] = (),
+        params: Optional[dict] = None,
+        code: Iterable[Union[ModuleType, Callable]] = (),
+    ) -> str:
+        """Fingerprint over input file contents, parameters and code version."""
+        digest = hashlib.sha256()
+
+        for path in _expand(inputs):
+            digest.update(str(path).encode())
+            digest.update((self.file_hash(path) or "missing").encode())
+
+        digest.update(json.dumps(params or {}, sort_keys=True, default=str).encode())
+
+        for obj in code:
+            digest.update(inspect.getsource(obj).encode())
+
+        return digest.hexdigest()
+
+    def is_fresh(
+        self, stage: str, fingerprint: str, outputs: Iterable[PathLike]
+    ) -> bool:
+        """True if `stage` last ran with `fingerprint` and its outputs are untouched."""
+        manifest = self._load_json(self._manifest_path(stage))
+        if manifest is None or manifest.get("fingerprint") != fingerprint:
+            return False
+
+        recorded = manifest.get("outputs", {})
+        outputs = [str(path) for path in outputs]
+        if sorted(recorded) != sorted(outputs):
+            return False
+        return all(
+            recorded[path] is not None and self.file_hash(path) == recorded[path]
+            for path in outputs
+        )
+
+    def invalidate(self, stage: str):
+        """Forgets the recorded run of `stage` so it is recomputed next time."""
+        self._manifest_path(stage).unlink(missing_ok=True)
+
+    def run(
+        self,
+        stage: str,
+        func: Callable,
+        inputs: Iterable[PathLike] = (),
+        outputs: Iterable[PathLike] = (),
+        params: Optional[dict] = None,
+        code: Iterable[Union[ModuleType, Callable]] = (),
+    ) -> bool:
+        """
+        Runs `func` unless `stage` is fresh. Returns True if the stage was recomputed.
+        """
+        inputs = list(inputs)
+        outputs = list(outputs)
+        with instrument.span(stage, category="stage") as span:
+            fingerprint = self.fingerprint(inputs, params, code)
+
+            forced = stage in self.force or "all" in self.force
+            if not forced and self.is_fresh(stage, fingerprint, outputs):
+                print(f"⏭️  Skipping {stage}: inputs, parameters and code unchanged")
+                span.set(cached=True, rows_out=_row_flow(outputs))
+                return False
+
+            self.invalidate(stage)
+            span.set(cached=False, rows_in=_row_flow(inputs))
+            func()
+            span.set(rows_out=_row_flow(outputs))
+
+        manifest = {
+            "stage": stage,
+            "fingerprint": fingerprint,
+            "params": params or {},
+            "outputs": {str(path): self.file_hash(path) for path in outputs},
+        }
+        self._manifest_path(stage).write_text(
+            json.dumps(manifest, indent=2, default=str)
+        )
+        return True
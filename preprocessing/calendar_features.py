@@ -0,0 +1,106 @@
+from functools import lru_cache
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+SEASONS = {
+    12: "winter",
+    1: "winter",
+    2: "winter",
+    3: "spring",
+    4: "spring",
+    5: "spring",
+    6: "summer",
+    7: "summer",
+    8: "summer",
+    9: "fall",
+    10: "fall",
+    11: "fall",
+}
+
+CALENDAR_COLUMNS = [
+    "day_of_year",
+    "days_in_year",
+    "day_of_year_sin",
+    "day_of_year_cos",
+    "season",
+    "is_holiday",
+    "is_weekend",
+    "is_holiday_or_weekend",
+    "part_of_month_early",
+    "part_of_month_mid",
+    "part_of_month_late",
+]
+
+
+@lru_cache(maxsize=None)
+def us_holidays(first_year: int, last_year: int) -> pd.DatetimeIndex:
+    """US federal holidays (observed dates included) from `first_year` to `last_year`."""
+    # Imported on first use: the holidays package is slow to import and only the
+    # calendar table needs it
+    import holidays
+
+    dates = holidays.US(years=range(first_year, last_year + 1))
+    return pd.DatetimeIndex(sorted(dates))
+
+
+@lru_cache(maxsize=None)
+def calendar_table(first_year: int, last_year: int) -> pd.DataFrame:
+    """
+    One row per date from `first_year` to `last_year` with the date-derived flight
+    features, indexed by date.
+
+    Holidays are generated for exactly the requested years, so the table extends
+    to whatever range the flight data covers.
+    """
+    dates = pd.date_range(f"{first_year}-01-01", f"{last_year}-12-31", freq="D")
+    day = dates.day.to_numpy()
+
+    calendar = pd.DataFrame(index=dates)
+    calendar["day_of_year"] = dates.dayofyear.to_numpy()
+    calendar["days_in_year"] = np.where(dates.is_leap_year, 366, 365)
+    calendar["day_of_year_sin"] = np.sin(
+        2 * np.pi * calendar["day_of_year"] / calendar["days_in_year"]
+    )
+    calendar["day_of_year_cos"] = np.cos(
+        2 * np.pi * calendar["day_of_year"] / calendar["days_in_year"]
+    )
+    calendar["season"] = dates.month.map(SEASONS).to_numpy()
+    calendar["is_holiday"] = dates.isin(us_holidays(first_year, last_year))
+    # ISO weekday as in the BTS DAY_OF_WEEK column: 6 = Saturday, 7 = Sunday
+    calendar["is_weekend"] = dates.dayofweek.to_numpy() >= 5
+    calendar["is_holiday_or_weekend"] = calendar["is_holiday"] | calendar["is_weekend"]
+    calendar["part_of_month_early"] = day <= 10
+    calendar["part_of_month_mid"] = (day > 10) & (day <= 20)
+    calendar["part_of_month_late"] = day > 20
+    return calendar
+
+
+def add_calendar_features(
+    df: pd.DataFrame, calendar: Optional[pd.DataFrame] = None
+) -> pd.DataFrame:
+    """
+    Looks up the calendar features of every flight's `year`/`month`/`day` date.
+
+    The table is built once for the years present, so the cost depends on the
+    number of distinct dates rather than the number of flights. A precomputed
+    `calendar` indexed by date (e.g. `FeatureStore.calendar_frame()`) is used
+    instead when given.
+    """
+    dates = pd.to_datetime(df[["year", "month", "day"]])
+    if calendar is not None:
+        features = calendar.reindex(dates)
+    elif dates.empty:
+        features = calendar_table(1970, 1970).iloc[:0]
+    else:
+        calendar = calendar_table(int(dates.dt.year.min()), int(dates.dt.year.max()))
+        features = calendar.reindex(dates)
+    for col in CALENDAR_COLUMNS:
+        df[col] = features[col].to_numpy()
+
+    # Weekends follow the DAY_OF_WEEK reported by BTS when it is available
+    if "day_of_week" in df.columns:
+        df["is_weekend"] = df["day_of_week"].isin([6, 7])
+        df["is_holiday_or_weekend"] = df["is_holiday"] | df["is_weekend"]
+    return df
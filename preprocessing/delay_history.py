@@ -0,0 +1,237 @@
+import json
+from pathlib import Path
+from typing import Optional, Union
+
+import numpy as np
+import pandas as pd
+
+DELAY_RATE_PREFIX = "delay_rate_"
+
+# Groups whose recent delay rate becomes a feature, and the trailing windows in
+# days (None for all earlier days)
+DELAY_RATE_GROUPS = ("carrier", "departure_bin")
+DELAY_RATE_WINDOWS = (7, 30, None)
+
+# Rates are shrunk toward the delay rate of every earlier flight with the weight
+# of this many flights, so sparse windows do not swing between 0 and 1
+PRIOR_WEIGHT = 10.0
+# Prior for the first day of the history, before any outcome is known
+DEFAULT_PRIOR = 0.5
+
+# Key of the all-flights counts that give the prior
+_ALL = "all"
+# Composite sort key: category code in the high bits, day number in the low bits
+_DAY_BITS = 32
+
+
+def delay_rate_column(group: str, window: Optional[int]) -> str:
+    return f"{DELAY_RATE_PREFIX}{group}_{'all' if window is None else f'{window}d'}"
+
+
+def delay_rate_columns(
+    groups=DELAY_RATE_GROUPS, windows=DELAY_RATE_WINDOWS
+) -> list[str]:
+    return [delay_rate_column(group, window) for group in groups for window in windows]
+
+
+def flight_days(df: pd.DataFrame) -> np.ndarray:
+    """Departure date of each flight as days since the epoch."""
+    dates = pd.to_datetime(df[["year", "month", "day"]])
+    return dates.to_numpy(dtype="datetime64[D]").astype(np.int64)
+
+
+class DelayHistory:
+    """
+    Daily flight and delayed-flight counts per carrier and departure bin, the
+    state behind the historical delay-rate features.
+
+    `rates` gives each flight the delay rate of its group over the trailing
+    windows ending the day before it departs, so no flight sees outcomes from
+    its own day or later. Counts are kept per (group, value, day); `rates` turns
+    them into cumulative sums sorted by (value, day) and answers every flight
+    with two binary searches per window, O(N log N) for all groups at once.
+    New days are added with `update` and partial histories combined with
+    `merge`, so the history never needs a rescan of earlier flights.
+    """
+
+    def __init__(
+        self,
+        groups=DELAY_RATE_GROUPS,
+        windows=DELAY_RATE_WINDOWS,
+        prior_weight: float = PRIOR_WEIGHT,
+    ):
+        self.groups = tuple(groups)
+        self.windows = tuple(windows)
+        self.prior_weight = prior_weight
+        self.counts = {
+            group: pd.DataFrame(
+                {
+                    "flights": pd.Series(dtype="int64"),
+                    "delayed": pd.Series(dtype="int64"),
+                },
+                index=pd.MultiIndex.from_arrays([[], []], names=["value", "day"]),
+            )
+            for group in (*self.groups, _ALL)
+        }
+        self._compiled = {}
+
+    def update(self, df: pd.DataFrame) -> "DelayHistory":
+        """
+        Adds the outcomes of flights with `year`, `month`, `day`,
+        `departure_delay` and the group columns, as `prepare_flights` returns them.
+        """
+        if df.empty:
+            return self
+        outcomes = pd.DataFrame(
+            {
+                "day": flight_days(df),
+                "flights": 1,
+                "delayed": (df["departure_delay"] > 0).to_numpy().astype("int64"),
+            }
+        )
+        for group in (*self.groups, _ALL):
+            values = _ALL if group == _ALL else df[group].astype(str).to_numpy()
+            counts = (
+                outcomes.assign(value=values)
+                .groupby(["value", "day"])[["flights", "delayed"]]
+                .sum()
+            )
+            self._add(group, counts)
+        return self
+
+    def merge(self, other: "DelayHistory") -> "DelayHistory":
+        for group, counts in other.counts.items():
+            if group in self.counts:
+                self._add(group, counts)
+        return self
+
+    def _add(self, group: str, counts: pd.DataFrame):
+        if len(counts):
+            self.counts[group] = (
+                self.counts[group].add(counts, fill_value=0).astype("int64")
+            )
+            self._compiled.pop(group, None)
+
+    @property
+    def columns(self) -> list[str]:
+        return delay_rate_columns(self.groups, self.windows)
+
+    @property
+    def last_day(self) -> Optional[pd.Timestamp]:
+        days = self.counts[_ALL].index.get_level_values("day")
+        return pd.Timestamp(int(days.max()), unit="D") if len(days) else None
+
+    def _compile(self, group: str):
+        """Values, sort keys and running counts of a group, cached until updated."""
+        if group not in self._compiled:
+            counts = self.counts[group].sort_index()
+            values = counts.index.get_level_values("value")
+            categories = pd.Index(values.unique())
+            codes = categories.get_indexer(values).astype(np.int64)
+            days = counts.index.get_level_values("day").to_numpy(dtype=np.int64)
+            # Running totals with a leading zero: entry i counts every (value, day)
+            # key below the i-th, so a window is the difference of two lookups
+            running = np.zeros((len(counts) + 1, 2), dtype=np.int64)
+            np.cumsum(
+                counts[["flights", "delayed"]].to_numpy(), axis=0, out=running[1:]
+            )
+            self._compiled[group] = (categories, (codes << _DAY_BITS) | days, running)
+        return self._compiled[group]
+
+    def _window_counts(
+        self, group: str, values, days: np.ndarray, window: Optional[int]
+    ) -> np.ndarray:
+        """(flights, delayed) per query over the `window` days before `days`."""
+        categories, keys, running = self._compile(group)
+        codes = categories.get_indexer(values).astype(np.int64)
+        start = np.zeros_like(days) if window is None else np.maximum(days - window, 0)
+        upper = running[np.searchsorted(keys, (codes << _DAY_BITS) | days)]
+        lower = running[np.searchsorted(keys, (codes << _DAY_BITS) | start)]
+        # Values never seen before have no history
+        return np.where((codes >= 0)[:, None], upper - lower, 0)
+
+    def _rates(self, days: np.ndarray, values: dict) -> dict[str, np.ndarray]:
+        flights, delayed = self._window_counts(
+            _ALL, np.full(len(days), _ALL), days, None
+        ).T
+        prior = np.where(flights > 0, delayed / np.maximum(flights, 1), DEFAULT_PRIOR)
+
+        rates = {}
+        for group in self.groups:
+            for window in self.windows:
+                flights, delayed = self._window_counts(
+                    group, values[group], days, window
+                ).T
+                rates[delay_rate_column(group, window)] = (
+                    delayed + self.prior_weight * prior
+                ) / (flights + self.prior_weight)
+        return rates
+
+    def rates(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Delay-rate features of flights with `year`, `month`, `day` and the group
+        columns, aligned with `df`. Each rate covers the window's days before the
+        flight's own day and is smoothed toward the rate of every earlier flight.
+        """
+        values = {group: df[group].astype(str).to_numpy() for group in self.groups}
+        return pd.DataFrame(self._rates(flight_days(df), values), index=df.index)
+
+    def flight_rates(self, day: int, values: dict) -> dict[str, float]:
+        """
+        Delay-rate features of one flight departing on `day` (days since the
+        epoch), with `values` mapping each group to the flight's value.
+        """
+        rates = self._rates(
+            np.array([day], dtype=np.int64),
+            {group: np.array([str(values[group])]) for group in self.groups},
+        )
+        return {col: float(rate[0]) for col, rate in rates.items()}
+
+    def to_dict(self) -> dict:
+        return {
+            "groups": list(self.groups),
+            "windows": list(self.windows),
+            "prior_weight": self.prior_weight,
+            "counts": {
+                group: [
+                    [str(value), int(day), int(row.flights), int(row.delayed)]
+                    for (value, day), row in zip(counts.index, counts.itertuples())
+                ]
+                for group, counts in self.counts.items()
+            },
+        }
+
+    def save(self, path: Union[str, Path]) -> Path:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(self.to_dict()))
+        return path
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> "DelayHistory":
+        data = json.loads(Path(path).read_text())
+        history = cls(data["groups"], data["windows"], data["prior_weight"])
+        for group, rows in data["counts"].items():
+            counts = pd.DataFrame(rows, columns=["value", "day", "flights", "delayed"])
+            history._add(group, counts.set_index(["value", "day"]).astype("int64"))
+        return history
+
+
+def delay_history_path(data_path: Union[str, Path]) -> Path:
+    """`<stem>_delay_history.json` next to a dataset."""
+    data_path = Path(data_path)
+    return data_path.with_name(f"{data_path.stem}_delay_history.json")
+
+
+def add_delay_rates(
+    df: pd.DataFrame, history: Optional[DelayHistory] = None
+) -> tuple[pd.DataFrame, DelayHistory]:
+    """
+    Adds the delay-rate features to prepared flights. Without a `history` one is
+    built from `df` itself; as every rate only looks at earlier days, this is
+    the same as replaying the flights day by day. Returns the frame and history.
+    """
+    if history is None:
+        history = DelayHistory().update(df)
+    rates = history.rates(df)
+    return pd.concat([df, rates], axis=1), history
@@ -0,0 +1,237 @@
+import json
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from preprocessing.calendar_features import CALENDAR_COLUMNS, SEASONS, calendar_table
+from preprocessing.online import feature_matrix
+from preprocessing.optimize import weather_feature_columns
+from preprocessing.storage import apply_schema, read_frame
+
+SEASON_LABELS = sorted(set(SEASONS.values()))
+TABLE_FILES = ("keys.npy", "values.npy", "features.json")
+
+
+def _write_table(
+    directory: Path, keys: np.ndarray, df: pd.DataFrame, columns: list[str]
+):
+    """
+    Writes `df[columns]` as a float32 matrix (categoricals as codes, bools as 0/1)
+    next to its sorted int64 `keys` and a sidecar with the columns, their dtypes
+    and category orders. The sidecar is written last and marks a complete table.
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    keys_path, values_path, sidecar_path = (directory / name for name in TABLE_FILES)
+    sidecar_path.unlink(missing_ok=True)
+    np.save(keys_path, keys.astype(np.int64))
+    np.save(values_path, feature_matrix(df, columns))
+    sidecar = {
+        "columns": columns,
+        "dtypes": {col: str(df[col].dtype) for col in columns},
+        "categories": {
+            col: [str(value) for value in df[col].cat.categories]
+            for col in columns
+            if isinstance(df[col].dtype, pd.CategoricalDtype)
+        },
+    }
+    sidecar_path.write_text(json.dumps(sidecar, indent=2))
+
+
+class _Table:
+    """A table written by `_write_table`, memory-mapped and decoded on demand."""
+
+    def __init__(self, directory: Path):
+        keys_path, values_path, sidecar_path = (
+            directory / name for name in TABLE_FILES
+        )
+        if not sidecar_path.exists():
+            raise FileNotFoundError(f"No complete feature table in {directory}")
+        sidecar = json.loads(sidecar_path.read_text())
+        self.columns = sidecar["columns"]
+        self.dtypes = sidecar["dtypes"]
+        self.categories = sidecar["categories"]
+        self.keys = np.load(keys_path, mmap_mode="r")
+        self.values = np.load(values_path, mmap_mode="r")
+
+    def _decode(self, col: str, values: np.ndarray):
+        if col in self.categories:
+            codes = np.where(np.isnan(values), -1, values).astype(np.int64)
+            return pd.Categorical.from_codes(codes, self.categories[col])
+        if self.dtypes[col] == "bool":
+            return values != 0
+        return values
+
+    def frame(self, rows=slice(None)) -> pd.DataFrame:
+        values = np.asarray(self.values[rows])
+        return pd.DataFrame(
+            {col: self._decode(col, values[:, i]) for i, col in enumerate(self.columns)}
+        )
+
+    def row(self, position: int) -> dict:
+        values = self.values[position]
+        row = {}
+        for i, col in enumerate(self.columns):
+            value = float(values[i])
+            if col in self.categories:
+                value = None if np.isnan(value) else self.categories[col][int(value)]
+            elif self.dtypes[col] == "bool":
+                value = value != 0
+            row[col] = value
+        return row
+
+
+class FeatureStore:
+    """
+    Precomputed weather features per station and calendar features per date, shared
+    by the training join and online scoring.
+
+    `write_weather` materializes a station's processed observations, one row per
+    timestamp, and `write_calendar` one row per date. Each table is a float32
+    `.npy` matrix next to its sorted int64 keys (nanoseconds for observations,
+    days since the epoch for dates), memory-mapped on open. Single lookups are a
+    binary search over the keys, behind an in-process LRU cache of `cache_size`
+    entries per lookup kind. `weather_frame` and `calendar_frame` decode whole
+    tables for the vectorized training join, so both paths read the same rows.
+    """
+
+    def __init__(self, directory: Union[str, Path], cache_size: int = 65_536):
+        self.directory = Path(directory)
+        self._weather = {}
+        self._calendar = None
+        self.weather_at = lru_cache(maxsize=cache_size)(self._weather_at)
+        self.calendar_on = lru_cache(maxsize=cache_size)(self._calendar_on)
+
+    def weather_dir(self, station: int) -> Path:
+        return self.directory / "weather" / str(station)
+
+    @property
+    def calendar_dir(self) -> Path:
+        return self.directory / "calendar"
+
+    def weather_paths(self, station: int) -> list[Path]:
+        return [self.weather_dir(station) / name for name in TABLE_FILES]
+
+    def calendar_paths(self) -> list[Path]:
+        return [self.calendar_dir / name for name in TABLE_FILES]
+
+    def write_weather(self, station: int, weather: Union[str, Path, pd.DataFrame]):
+        """
+        Stores the weather feature columns of a processed weather table (a path or
+        frame). Observations sharing a timestamp keep the first, like the join.
+        """
+        if not isinstance(weather, pd.DataFrame):
+            weather = read_frame(weather, stage="weather")
+        columns = weather_feature_columns(weather.columns)
+        weather = (
+            apply_schema(weather, "weather")
+            .sort_values("datetime", kind="stable")
+            .drop_duplicates(subset="datetime", keep="first")
+            .reset_index(drop=True)
+        )
+        keys = weather["datetime"].to_numpy(dtype="datetime64[ns]").view(np.int64)
+        _write_table(self.weather_dir(station), keys, weather, columns)
+        self._weather.pop(station, None)
+        self.weather_at.cache_clear()
+        print(f"🗄️  Stored {len(weather):,} observations of station {station}")
+
+    def write_calendar(self, first_year: int, last_year: int):
+        """Stores the calendar features of every date from `first_year` to `last_year`."""
+        table = calendar_table(first_year, last_year).copy()
+        table["season"] = pd.Categorical(table["season"], SEASON_LABELS)
+        keys = table.index.to_numpy(dtype="datetime64[D]").view(np.int64)
+        _write_table(self.calendar_dir, keys, table, list(CALENDAR_COLUMNS))
+        self._calendar = None
+        self.calendar_on.cache_clear()
+        print(f"🗄️  Stored calendar features for {first_year}-{last_year}")
+
+    def _weather_table(self, station: int) -> _Table:
+        if station not in self._weather:
+            self._weather[station] = _Table(self.weather_dir(station))
+        return self._weather[station]
+
+    def _calendar_table(self) -> _Table:
+        if self._calendar is None:
+            self._calendar = _Table(self.calendar_dir)
+        return self._calendar
+
+    def weather_frame(self, station: int) -> pd.DataFrame:
+        """A station's stored observations as a processed weather table."""
+        table = self._weather_table(station)
+        df = table.frame()
+        df.insert(0, "datetime", pd.to_datetime(np.asarray(table.keys)))
+        return apply_schema(df, "weather")
+
+    def calendar_frame(self) -> pd.DataFrame:
+        """The stored calendar, indexed by date like `calendar_table`."""
+        table = self._calendar_table()
+        df = table.frame()
+        df.index = pd.to_datetime(np.asarray(table.keys).astype("datetime64[D]"))
+        df["season"] = df["season"].astype(str)
+        df["day_of_year"] = df["day_of_year"].astype("int64")
+        df["days_in_year"] = df["days_in_year"].astype("int64")
+        return df
+
+    def weather_position(
+        self,
+        station: int,
+        timestamp: pd.Timestamp,
+        direction: str = "nearest",
+        tolerance: pd.Timedelta = pd.Timedelta(hours=2),
+    ) -> Optional[int]:
+        """
+        Row of the observation `merge_asof` would join to `timestamp`: the latest at
+        or before it ("backward"), the earliest at or after it ("forward"), or the
+        closer of the two with ties going backward ("nearest"), within `tolerance`.
+        """
+        keys = self._weather_table(station).keys
+        t = pd.Timestamp(timestamp).value
+        limit = pd.Timedelta(tolerance).value
+        backward = forward = None
+        if direction in ("backward", "nearest"):
+            i = int(np.searchsorted(keys, t, side="right")) - 1
+            if i >= 0 and t - keys[i] <= limit:
+                backward = i
+        if direction in ("forward", "nearest"):
+            i = int(np.searchsorted(keys, t, side="left"))
+            if i < len(keys) and keys[i] - t <= limit:
+                forward = i
+        if backward is None or forward is None:
+            return backward if forward is None else forward
+        return forward if keys[forward] - t < t - keys[backward] else backward
+
+    def _weather_at(
+        self,
+        station: int,
+        timestamp: pd.Timestamp,
+        direction: str = "nearest",
+        tolerance: pd.Timedelta = pd.Timedelta(hours=2),
+    ) -> Optional[dict]:
+        """
+        The stored observation joined to `timestamp` as a dict, or None if there is
+        none within `tolerance`. As in the training join, the `history_*` columns
+        come from the latest observation at or before `timestamp`.
+        """
+        position = self.weather_position(station, timestamp, direction, tolerance)
+        if position is None:
+            return None
+        table = self._weather_table(station)
+        observation = table.row(position)
+        history = [col for col in table.columns if col.startswith("history_")]
+        if history and direction != "backward":
+            previous = self.weather_position(station, timestamp, "backward", tolerance)
+            previous_row = table.row(previous) if previous is not None else {}
+            for col in history:
+                observation[col] = previous_row.get(col, np.nan)
+        return observation
+
+    def _calendar_on(self, day: pd.Timestamp) -> Optional[dict]:
+        """Calendar features of a date, or None outside the stored years."""
+        table = self._calendar_table()
+        key = pd.Timestamp(day).to_datetime64().astype("datetime64[D]").astype(np.int64)
+        i = int(np.searchsorted(table.keys, key))
+        if i == len(table.keys) or table.keys[i] != key:
+            return None
+        return table.row(i)
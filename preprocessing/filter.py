@@ -3,12 +3,24 @@ from typing import Union
 
 import pandas as pd
 
+from preprocessing.storage import read_frame, write_frame
+
+
+def select_carriers_and_destination(
+    df: pd.DataFrame, carriers: list[str], destination: int
+) -> pd.DataFrame:
+    """Keeps rows flown by one of `carriers` into DEST_AIRPORT_ID == destination."""
+    return df[
+        (df["OP_UNIQUE_CARRIER"].isin(carriers))
+        & (df["DEST_AIRPORT_ID"] == destination)
+    ]
+
 
 def filter_selected_carriers_and_destination(
-    data_file: Union[str, Path] = "dataset/processed/jfk_combined.csv",
+    data_file: Union[str, Path] = "dataset/processed/jfk_combined.parquet",
     carriers: list[str] = ["AA", "B6", "DL"],
     destination: int = 12892,
-    output_file: Union[str, Path] = "dataset/processed/airline_filtered.csv",
+    output_file: Union[str, Path] = "dataset/processed/airline_filtered.parquet",
 ) -> pd.DataFrame:
     """
     Filters the dataset by selected airline carriers and destination airport ID,
@@ -17,30 +29,24 @@ def filter_selected_carriers_and_destination(
     Parameters:
     -----------
     data_file : str or Path
-        Path to the CSV file.
+        Path to the combined dataset (CSV, Parquet or Feather).
     carriers : list of str
         Airline carrier codes to filter by.
     destination : int
         Destination airport ID to filter by.
     output_file : str or Path
-        Path where the filtered CSV should be saved.
+        Path where the filtered dataset should be saved; the suffix selects the format.
 
     Returns:
     --------
     pd.DataFrame
         Filtered DataFrame.
     """
-    df = pd.read_csv(data_file)
-
-    filtered_df = df[
-        (df["OP_UNIQUE_CARRIER"].isin(carriers))
-        & (df["DEST_AIRPORT_ID"] == destination)
-    ]
+    df = read_frame(data_file, stage="combined")
 
-    output_path = Path(output_file)
-    output_path.parent.mkdir(parents=True, exist_ok=True)
+    filtered_df = select_carriers_and_destination(df, carriers, destination)
 
-    filtered_df.to_csv(output_file, index=False)
+    write_frame(filtered_df, output_file, stage="filtered")
 
     print(
         f"Filtered {len(filtered_df)} rows for carriers {carriers} and destination {destination}"
@@ -1,75 +1,286 @@
+import json
+from pathlib import Path
+from typing import Optional, Union
+
 import numpy as np
 import pandas as pd
 
+from preprocessing import instrument
+from preprocessing.augment import fill_weather_history
+from preprocessing.kernels import (
+    JFK_RUNWAY_HEADINGS,
+    RUNWAY_CROSSWIND_PREFIX,
+    add_runway_crosswinds,
+    crosswind_component,
+)
+from preprocessing.quality import DataProfile, profile_path
+from preprocessing.storage import (
+    FrameAppender,
+    compact_frame,
+    iter_frames,
+    memory_usage_mb,
+    print_memory_report,
+    read_frame,
+    set_flag_layout,
+)
+
+NO_CEILING = 99999
+DEFAULT_CLOUD_HEIGHT = 5000.0
+
+
+class StreamingMedian:
+    """
+    Exact median over values fed in chunks.
+
+    Only the count of each distinct value is kept, so memory grows with the number
+    of distinct values (a few hundred for the quantized METAR cloud heights and
+    wind directions) rather than with rows. `decimals` rounds values first, which
+    bounds memory for continuous data at the cost of an approximate median.
+    Accumulators from different workers can be combined with `merge`.
+    """
+
+    def __init__(self, decimals: Optional[int] = None):
+        self.decimals = decimals
+        self.counts = pd.Series(dtype="int64")
+
+    def update(self, values) -> "StreamingMedian":
+        values = pd.Series(values, dtype="float64").dropna()
+        if self.decimals is not None:
+            values = values.round(self.decimals)
+        return self._add(values.value_counts())
+
+    def merge(self, other: "StreamingMedian") -> "StreamingMedian":
+        return self._add(other.counts)
+
+    def _add(self, counts: pd.Series) -> "StreamingMedian":
+        if len(counts):
+            self.counts = self.counts.add(counts, fill_value=0).astype("int64")
+        return self
+
+    @property
+    def count(self) -> int:
+        return int(self.counts.sum())
+
+    def median(self) -> float:
+        n = self.count
+        if n == 0:
+            return float("nan")
+
+        counts = self.counts.sort_index()
+        cumulative = counts.cumsum().to_numpy()
+        values = counts.index.to_numpy()
+        lower = values[np.searchsorted(cumulative, (n - 1) // 2, side="right")]
+        upper = values[np.searchsorted(cumulative, n // 2, side="right")]
+        return float((lower + upper) / 2)
+
+
+class ImputationStats:
+    """Statistics for imputation and the missing-value report, fitted chunk by chunk."""
+
+    def __init__(self):
+        self.rows = 0
+        self.columns = None
+        self.missing = None
+        self.cloud_height = StreamingMedian()
+        self.wind_direction = StreamingMedian()
+
+    def update(self, df: pd.DataFrame) -> "ImputationStats":
+        missing = df.isnull().sum()
+        self.missing = missing if self.missing is None else self.missing + missing
+        self.columns = list(df.columns)
+        self.rows += len(df)
+
+        cloud_height = df["cloud_height"]
+        self.cloud_height.update(cloud_height[cloud_height != NO_CEILING])
+        self.wind_direction.update(df["wind_direction"])
+        return self
+
+    def values(self) -> dict[str, float]:
+        cloud_median = (
+            self.cloud_height.median()
+            if self.cloud_height.count > 0
+            else DEFAULT_CLOUD_HEIGHT
+        )
+        return {
+            "cloud_height": float(cloud_median),
+            "wind_direction": float(self.wind_direction.median()),
+        }
+
+
+def fit_imputation_values(df: pd.DataFrame) -> dict[str, float]:
+    """
+    Medians used to fill cloud_height (ignoring the 99999 sentinel) and wind_direction
+    """
+    return ImputationStats().update(df).values()
+
+
+def save_imputation_values(
+    imputation_values: dict[str, float], path: Union[str, Path]
+) -> Path:
+    """Persists fitted imputation values so inference fills gaps the same way."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(imputation_values, indent=2))
+    return path
+
+
+def load_imputation_values(path: Union[str, Path]) -> dict[str, float]:
+    return json.loads(Path(path).read_text())
+
+
+def imputation_values_path(clean_path: Union[str, Path]) -> Path:
+    """Location of the imputation values saved next to a clean dataset."""
+    clean_path = Path(clean_path)
+    return clean_path.with_name(f"{clean_path.stem}_imputation.json")
+
 
-def impute_and_clean_dataset(file_path):
+def fill_missing_weather(
+    df, imputation_values, runway_heading=40, runway_headings=JFK_RUNWAY_HEADINGS
+):
+    """
+    Fill cloud_height, wind_direction and the weather history columns and
+    recalculate the crosswind columns
+    """
+    df = fill_weather_history(df)
+    df["cloud_height"] = df["cloud_height"].fillna(imputation_values["cloud_height"])
+    df["wind_direction"] = df["wind_direction"].fillna(
+        imputation_values["wind_direction"]
+    )
+
+    df["crosswind_component"] = crosswind_component(
+        df["wind_direction"], df["wind_speed"], runway_heading
+    )
+    if any(col.startswith(RUNWAY_CROSSWIND_PREFIX) for col in df.columns):
+        df = add_runway_crosswinds(df, runway_headings)
+    return df
+
+
+def _chunk_reader(file_path, chunksize):
+    """Callable yielding the optimized dataset in chunks, or whole (read once)."""
+    if chunksize is None:
+        df = read_frame(file_path, stage="optimized")
+        return lambda: iter([df])
+    return lambda: iter_frames(file_path, stage="optimized", batch_size=chunksize)
+
+
+def impute_and_clean_dataset(
+    file_path,
+    runway_heading=40,
+    runway_headings=JFK_RUNWAY_HEADINGS,
+    one_hot="dense",
+    chunksize=None,
+    imputation_values=None,
+    baseline_profile=None,
+):
     """
     Impute critical weather columns and drop rows with remaining missing values
+
+    The statistics are fitted in one pass over the optimized dataset and applied in
+    a second; with `chunksize` both passes stream the file in chunks of that many
+    rows, so memory stays bounded regardless of its size. Missing-value counts for
+    the report are gathered along the way. The fitted values are saved next to the
+    clean dataset (`*_imputation.json`); pass `imputation_values` to reuse them
+    instead of refitting.
+
+    The clean rows are profiled as they are written (`quality.DataProfile`), so
+    the report needs no extra scan; the profile is saved as `*_profile.json` and
+    compared for drift against `baseline_profile`, a profile saved by an earlier
+    run, when given.
+
+    The clean dataset is saved with the compact dtype schema. Without `chunksize`
+    it is also returned, with sparse one-hot and weather flag columns if
+    `one_hot="sparse"`. In chunked mode the clean rows are only streamed to the
+    file and None is returned, as holding them would undo the bounded memory;
+    read the file back with `storage.iter_frames` instead. The file is the same
+    in both modes.
     """
+    file_path = Path(file_path)
+    output_path = file_path.with_name(f"{file_path.stem}_clean{file_path.suffix}")
+
     print("Loading dataset...")
-    df = pd.read_csv(file_path)
+    read_chunks = _chunk_reader(file_path, chunksize)
+    stats = ImputationStats()
+    with instrument.span("imputation_fit") as span:
+        for chunk in read_chunks():
+            stats.update(chunk)
+        span.set(rows_in=stats.rows)
+
+    print(f"Original dataset shape: {(stats.rows, len(stats.columns))}")
+    print(f"Original missing values: {stats.missing.sum()}")
+
+    if imputation_values is None:
+        imputation_values = stats.values()
+    values_path = save_imputation_values(
+        imputation_values, imputation_values_path(output_path)
+    )
+
+    cloud_missing_before = stats.missing["cloud_height"]
+    wind_missing_before = stats.missing["wind_direction"]
+    crosswind_missing_before = stats.missing["crosswind_component"]
+
+    crosswind_missing_after = 0
+    missing_before_drop = 0
+    rows_after = 0
+    memory_before = memory_after = 0.0
+    profile = DataProfile()
+    clean_df = None
+
+    with (
+        instrument.span("imputation_apply", rows_in=stats.rows) as span,
+        FrameAppender(output_path, stage="clean") as appender,
+    ):
+        for chunk in read_chunks():
+            chunk = fill_missing_weather(
+                chunk,
+                imputation_values,
+                runway_heading=runway_heading,
+                runway_headings=runway_headings,
+            )
 
-    print(f"Original dataset shape: {df.shape}")
-    print(f"Original missing values: {df.isnull().sum().sum()}")
+            # One null scan serves both the report and the row filter
+            null_mask = chunk.isna()
+            missing = null_mask.sum()
+            crosswind_missing_after += missing["crosswind_component"]
+            missing_before_drop += missing.sum()
+
+            chunk = chunk[~null_mask.to_numpy().any(axis=1)]
+            rows_after += len(chunk)
+
+            memory_before += memory_usage_mb(chunk)
+            chunk = compact_frame(chunk, "clean", report=False)
+            memory_after += memory_usage_mb(chunk)
+            profile.update(chunk)
+            appender.append(chunk)
+
+            if chunksize is None:
+                clean_df = set_flag_layout(chunk, one_hot)
+        span.set(rows_out=rows_after)
 
-    cloud_missing_before = df["cloud_height"].isnull().sum()
     if cloud_missing_before > 0:
-        actual_clouds = df[
-            (df["cloud_height"].notna()) & (df["cloud_height"] != 99999)
-        ]["cloud_height"]
-        if len(actual_clouds) > 0:
-            cloud_median = actual_clouds.median()
-        else:
-            cloud_median = 5000.0
-
-        df["cloud_height"] = df["cloud_height"].fillna(cloud_median)  # Fixed syntax
         print(
-            f"✅ Imputed {cloud_missing_before} cloud_height values with median: {cloud_median}"
+            f"✅ Imputed {cloud_missing_before} cloud_height values with median: {imputation_values['cloud_height']}"
         )
-
-    wind_missing_before = df["wind_direction"].isnull().sum()
     if wind_missing_before > 0:
-        wind_median = df["wind_direction"].median()
-        df["wind_direction"] = df["wind_direction"].fillna(wind_median)  # Fixed syntax
         print(
-            f"✅ Imputed {wind_missing_before} wind_direction values with median: {wind_median}"
+            f"✅ Imputed {wind_missing_before} wind_direction values with median: {imputation_values['wind_direction']}"
         )
 
-    def calculate_crosswind(wind_dir, wind_speed, runway_heading=40):
-        if pd.isna(wind_dir) or pd.isna(wind_speed):
-            return np.nan
-        wind_angle = abs(wind_dir - runway_heading)
-        if wind_angle > 180:
-            wind_angle = 360 - wind_angle
-        return wind_speed * np.sin(np.radians(wind_angle))
-
-    crosswind_missing_before = df["crosswind_component"].isnull().sum()
-
-    df["crosswind_component"] = df.apply(
-        lambda row: calculate_crosswind(row["wind_direction"], row["wind_speed"]),
-        axis=1,
-    )
-
-    crosswind_missing_after = df["crosswind_component"].isnull().sum()
     crosswind_imputed = crosswind_missing_before - crosswind_missing_after
     print(f"✅ Recalculated crosswind_component, imputed {crosswind_imputed} values")
 
-    rows_before = len(df)
-    missing_before_drop = df.isnull().sum().sum()
-
-    df = df.dropna()
-
-    rows_after = len(df)
+    rows_before = stats.rows
     rows_dropped = rows_before - rows_after
-    missing_after_drop = df.isnull().sum().sum()
+    n_columns = len(profile.columns)
+    missing_after_drop = profile.nulls
+    total_missing = int(missing_after_drop.sum())
 
     print("\n=== Cleanup Summary ===")
     print(f"Rows dropped: {rows_dropped:,} ({(rows_dropped / rows_before) * 100:.2f}%)")
     print(f"Missing values before drop: {missing_before_drop:,}")
-    print(f"Missing values after drop: {missing_after_drop:,}")
+    print(f"Missing values after drop: {total_missing:,}")
 
     print("\n=== Final Dataset ===")
-    print(f"Final dataset shape: {df.shape}")
+    print(f"Final dataset shape: {(rows_after, n_columns)}")
     print("Data completeness: 100%")
     print("✅ Dataset is now completely clean with no missing values!")
 
@@ -77,44 +288,48 @@ def impute_and_clean_dataset(file_path):
     print("DETAILED MISSING VALUE ANALYSIS")
     print("=" * 50)
 
-    total_cells = df.shape[0] * df.shape[1]
-    total_missing = df.isnull().sum().sum()
+    total_cells = rows_after * n_columns
     completeness_rate = ((total_cells - total_missing) / total_cells) * 100
 
-    print(f"📊 Dataset Dimensions: {df.shape[0]:,} rows × {df.shape[1]:,} columns")
+    print(f"📊 Dataset Dimensions: {rows_after:,} rows × {n_columns:,} columns")
     print(f"📊 Total Data Points: {total_cells:,}")
     print(f"📊 Missing Values: {total_missing:,}")
     print(f"📊 Data Completeness: {completeness_rate:.4f}%")
 
-    missing_by_column = df.isnull().sum()
-    missing_columns = missing_by_column[missing_by_column > 0]
+    missing_columns = missing_after_drop[missing_after_drop > 0]
 
     if len(missing_columns) > 0:
         print("\n⚠️  COLUMNS WITH MISSING VALUES:")
         print("-" * 40)
         for col, missing_count in missing_columns.items():
-            missing_pct = (missing_count / len(df)) * 100
+            missing_pct = (missing_count / rows_after) * 100
             print(f"{col:<25}: {missing_count:>6,} ({missing_pct:>6.2f}%)")
     else:
         print("\n✅ NO MISSING VALUES FOUND")
         print("   All columns are 100% complete!")
 
+    print()
+    print_memory_report("clean", memory_before, memory_after)
+
     print("\n📋 DATA TYPE SUMMARY:")
     print("-" * 30)
-    dtype_counts = df.dtypes.value_counts()
+    dtype_counts = pd.Series(profile.dtypes).value_counts()
     for dtype, count in dtype_counts.items():
         print(f"{str(dtype):<15}: {count:>3} columns")
 
-    memory_usage = df.memory_usage(deep=True).sum() / (1024**2)  # Convert to MB
-    print(f"\n💾 MEMORY USAGE: {memory_usage:.2f} MB")
+    print(f"\n💾 MEMORY USAGE: {memory_after:.2f} MB")
 
-    output_path = file_path.replace(".csv", "_clean.csv")
-    df.to_csv(output_path, index=False)
+    profile_file = profile.save(profile_path(output_path))
     print(f"\n💾 Clean dataset saved to: {output_path}")
+    print(f"💾 Imputation values saved to: {values_path}")
+    print(f"💾 Data profile saved to: {profile_file}")
+    if baseline_profile is not None:
+        print("\n📈 DRIFT FROM BASELINE:")
+        profile.drift(DataProfile.load(baseline_profile))
 
     print("\n🎯 FINAL VALIDATION:")
-    print(f"   ✅ Zero missing values: {df.isnull().sum().sum() == 0}")
-    print(f"   ✅ All rows complete: {len(df) == len(df.dropna())}")
+    print(f"   ✅ Zero missing values: {total_missing == 0}")
+    print(f"   ✅ All rows complete: {total_missing == 0}")
     print("   ✅ Ready for ML: True")
 
-    return df
+    return clean_df
@@ -0,0 +1,620 @@
+import hashlib
+import io
+import json
+import shutil
+from pathlib import Path
+from typing import Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from preprocessing.amalgamate import collect_csv_files, scan_flight_data
+from preprocessing.augment import (
+    WEATHER_HISTORY_AGGREGATIONS,
+    WEATHER_HISTORY_WINDOWS,
+    add_weather_history,
+    preprocess_iem_weather_data,
+)
+from preprocessing.delay_history import (
+    DelayHistory,
+    delay_history_path,
+    delay_rate_columns,
+)
+from preprocessing.impute import (
+    fill_missing_weather,
+    fit_imputation_values,
+    imputation_values_path,
+    save_imputation_values,
+)
+from preprocessing.kernels import JFK_RUNWAY_HEADINGS
+from preprocessing.optimize import build_flight_features, prepare_flights
+from preprocessing.partition import order_feature_columns
+from preprocessing.quality import DataProfile, profile_path
+from preprocessing.storage import (
+    DEFAULT_FORMAT,
+    align_columns,
+    apply_schema,
+    compact_frame,
+    concat_aligned,
+    dataset_columns,
+    part_files,
+    part_path,
+    read_frame,
+    remove_dataset,
+    stage_path,
+    write_frame,
+)
+
+# Row position of a flight in the append-only pruned dataset; used as a stable key
+# to replace recomputed rows in the optimized and clean datasets.
+FLIGHT_ID = "flight_id"
+TAIL_BYTES = 4096
+# How far back the trailing weather history windows look.
+HISTORY_SPAN = max(pd.Timedelta(window) for window in WEATHER_HISTORY_WINDOWS)
+
+
+def load_state(state_path: Union[str, Path]) -> dict:
+    state_path = Path(state_path)
+    if not state_path.exists():
+        return {}
+    return json.loads(state_path.read_text())
+
+
+def save_state(state: dict, state_path: Union[str, Path]):
+    state_path = Path(state_path)
+    state_path.parent.mkdir(parents=True, exist_ok=True)
+    state_path.write_text(json.dumps(state, indent=2, default=str))
+
+
+def dataset_signatures(paths: list[Path]) -> dict:
+    """
+    Size and modification time of the part files of each dataset, recorded with
+    the state so a dataset rewritten outside incremental mode (e.g. by a full
+    pipeline run) is noticed before its stored flight keys are attached to other
+    rows.
+    """
+    signatures = {}
+    for path in map(Path, paths):
+        files = part_files(path) if path.exists() else []
+        signatures[str(path)] = {
+            str(file): {
+                "size": file.stat().st_size,
+                "mtime_ns": file.stat().st_mtime_ns,
+            }
+            for file in files
+        }
+    return signatures
+
+
+def _tail_hash(f, offset: int) -> str:
+    start = max(0, offset - TAIL_BYTES)
+    f.seek(start)
+    return hashlib.sha256(f.read(offset - start)).hexdigest()
+
+
+def read_new_weather_rows(
+    weather_file: Union[str, Path], weather_state: dict
+) -> tuple[pd.DataFrame, dict]:
+    """
+    Reads only the IEM rows appended to `weather_file` since the last run.
+
+    The byte offset reached last time is stored together with a hash of the bytes
+    just before it. If the file was rewritten rather than appended to, it is
+    rescanned and rows up to the stored watermark timestamp are skipped.
+    """
+    weather_file = Path(weather_file)
+    size = weather_file.stat().st_size
+    offset = weather_state.get("offset", 0)
+    watermark = weather_state.get("watermark")
+
+    with open(weather_file, "rb") as f:
+        header = f.readline()
+        rescan = offset < len(header) or offset > size
+        if not rescan and _tail_hash(f, offset) != weather_state.get("tail_sha256"):
+            print("⚠️  Weather file changed before the last processed row, rescanning")
+            rescan = True
+        if rescan:
+            offset = len(header)
+
+        f.seek(offset)
+        data = f.read()
+        # Leave a trailing partial line for the next run
+        data = data[: data.rfind(b"\n") + 1]
+        end = offset + len(data)
+        new_state = {"offset": end, "tail_sha256": _tail_hash(f, end)}
+
+    df = pd.read_csv(io.BytesIO(header + data)) if data.strip() else pd.DataFrame()
+    if rescan and watermark and not df.empty:
+        df = df[pd.to_datetime(df["valid"]) > pd.Timestamp(watermark)]
+
+    if not df.empty:
+        new_watermark = pd.to_datetime(df["valid"]).max()
+        if watermark is not None:
+            new_watermark = max(new_watermark, pd.Timestamp(watermark))
+        watermark = new_watermark
+    new_state["watermark"] = None if watermark is None else str(watermark)
+
+    return df, new_state
+
+
+def flight_datetimes(df: pd.DataFrame) -> pd.Series:
+    """Scheduled departure timestamps of pruned flights."""
+    dates = pd.to_datetime(
+        pd.DataFrame(
+            {"year": df["year"], "month": df["month"], "day": df["day_of_month"]}
+        )
+    )
+    hhmm = df["scheduled_departure_time"].astype(int)
+    minutes = (hhmm // 100) * 60 + hhmm % 100
+    return dates + pd.to_timedelta(minutes, unit="minutes")
+
+
+def _order_weather_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """Keeps the `weather_*` block sorted, as extract_weather_type_from_metar emits it."""
+    flags = sorted(col for col in df.columns if col.startswith("weather_"))
+    if not flags:
+        return df
+    first = next(i for i, col in enumerate(df.columns) if col.startswith("weather_"))
+    others = [col for col in df.columns if not col.startswith("weather_")]
+    return df[others[:first] + flags + others[first:]]
+
+
+def _time_range(times: pd.Series) -> dict:
+    return {"rows": len(times), "first": str(times.min()), "last": str(times.max())}
+
+
+def _append_weather(
+    weather_path: Path, parts: list[dict], delta: pd.DataFrame
+) -> list[dict]:
+    """
+    Adds processed observations (without history columns) to the partitioned
+    weather dataset and returns its updated part list.
+
+    The observations of the parts reaching the new ones, from the first new
+    timestamp on, are merged with them into a new last part and their history
+    columns are recomputed; the earlier observations of the first such part are
+    written back as a part of their own. Older parts are only read as far back as
+    those trailing windows look: past the longest window, and until every delta
+    column has a value at or before the window start.
+    """
+    start = delta["datetime"].min()
+    first = next(
+        (i for i, part in enumerate(parts) if pd.Timestamp(part["last"]) >= start),
+        len(parts),
+    )
+    rewritten = [
+        read_frame(part_path(weather_path, i), stage="weather")
+        for i in range(first, len(parts))
+    ]
+    kept = None
+    if rewritten:
+        before_start = rewritten[0]["datetime"] < start
+        kept, rewritten[0] = rewritten[0][before_start], rewritten[0][~before_start]
+
+    def earlier():
+        if kept is not None and len(kept):
+            yield kept
+        for i in reversed(range(first)):
+            yield read_frame(part_path(weather_path, i), stage="weather")
+
+    horizon = start - HISTORY_SPAN
+    references = {
+        col
+        for col, aggregation in WEATHER_HISTORY_AGGREGATIONS.items()
+        if aggregation == "delta" and col in delta.columns
+    }
+    lookback = []
+    for df in earlier():
+        lookback.insert(0, df)
+        before = df[df["datetime"] <= horizon]
+        references -= {col for col in references if before[col].notna().any()}
+        if len(before) and not references:
+            break
+
+    df = concat_aligned([*lookback, *rewritten, delta], "weather")
+    # The new last part carries every flag column of the dataset
+    existing = dataset_columns(weather_path) if parts else []
+    df = align_columns(df, [*df.columns, *(c for c in existing if c not in df)])
+    df = _order_weather_columns(df)
+    df = df.sort_values("datetime", kind="stable").reset_index(drop=True)
+    df = add_weather_history(df)
+    df = df.iloc[sum(len(frame) for frame in lookback) :].reset_index(drop=True)
+
+    for i in range(first, len(parts)):
+        part_path(weather_path, i).unlink()
+    parts = parts[:first]
+    for frame in (kept, df):
+        if frame is not None and len(frame):
+            write_frame(frame, part_path(weather_path, len(parts)), stage="weather")
+            parts.append(_time_range(frame["datetime"]))
+    return parts
+
+
+def _read_weather(
+    weather_path: Path, parts: list[dict], start: pd.Timestamp, end: pd.Timestamp
+) -> pd.DataFrame:
+    """Observations between `start` and `end`, read from the parts overlapping them."""
+    frames = [
+        read_frame(part_path(weather_path, i), stage="weather")
+        for i, part in enumerate(parts)
+        if pd.Timestamp(part["last"]) >= start and pd.Timestamp(part["first"]) <= end
+    ]
+    df = concat_aligned(frames, "weather")
+    return df[df["datetime"].between(start, end)]
+
+
+def _read_flights(pruned_path: Path, parts: list[dict], indices) -> pd.DataFrame:
+    """Pruned parts with the FLIGHT_ID of every row."""
+    offsets = np.cumsum([0] + [part["rows"] for part in parts])
+    frames = []
+    for i in indices:
+        df = read_frame(part_path(pruned_path, i), stage="pruned")
+        df[FLIGHT_ID] = np.arange(offsets[i], offsets[i] + len(df))
+        frames.append(df)
+    return apply_schema(pd.concat(frames, ignore_index=True), "pruned")
+
+
+def _rewrite_tail(
+    path: Path,
+    keys_path: Path,
+    parts: list[dict],
+    delta: pd.DataFrame,
+    replaced_ids,
+    first_key: tuple,
+    stage: str,
+) -> tuple[list[dict], dict[int, pd.DataFrame], pd.DataFrame]:
+    """
+    Puts `delta` in place of the rows of `replaced_ids` in a dataset partitioned
+    in (flight_datetime, FLIGHT_ID) order, whose keys are kept in `keys_path`.
+
+    Only the parts from the first one reaching `first_key`, the smallest key of
+    the replaced and added rows, are read. Their rows from `first_key` on are
+    merged with `delta` into a new last part; the rows before it are written back
+    as a part of their own. Returns the updated part list, the written parts by
+    index and the new last part.
+    """
+    first = next(
+        (
+            i
+            for i, part in enumerate(parts)
+            if (pd.Timestamp(part["last"][0]), part["last"][1]) >= first_key
+        ),
+        len(parts),
+    )
+    kept = None
+    frames = []
+    for i in range(first, len(parts)):
+        df = read_frame(part_path(path, i), stage=stage)
+        keys = read_frame(part_path(keys_path, i))
+        df[FLIGHT_ID] = keys[FLIGHT_ID].to_numpy()
+        df["flight_datetime"] = pd.to_datetime(keys["flight_datetime"]).to_numpy()
+        if i == first:
+            start, first_id = first_key
+            before = (df["flight_datetime"] < start) | (
+                (df["flight_datetime"] == start) & (df[FLIGHT_ID] < first_id)
+            )
+            kept, df = df[before], df[~before]
+        frames.append(df[~df[FLIGHT_ID].isin(replaced_ids)])
+
+    df = concat_aligned([*frames, delta], stage)
+    df = df.sort_values(["flight_datetime", FLIGHT_ID], kind="stable")
+    df = df.reset_index(drop=True)
+    # The new last part carries every one-hot and flag column of the dataset
+    existing = dataset_columns(path) if parts else []
+    df = align_columns(df, [*df.columns, *(c for c in existing if c not in df)])
+    df = order_feature_columns(df)
+
+    for i in range(first, len(parts)):
+        part_path(path, i).unlink()
+        part_path(keys_path, i).unlink()
+    parts = parts[:first]
+    written = {}
+    for frame in (kept, df):
+        if frame is None or frame.empty:
+            continue
+        index = len(parts)
+        last = frame.iloc[-1]
+        parts.append(
+            {
+                "rows": len(frame),
+                "last": [str(last["flight_datetime"]), int(last[FLIGHT_ID])],
+            }
+        )
+        write_frame(frame[[FLIGHT_ID, "flight_datetime"]], part_path(keys_path, index))
+        frame = frame.drop(columns=[FLIGHT_ID, "flight_datetime"])
+        write_frame(frame, part_path(path, index), stage)
+        written[index] = frame
+    return parts, written, df.drop(columns=[FLIGHT_ID, "flight_datetime"])
+
+
+def _update_profile(
+    clean_path: Path,
+    profiles_dir: Path,
+    parts: list[dict],
+    written: dict[int, pd.DataFrame],
+):
+    """
+    Profiles the rewritten parts of the clean dataset and saves the profile of
+    the whole dataset, merged from the per-part profiles kept in `profiles_dir`.
+    """
+    first = len(parts) - len(written)
+    for path in profiles_dir.glob("part-*.json"):
+        if int(path.stem.split("-")[1]) >= first:
+            path.unlink()
+    for index, frame in written.items():
+        DataProfile().update(frame).save(profiles_dir / f"part-{index:05d}.json")
+
+    profile = DataProfile()
+    for path in sorted(profiles_dir.glob("part-*.json")):
+        profile.merge(DataProfile.load(path))
+    profile.save(profile_path(clean_path))
+
+
+def incremental_update(
+    raw_data_path: Union[str, Path] = "dataset/raw",
+    weather_file: Union[str, Path] = "dataset/raw/weather_2014_2024.csv",
+    processed_dir: Union[str, Path] = "dataset/processed",
+    fmt: str = DEFAULT_FORMAT,
+    origin_id: int = 12478,
+    carriers: list[str] = ["AA", "B6", "DL"],
+    destination: int = 12892,
+    runway_heading: float = 40,
+    runway_headings: tuple = JFK_RUNWAY_HEADINGS,
+    tolerance: pd.Timedelta = pd.Timedelta(hours=2),
+    direction: str = "nearest",
+    workers: Optional[int] = None,
+) -> Optional[pd.DataFrame]:
+    """
+    Brings the pruned, weather, optimized and clean datasets up to date with the
+    BTS files and IEM rows added since the last run.
+
+    The datasets are directories of part files (`<name>.<fmt>/part-*`), which
+    `storage.read_frame` and `iter_frames` read as one dataset. New flights are
+    appended as a new pruned part and new observations as a new weather part.
+    Only new flights, plus existing flights whose ±`tolerance` window overlaps the
+    new observations (or the history windows they change) or whose delay rates
+    cover the new flights' days, go through feature engineering, the weather join
+    and imputation. The optimized and clean parts from the earliest recomputed
+    flight onwards are rewritten with them; earlier parts are never read. The
+    delay history is loaded and extended with the new flights' outcomes, and the
+    clean profile is merged from per-part profiles.
+
+    The imputation values are fitted on the first build and then kept, so rows
+    imputed in different runs share them and the datasets match a full build that
+    is given the same values; rebuild from scratch to refit them. Without a stored
+    state or delay history, if the route parameters changed, or if a dataset was
+    rewritten since the last incremental run, everything is built from scratch
+    through the same path.
+
+    Returns the rewritten part of the clean dataset, or None if there was nothing
+    new.
+    """
+    processed_dir = Path(processed_dir)
+    state_dir = processed_dir / ".incremental"
+    state_path = state_dir / "state.json"
+    pruned_path = stage_path(processed_dir, "airline_filtered_pruned", fmt)
+    weather_path = stage_path(processed_dir, "jfk_weather_processed", fmt)
+    optimized_path = stage_path(processed_dir, "jfk_optimized", fmt)
+    clean_path = stage_path(processed_dir, "jfk_optimized_clean", fmt)
+    history_path = delay_history_path(optimized_path)
+
+    params = {
+        "format": fmt,
+        "origin": origin_id,
+        "carriers": sorted(carriers),
+        "destination": destination,
+        "runway_heading": runway_heading,
+        "runway_headings": list(runway_headings),
+        "tolerance": str(tolerance),
+        "direction": direction,
+        "delay_rates": delay_rate_columns(),
+    }
+    datasets = [pruned_path, weather_path, optimized_path, clean_path]
+    state = load_state(state_path)
+    if state and state.get("params") != params:
+        print("⚠️  Pipeline parameters changed since the last run, rebuilding")
+        state = {}
+    if state and state.get("datasets") != dataset_signatures(datasets):
+        print("⚠️  Datasets were rewritten outside incremental mode, rebuilding")
+        state = {}
+    if state and not history_path.exists():
+        print(f"⚠️  {history_path} is missing, rebuilding")
+        state = {}
+    if not state:
+        print("No incremental state found, building every dataset from scratch")
+        for path in datasets:
+            remove_dataset(path)
+        shutil.rmtree(state_dir, ignore_errors=True)
+    parts = state.get(
+        "parts", {"pruned": [], "weather": [], "optimized": [], "clean": []}
+    )
+
+    # New BTS files go through the fused filter/prune scan into a new pruned part
+    weather_file = Path(weather_file)
+    raw_files = collect_csv_files(
+        raw_data_path, exclude=["jfk_weather_2014_24.csv", weather_file.name]
+    )
+    seen_files = state.get("flight_files", {})
+    new_files = [path for path in raw_files if str(path) not in seen_files]
+    changed_files = [
+        path
+        for path in raw_files
+        if str(path) in seen_files
+        and seen_files[str(path)]["size"] != path.stat().st_size
+    ]
+    for path in changed_files:
+        print(f"⚠️  {path} changed after it was ingested; rebuild to pick it up")
+    print(f"Found {len(new_files)} new flight files")
+
+    old_flight_parts = len(parts["pruned"])
+    new_flights = None
+    if new_files:
+        delta_path = part_path(pruned_path, old_flight_parts)
+        scan_flight_data(
+            raw_data_path,
+            delta_path,
+            origin_id=origin_id,
+            carriers=carriers,
+            destination=destination,
+            workers=workers,
+            csv_files=new_files,
+        )
+        pruned_delta = (
+            read_frame(delta_path, stage="pruned") if delta_path.exists() else None
+        )
+        if pruned_delta is None or pruned_delta.empty:
+            delta_path.unlink(missing_ok=True)
+        else:
+            parts["pruned"].append(_time_range(flight_datetimes(pruned_delta)))
+            new_flights = _read_flights(
+                pruned_path, parts["pruned"], [old_flight_parts]
+            )
+
+    if not parts["pruned"]:
+        print("No flight data found")
+        return None
+
+    # Only the new flights' outcomes are added to the stored delay history
+    delay_history = DelayHistory.load(history_path) if state else DelayHistory()
+    if new_flights is not None:
+        delay_history.update(prepare_flights(new_flights))
+
+    # Only IEM rows appended since the last run are parsed, into a new weather part
+    raw_weather, weather_state = read_new_weather_rows(
+        weather_file, state.get("weather", {})
+    )
+    new_observations = None
+    if not raw_weather.empty:
+        weather_delta = preprocess_iem_weather_data(
+            raw_weather,
+            runway_heading=runway_heading,
+            runway_headings=runway_headings,
+            history_windows=(),
+            workers=workers,
+        )
+        if len(weather_delta):
+            new_observations = (
+                weather_delta["datetime"].min(),
+                weather_delta["datetime"].max(),
+            )
+            parts["weather"] = _append_weather(
+                weather_path, parts["weather"], weather_delta
+            )
+    print(f"New weather observations: {len(raw_weather):,}")
+
+    # Delay rates look at earlier days only, so new flights change the rates of
+    # flights on later days; none exist when a later month is appended. New
+    # observations change the joins within `tolerance` of them and the history
+    # windows that reach them.
+    windows = []
+    if new_flights is not None:
+        first_day = flight_datetimes(new_flights).min().normalize()
+        windows.append((first_day + pd.Timedelta(days=1), pd.Timestamp.max))
+    if new_observations is not None:
+        first_obs, last_obs = new_observations
+        windows.append((first_obs - tolerance, last_obs + HISTORY_SPAN + tolerance))
+
+    state.update(
+        {
+            "params": params,
+            "flight_files": {
+                **seen_files,
+                **{str(path): {"size": path.stat().st_size} for path in new_files},
+            },
+            "weather": weather_state,
+            "parts": parts,
+        }
+    )
+
+    affected = [] if new_flights is None else [new_flights]
+    if "imputation" not in state:
+        # Nothing was built yet, e.g. the flights arrived before any observation
+        affected = [
+            _read_flights(pruned_path, parts["pruned"], range(len(parts["pruned"])))
+        ]
+    elif windows:
+        lower = min(start for start, _ in windows)
+        old = [
+            i
+            for i, part in enumerate(parts["pruned"][:old_flight_parts])
+            if pd.Timestamp(part["last"]) >= lower
+        ]
+        if old:
+            flights = _read_flights(pruned_path, parts["pruned"], old)
+            times = flight_datetimes(flights)
+            in_window = pd.Series(False, index=flights.index)
+            for start, end in windows:
+                in_window |= times.between(start, end)
+            affected.insert(0, flights[in_window])
+
+    if not affected or not parts["weather"]:
+        delay_history.save(history_path)
+        state["datasets"] = dataset_signatures(datasets)
+        save_state(state, state_path)
+        print("✅ Datasets already up to date")
+        return None
+
+    subset = apply_schema(pd.concat(affected, ignore_index=True), "pruned")
+    affected_ids = subset[FLIGHT_ID].to_numpy()
+    times = flight_datetimes(subset)
+    first_key = min(zip(times, affected_ids))
+    print(f"Recomputing features for {len(subset):,} flights")
+
+    weather_window = _read_weather(
+        weather_path,
+        parts["weather"],
+        times.min() - tolerance,
+        times.max() + tolerance,
+    )
+    optimized_delta = build_flight_features(
+        subset,
+        weather_window,
+        tolerance=tolerance,
+        direction=direction,
+        keep_columns=[FLIGHT_ID, "flight_datetime"],
+        delay_history=delay_history,
+    )
+    optimized_delta = compact_frame(optimized_delta, "optimized", report=False)
+    delay_history.save(history_path)
+
+    parts["optimized"], _, _ = _rewrite_tail(
+        optimized_path,
+        stage_path(state_dir, "jfk_optimized_keys", fmt),
+        parts["optimized"],
+        optimized_delta,
+        affected_ids,
+        first_key,
+        "optimized",
+    )
+    print(f"✅ Optimized dataset updated: {len(optimized_delta):,} rows recomputed")
+
+    imputation_values = state.get("imputation")
+    if imputation_values is None:
+        # The first build holds every flight
+        imputation_values = fit_imputation_values(optimized_delta)
+        state["imputation"] = imputation_values
+    save_imputation_values(imputation_values, imputation_values_path(clean_path))
+    clean_delta = fill_missing_weather(
+        optimized_delta.copy(),
+        imputation_values,
+        runway_heading=runway_heading,
+        runway_headings=runway_headings,
+    ).dropna()
+    clean_delta = compact_frame(clean_delta, "clean", report=False)
+
+    parts["clean"], written, clean = _rewrite_tail(
+        clean_path,
+        stage_path(state_dir, "jfk_optimized_clean_keys", fmt),
+        parts["clean"],
+        clean_delta,
+        affected_ids,
+        first_key,
+        "clean",
+    )
+    _update_profile(clean_path, state_dir / "clean_profiles", parts["clean"], written)
+    rows = sum(part["rows"] for part in parts["clean"])
+    print(f"✅ Clean dataset updated: {rows:,} rows -> {clean_path}")
+
+    state["datasets"] = dataset_signatures(datasets)
+    save_state(state, state_path)
+    return clean
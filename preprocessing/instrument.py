@@ -0,0 +1,292 @@
+import atexit
+import contextlib
+import functools
+import io
+import json
+import os
+import threading
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Optional, Union
+
+import pandas as pd
+import psutil
+
+_process = psutil.Process()
+
+
+def process_rss_mb() -> float:
+    """Resident memory of this process and its children (e.g. process pools)."""
+    rss = _process.memory_info().rss
+    for child in _process.children(recursive=True):
+        try:
+            rss += child.memory_info().rss
+        except psutil.Error:
+            pass
+    return rss / 1024**2
+
+
+def _io_chars() -> tuple[int, int]:
+    """Bytes this process read and wrote through system calls so far."""
+    try:
+        counters = _process.io_counters()
+    except (AttributeError, psutil.Error):
+        return 0, 0
+    return (
+        getattr(counters, "read_chars", counters.read_bytes),
+        getattr(counters, "write_chars", counters.write_bytes),
+    )
+
+
+class Span:
+    """One timed region; `set` attaches attributes such as `rows_in`/`rows_out`."""
+
+    def __init__(self, name: str, category: str, parent: Optional[str], attrs: dict):
+        self.name = name
+        self.category = category
+        self.parent = parent
+        self.attrs = attrs
+        self.peak_rss_mb = 0.0
+        self.python_peak = 0
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+
+class _NullSpan:
+    def set(self, **attrs):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Tracer:
+    """
+    Records nested spans with wall and CPU time, start/end and peak RSS, bytes
+    read and written, and optionally tracemalloc deltas of Python allocations.
+
+    Every finished span is appended to `path` as one JSON line; `chrome_trace_path`
+    additionally gets a Chrome trace (chrome://tracing or Perfetto) on `close`.
+    Peak RSS comes from a background thread sampling every `sample_interval`
+    seconds; CPU time is that of this process. With `quiet`, stdout is discarded
+    until `close`, so stage output is replaced by the trace. Spans are meant for
+    the main thread; work in process pool workers is counted in the RSS of the
+    span that started it.
+    """
+
+    def __init__(
+        self,
+        path: Optional[Union[str, Path]] = None,
+        chrome_trace_path: Optional[Union[str, Path]] = None,
+        quiet: bool = False,
+        trace_memory: bool = False,
+        sample_interval: float = 0.01,
+    ):
+        self.path = Path(path) if path is not None else None
+        self.chrome_trace_path = (
+            Path(chrome_trace_path) if chrome_trace_path is not None else None
+        )
+        self.quiet = quiet
+        self.trace_memory = trace_memory
+        self.sample_interval = sample_interval
+        self.records = []
+        self._stack = []
+        self._events = []
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._file = None
+        self._quiet_output = contextlib.ExitStack()
+
+        if quiet:
+            self._quiet_output.enter_context(contextlib.redirect_stdout(io.StringIO()))
+        if self.path is not None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = open(self.path, "a")
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self._sampler = threading.Thread(target=self._sample, daemon=True)
+        self._sampler.start()
+
+    def _sample(self):
+        while not self._stop.wait(self.sample_interval):
+            rss = process_rss_mb()
+            with self._lock:
+                for span in self._stack:
+                    span.peak_rss_mb = max(span.peak_rss_mb, rss)
+
+    def _fold_python_peak(self):
+        # tracemalloc keeps a single peak; fold it into every open span before
+        # resetting it, so nested spans each see their own peak
+        if not self.trace_memory:
+            return
+        peak = tracemalloc.get_traced_memory()[1]
+        for span in self._stack:
+            span.python_peak = max(span.python_peak, peak)
+        tracemalloc.reset_peak()
+
+    @contextlib.contextmanager
+    def span(self, name: str, category: str = "step", **attrs):
+        parent = self._stack[-1].name if self._stack else None
+        current = Span(name, category, parent, attrs)
+        rss_start = process_rss_mb()
+        current.peak_rss_mb = rss_start
+        read_start, written_start = _io_chars()
+        python_start = 0
+        if self.trace_memory:
+            self._fold_python_peak()
+            python_start = tracemalloc.get_traced_memory()[0]
+            current.python_peak = python_start
+        with self._lock:
+            self._stack.append(current)
+        cpu_start = time.process_time()
+        start = time.perf_counter()
+        try:
+            yield current
+        finally:
+            wall = time.perf_counter() - start
+            cpu = time.process_time() - cpu_start
+            rss_end = process_rss_mb()
+            read_end, written_end = _io_chars()
+            if self.trace_memory:
+                self._fold_python_peak()
+            with self._lock:
+                self._stack.pop()
+
+            record = {
+                "name": name,
+                "category": category,
+                "parent": parent,
+                "depth": len(self._stack),
+                "start": round(start - self._origin, 6),
+                "wall_seconds": round(wall, 6),
+                "cpu_seconds": round(cpu, 6),
+                "rss_start_mb": round(rss_start, 1),
+                "rss_end_mb": round(rss_end, 1),
+                "peak_rss_mb": round(max(current.peak_rss_mb, rss_end), 1),
+                "bytes_read": read_end - read_start,
+                "bytes_written": written_end - written_start,
+            }
+            if self.trace_memory:
+                current_python = tracemalloc.get_traced_memory()[0]
+                record["python_delta_mb"] = round(
+                    (current_python - python_start) / 1024**2, 3
+                )
+                record["python_peak_mb"] = round(
+                    (current.python_peak - python_start) / 1024**2, 3
+                )
+            record.update(current.attrs)
+            self._emit(record)
+
+    def _emit(self, record: dict):
+        self.records.append(record)
+        if self._file is not None:
+            self._file.write(json.dumps(record, default=str) + "\n")
+            self._file.flush()
+        self._events.append(
+            {
+                "name": record["name"],
+                "cat": record["category"],
+                "ph": "X",
+                "ts": round(record["start"] * 1e6),
+                "dur": round(record["wall_seconds"] * 1e6),
+                "pid": os.getpid(),
+                "tid": threading.get_ident(),
+                "args": {
+                    key: value
+                    for key, value in record.items()
+                    if key not in ("name", "category", "start", "wall_seconds")
+                },
+            }
+        )
+
+    def summary(self, category: str = "stage") -> str:
+        """One line per finished span of `category`, in the order they finished."""
+        lines = []
+        for record in self.records:
+            if record["category"] != category:
+                continue
+            rows = ""
+            if record.get("rows_out") is not None:
+                rows = f", {record['rows_out']:,} rows"
+            cached = " (cached)" if record.get("cached") else ""
+            lines.append(
+                f"{record['name']:<12} {record['wall_seconds']:8.2f}s wall "
+                f"{record['cpu_seconds']:8.2f}s cpu "
+                f"{record['peak_rss_mb']:8.0f} MB peak{rows}{cached}"
+            )
+        return "\n".join(lines)
+
+    def close(self):
+        self._quiet_output.close()
+        self._stop.set()
+        self._sampler.join()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self.chrome_trace_path is not None:
+            self.chrome_trace_path.parent.mkdir(parents=True, exist_ok=True)
+            self.chrome_trace_path.write_text(
+                json.dumps({"traceEvents": self._events}, default=str)
+            )
+        if self.trace_memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+
+_active: Optional[Tracer] = None
+
+
+def configure(**kwargs) -> Tracer:
+    """Starts the tracer that `span` records into (see `Tracer` for arguments)."""
+    global _active
+    if _active is not None:
+        _active.close()
+    _active = Tracer(**kwargs)
+    atexit.unregister(shutdown)
+    atexit.register(shutdown)
+    return _active
+
+
+def shutdown():
+    global _active
+    if _active is not None:
+        _active.close()
+        _active = None
+
+
+def span(name: str, category: str = "step", **attrs):
+    """
+    Context manager timing a region into the configured tracer; a no-op yielding a
+    span that ignores `set` when tracing is not configured.
+    """
+    if _active is None:
+        return contextlib.nullcontext(_NULL_SPAN)
+    return _active.span(name, category, **attrs)
+
+
+def traced(name: Optional[str] = None, category: str = "step"):
+    """
+    Decorator running the function inside `span(name)`, with `rows_in` taken from
+    its first DataFrame argument and `rows_out` from a DataFrame result.
+    """
+
+    def decorate(func):
+        span_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _active is None:
+                return func(*args, **kwargs)
+            frames = [arg for arg in args if isinstance(arg, pd.DataFrame)]
+            attrs = {"rows_in": len(frames[0])} if frames else {}
+            with _active.span(span_name, category, **attrs) as current:
+                result = func(*args, **kwargs)
+                if isinstance(result, pd.DataFrame):
+                    current.set(rows_out=len(result))
+                return result
+
+        return wrapper
+
+    return decorate
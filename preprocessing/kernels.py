@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+
+# JFK runways 04L/R-22L/R and 13L/R-31L/R. Opposite ends of a runway share the same
+# crosswind magnitude, so one heading per runway pair is enough.
+JFK_RUNWAY_HEADINGS = (40, 130)
+
+RUNWAY_CROSSWIND_PREFIX = "crosswind_runway_"
+
+CLOUD_COVERAGE_SCORES = {"CLR": 0, "SKC": 0, "FEW": 2, "SCT": 4, "BKN": 6, "OVC": 8}
+CEILING_COVERAGES = ["BKN", "OVC"]
+NO_CEILING = 99999
+
+
+def crosswind_component(wind_direction, wind_speed, runway_heading=40) -> np.ndarray:
+    """
+    Crosswind (knots) on a runway for wind from `wind_direction` at `wind_speed`.
+
+    Works on scalars or arrays; missing direction or speed gives NaN.
+    """
+    wind_direction = np.asarray(wind_direction, dtype=float)
+    wind_speed = np.asarray(wind_speed, dtype=float)
+
+    wind_angle = np.abs(wind_direction - runway_heading)
+    wind_angle = np.where(wind_angle > 180, 360 - wind_angle, wind_angle)
+    return wind_speed * np.sin(np.radians(wind_angle))
+
+
+def runway_crosswinds(wind_direction, wind_speed, runway_headings) -> np.ndarray:
+    """Crosswind for every runway heading at once, shaped (observations, runways)."""
+    wind_direction = np.asarray(wind_direction, dtype=float)[..., np.newaxis]
+    wind_speed = np.asarray(wind_speed, dtype=float)[..., np.newaxis]
+    headings = np.asarray(runway_headings, dtype=float)
+    return crosswind_component(wind_direction, wind_speed, headings)
+
+
+def runway_crosswind_column(runway_heading) -> str:
+    """Column name for a runway heading, using its designator (40 -> "..._04")."""
+    designator = int(round(runway_heading / 10)) % 36 or 36
+    return f"{RUNWAY_CROSSWIND_PREFIX}{designator:02d}"
+
+
+def add_runway_crosswinds(
+    df: pd.DataFrame, runway_headings=JFK_RUNWAY_HEADINGS
+) -> pd.DataFrame:
+    """Adds one crosswind column per runway plus `min_crosswind_component`."""
+    if len(runway_headings) == 0:
+        return df
+
+    crosswinds = runway_crosswinds(
+        df["wind_direction"], df["wind_speed"], runway_headings
+    )
+    for i, heading in enumerate(runway_headings):
+        df[runway_crosswind_column(heading)] = crosswinds[:, i]
+    df["min_crosswind_component"] = crosswinds.min(axis=1)
+    return df
+
+
+def cloud_coverage_score(cloud_cover) -> np.ndarray:
+    """Octas of sky cover for the lowest layer code (CLR/FEW/SCT/BKN/OVC), 0 if unknown."""
+    scores = pd.Series(cloud_cover, dtype=object).map(CLOUD_COVERAGE_SCORES)
+    return scores.fillna(0).astype("int64").to_numpy()
+
+
+def ceiling_height(cloud_cover, cloud_height) -> np.ndarray:
+    """Height of a broken/overcast lowest layer, or 99999 when there is no ceiling."""
+    cloud_cover = pd.Series(cloud_cover, dtype=object)
+    cloud_height = np.asarray(cloud_height, dtype=float)
+    has_ceiling = cloud_cover.isin(CEILING_COVERAGES).to_numpy() & ~np.isnan(
+        cloud_height
+    )
+    return np.where(has_ceiling, cloud_height, NO_CEILING)
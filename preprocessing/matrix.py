@@ -0,0 +1,115 @@
+import json
+from pathlib import Path
+from typing import Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from preprocessing.online import LABEL_COLUMN, feature_columns, feature_matrix
+from preprocessing.storage import count_rows, iter_frames
+
+POSITIVE_LABEL = "delayed"
+MATRIX_FILES = ("X.npy", "y.npy", "features.json")
+
+
+def matrix_dir(clean_path: Union[str, Path]) -> Path:
+    """`<stem>_matrix/` next to a clean dataset."""
+    clean_path = Path(clean_path)
+    return clean_path.with_name(f"{clean_path.stem}_matrix")
+
+
+def matrix_paths(directory: Union[str, Path]) -> list[Path]:
+    return [Path(directory) / name for name in MATRIX_FILES]
+
+
+def _describe(sample: pd.DataFrame, columns: list[str]) -> dict:
+    dtypes = {}
+    categories = {}
+    for col in columns:
+        dtype = sample[col].dtype
+        if isinstance(dtype, pd.SparseDtype):
+            dtype = dtype.subtype
+        if isinstance(dtype, pd.CategoricalDtype):
+            categories[col] = [str(value) for value in dtype.categories]
+            dtype = "category"
+        dtypes[col] = str(dtype)
+    return {"dtypes": dtypes, "categories": categories}
+
+
+def export_feature_matrix(
+    clean_path: Union[str, Path],
+    output_dir: Optional[Union[str, Path]] = None,
+    batch_size: int = 250_000,
+) -> Path:
+    """
+    Writes a clean dataset as a contiguous float32 feature matrix `X.npy`, an
+    int8 label vector `y.npy` (1 = delayed) and a `features.json` sidecar with the
+    column names, source dtypes and category orders behind the encoded codes.
+
+    The matrix is encoded the way `feature_matrix` does for training and serving
+    and filled chunk by chunk into a preallocated `.npy` memmap, so the clean
+    dataset is never held in memory at once. The sidecar is written last and
+    marks a complete export. Returns the output directory.
+    """
+    clean_path = Path(clean_path)
+    output_dir = Path(output_dir or matrix_dir(clean_path))
+    output_dir.mkdir(parents=True, exist_ok=True)
+    features_path, labels_path, sidecar_path = matrix_paths(output_dir)
+    sidecar_path.unlink(missing_ok=True)
+
+    rows = count_rows(clean_path)
+    if rows is None:
+        rows = sum(
+            len(chunk)
+            for chunk in iter_frames(
+                clean_path, columns=[LABEL_COLUMN], batch_size=batch_size
+            )
+        )
+
+    sample = next(iter_frames(clean_path, stage="clean", batch_size=1))
+    columns = feature_columns(sample.columns)
+
+    features = np.lib.format.open_memmap(
+        features_path, mode="w+", dtype=np.float32, shape=(rows, len(columns))
+    )
+    labels = np.lib.format.open_memmap(
+        labels_path, mode="w+", dtype=np.int8, shape=(rows,)
+    )
+    start = 0
+    for chunk in iter_frames(clean_path, stage="clean", batch_size=batch_size):
+        end = start + len(chunk)
+        features[start:end] = feature_matrix(chunk, columns)
+        labels[start:end] = (chunk[LABEL_COLUMN] == POSITIVE_LABEL).to_numpy()
+        start = end
+    features.flush()
+    labels.flush()
+    del features, labels
+
+    sidecar = {
+        "source": str(clean_path),
+        "rows": rows,
+        "columns": columns,
+        "label": {"column": LABEL_COLUMN, "positive": POSITIVE_LABEL},
+        **_describe(sample, columns),
+    }
+    sidecar_path.write_text(json.dumps(sidecar, indent=2))
+    print(
+        f"🧮 Exported {rows:,} x {len(columns)} float32 feature matrix to {output_dir}"
+    )
+    return output_dir
+
+
+def load_feature_matrix(
+    directory: Union[str, Path],
+) -> tuple[np.ndarray, np.ndarray, dict]:
+    """
+    Opens an exported matrix as read-only memmaps: (X, y, sidecar). Processes that
+    load the same export share its page-cached pages instead of copying them.
+    """
+    features_path, labels_path, sidecar_path = matrix_paths(directory)
+    if not sidecar_path.exists():
+        raise FileNotFoundError(f"No complete feature matrix export in {directory}")
+    sidecar = json.loads(sidecar_path.read_text())
+    features = np.load(features_path, mmap_mode="r")
+    labels = np.load(labels_path, mmap_mode="r")
+    return features, labels, sidecar
@@ -0,0 +1,370 @@
+import math
+from datetime import date
+from functools import lru_cache
+from pathlib import Path
+from typing import Mapping, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from preprocessing.augment import WEATHER_HISTORY_PREFIX, weather_history_source
+from preprocessing.calendar_features import SEASONS, calendar_table
+from preprocessing.impute import imputation_values_path, load_imputation_values
+from preprocessing.kernels import (
+    JFK_RUNWAY_HEADINGS,
+    crosswind_component,
+    runway_crosswind_column,
+)
+from preprocessing.optimize import DEPARTURE_BIN_LABELS, weather_feature_columns
+from preprocessing.storage import iter_frames, read_frame
+
+LABEL_COLUMN = "label"
+DEPARTURE_BIN_EDGES = [360, 720, 1080, 1440]
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+def feature_columns(columns) -> list[str]:
+    """Model inputs of a clean dataset: every column except the label."""
+    return [col for col in columns if col != LABEL_COLUMN]
+
+
+def feature_matrix(df: pd.DataFrame, columns: Optional[list[str]] = None) -> np.ndarray:
+    """
+    Encodes a clean dataset as the float32 matrix the model is trained and served
+    on: bools become 0/1, categoricals their category codes (NaN when missing).
+    """
+    columns = feature_columns(df.columns) if columns is None else columns
+    matrix = np.empty((len(df), len(columns)), dtype=np.float32)
+    for i, col in enumerate(columns):
+        values = df[col]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            codes = values.cat.codes.to_numpy().astype(np.float32)
+            codes[codes < 0] = np.nan
+            matrix[:, i] = codes
+        elif isinstance(values.dtype, pd.SparseDtype):
+            matrix[:, i] = values.sparse.to_dense().to_numpy(dtype=np.float32)
+        else:
+            matrix[:, i] = values.to_numpy(dtype=np.float32)
+    return matrix
+
+
+class OnlineFeatureBuilder:
+    """
+    Builds the training feature vector of single scheduled flights without pandas.
+
+    Everything that does not depend on the flight is prepared up front: column
+    positions, the encoded weather block of the latest observation (imputed with
+    the persisted training medians) and a per-date calendar cache filled one year
+    at a time. `build` then only does arithmetic and a handful of array writes.
+    """
+
+    def __init__(
+        self,
+        columns: list[str],
+        categories: Mapping[str, list],
+        imputation_values: Mapping[str, float],
+        runway_heading: float = 40,
+        runway_headings=JFK_RUNWAY_HEADINGS,
+    ):
+        self.columns = list(columns)
+        self.index = {col: i for i, col in enumerate(self.columns)}
+        self.categories = {col: list(values) for col, values in categories.items()}
+        self.imputation_values = dict(imputation_values)
+        self.runway_heading = runway_heading
+        self.runway_headings = tuple(runway_headings)
+        self.weather_columns = weather_feature_columns(self.columns)
+        self._template = np.zeros(len(self.columns), dtype=np.float32)
+        self._calendar = {}
+        self._calendar_years = set()
+        self.store = None
+        self.delay_history = None
+
+        get = self.index.get
+        self._scalar_index = [
+            get(col)
+            for col in (
+                "scheduled_elapsed_time",
+                "dep_min",
+                "dep_sin",
+                "dep_cos",
+                "day_of_year_sin",
+                "day_of_year_cos",
+                "part_of_month_early",
+                "part_of_month_mid",
+                "part_of_month_late",
+                "is_holiday_or_weekend",
+            )
+        ]
+        self._month_index = {m: get(f"month_{m}") for m in range(1, 13)}
+        self._day_of_week_index = {d: get(f"day_of_week_{d}") for d in range(1, 8)}
+        self._season_index = {s: get(f"season_{s}") for s in set(SEASONS.values())}
+        self._bin_index = [
+            get(f"departure_bin_{label}") for label in DEPARTURE_BIN_LABELS
+        ]
+        self._carrier_index = {
+            col[len("carrier_") :]: i
+            for col, i in self.index.items()
+            if col.startswith("carrier_")
+        }
+
+    @classmethod
+    def from_dataset(
+        cls,
+        clean_path: Union[str, Path],
+        weather_path: Optional[Union[str, Path]] = None,
+        imputation_path: Optional[Union[str, Path]] = None,
+        **kwargs,
+    ) -> "OnlineFeatureBuilder":
+        """
+        Takes the feature layout from a clean dataset and its saved imputation
+        values, and the weather state from the last observation in `weather_path`.
+        """
+        sample = next(iter_frames(clean_path, stage="clean", batch_size=1))
+        columns = feature_columns(sample.columns)
+        categories = {
+            col: list(sample[col].cat.categories)
+            for col in columns
+            if isinstance(sample[col].dtype, pd.CategoricalDtype)
+        }
+        imputation_path = imputation_path or imputation_values_path(clean_path)
+        builder = cls(
+            columns, categories, load_imputation_values(imputation_path), **kwargs
+        )
+
+        if weather_path is not None:
+            weather = read_frame(weather_path, stage="weather")
+            latest = weather.sort_values("datetime", kind="stable").iloc[-1]
+            builder.update_weather(latest.to_dict())
+        return builder
+
+    def update_weather(self, observation: Mapping):
+        """
+        Replaces the weather state with a processed observation (a row of the
+        weather table as a dict). Missing cloud height and wind direction are filled
+        with the training medians, missing history values like `fill_weather_history`
+        and the crosswinds recomputed, as in imputation.
+        """
+        self._template = self._weather_template(observation)
+
+    def _weather_template(self, observation: Mapping) -> np.ndarray:
+        observation = dict(observation)
+        for col in ("cloud_height", "wind_direction"):
+            if _is_missing(observation.get(col)):
+                observation[col] = self.imputation_values[col]
+        for col in self.weather_columns:
+            if col.startswith(WEATHER_HISTORY_PREFIX) and _is_missing(
+                observation.get(col)
+            ):
+                source = weather_history_source(col)
+                observation[col] = observation.get(source) if source else 0.0
+
+        direction = observation["wind_direction"]
+        speed = observation.get("wind_speed", math.nan)
+        observation["crosswind_component"] = float(
+            crosswind_component(direction, speed, self.runway_heading)
+        )
+        crosswinds = [
+            float(crosswind_component(direction, speed, heading))
+            for heading in self.runway_headings
+        ]
+        for heading, value in zip(self.runway_headings, crosswinds):
+            observation[runway_crosswind_column(heading)] = value
+        if crosswinds:
+            observation["min_crosswind_component"] = min(crosswinds)
+
+        template = np.zeros(len(self.columns), dtype=np.float32)
+        for col in self.weather_columns:
+            template[self.index[col]] = self._encode(col, observation.get(col))
+        return template
+
+    def use_store(
+        self,
+        store,
+        station: int,
+        direction: str = "nearest",
+        tolerance: pd.Timedelta = pd.Timedelta(hours=2),
+        cache_size: int = 65_536,
+    ) -> "OnlineFeatureBuilder":
+        """
+        Takes each flight's weather from a `FeatureStore` at its scheduled
+        departure, joined like the training data, instead of from the current
+        weather state; calendar rows come from the store as well. Encoded weather
+        blocks are cached per departure minute, so repeated departures cost a dict
+        lookup. Flights without an observation within `tolerance` fall back to
+        the current weather state.
+        """
+        self.store = store
+        self.station = station
+        self.direction = direction
+        self.tolerance = pd.Timedelta(tolerance)
+        self._store_template = lru_cache(maxsize=cache_size)(self._lookup_template)
+        self._calendar.clear()
+        self._calendar_years.clear()
+        return self
+
+    def _lookup_template(self, year: int, month: int, day: int, dep_min: int):
+        departure = pd.Timestamp(year, month, day) + pd.Timedelta(minutes=dep_min)
+        observation = self.store.weather_at(
+            self.station, departure, self.direction, self.tolerance
+        )
+        return None if observation is None else self._weather_template(observation)
+
+    def use_delay_history(
+        self, history, cache_size: int = 65_536
+    ) -> "OnlineFeatureBuilder":
+        """
+        Fills the delay-rate features from a `DelayHistory`, which must hold the
+        outcomes of every day before the flights scored. Rates are cached per
+        date, carrier and departure bin; call again after updating the history.
+        """
+        self.delay_history = history
+        self._delay_rate_index = [self.index.get(col) for col in history.columns]
+        self._delay_rates = lru_cache(maxsize=cache_size)(self._lookup_delay_rates)
+        return self
+
+    def _lookup_delay_rates(
+        self, year: int, month: int, day: int, carrier: str, departure_bin: str
+    ) -> tuple:
+        day_number = date(year, month, day).toordinal() - EPOCH_ORDINAL
+        rates = self.delay_history.flight_rates(
+            day_number, {"carrier": carrier, "departure_bin": departure_bin}
+        )
+        return tuple(rates.values())
+
+    def _base(self, flight: Mapping) -> np.ndarray:
+        if self.store is None:
+            return self._template
+        h, m = divmod(int(flight["scheduled_departure_time"]), 100)
+        template = self._store_template(*_parse_date(flight), h * 60 + m)
+        return self._template if template is None else template
+
+    def _encode(self, col: str, value) -> float:
+        if col in self.categories:
+            if _is_missing(value):
+                return math.nan
+            return float(self.categories[col].index(value))
+        if value is None:
+            # Flags absent from the observation (e.g. a METAR weather type that
+            # did not occur) are False; numeric fields are unknown
+            return 0.0 if col.startswith("weather_") else math.nan
+        return float(value)
+
+    def _calendar_row(self, year: int, month: int, day: int):
+        key = (year, month, day)
+        row = self._calendar.get(key)
+        if row is None:
+            if year in self._calendar_years:
+                raise ValueError(f"Invalid date {year}-{month:02d}-{day:02d}")
+            # Cold path: add the whole year from the stored or built calendar table
+            table = None
+            if self.store is not None:
+                table = self.store.calendar_frame()
+                table = table[table.index.year == year]
+            if table is None or table.empty:
+                table = calendar_table(year, year)
+            for ts, sin, cos, holiday in zip(
+                table.index,
+                table["day_of_year_sin"].to_numpy(),
+                table["day_of_year_cos"].to_numpy(),
+                table["is_holiday"].to_numpy(),
+            ):
+                self._calendar[(ts.year, ts.month, ts.day)] = (
+                    float(sin),
+                    float(cos),
+                    bool(holiday),
+                    ts.isoweekday(),
+                )
+            self._calendar_years.add(year)
+            return self._calendar_row(year, month, day)
+        return row
+
+    def _fill(self, vector: np.ndarray, flight: Mapping):
+        year, month, day = _parse_date(flight)
+        doy_sin, doy_cos, is_holiday, day_of_week = self._calendar_row(year, month, day)
+        day_of_week = int(flight.get("day_of_week", day_of_week))
+
+        h, m = divmod(int(flight["scheduled_departure_time"]), 100)
+        dep_min = h * 60 + m
+        angle = 2 * math.pi * dep_min / 1440
+
+        scalars = (
+            float(flight["scheduled_elapsed_time"]),
+            dep_min,
+            math.sin(angle),
+            math.cos(angle),
+            doy_sin,
+            doy_cos,
+            day <= 10,
+            10 < day <= 20,
+            day > 20,
+            is_holiday or day_of_week >= 6,
+        )
+        for i, value in zip(self._scalar_index, scalars):
+            if i is not None:
+                vector[i] = value
+
+        if self.delay_history is not None:
+            rates = self._delay_rates(
+                year, month, day, flight["carrier"], _departure_label(dep_min)
+            )
+            for i, rate in zip(self._delay_rate_index, rates):
+                if i is not None:
+                    vector[i] = rate
+
+        for i in (
+            self._month_index[month],
+            self._day_of_week_index[day_of_week],
+            self._season_index[SEASONS[month]],
+            self._carrier_index.get(flight["carrier"]),
+            self._departure_bin(dep_min),
+        ):
+            if i is not None:
+                vector[i] = 1.0
+
+    def _departure_bin(self, dep_min: int) -> Optional[int]:
+        for i, edge in enumerate(DEPARTURE_BIN_EDGES):
+            if dep_min < edge:
+                return self._bin_index[i]
+        return None
+
+    def build(self, flight: Mapping) -> np.ndarray:
+        """
+        Feature vector of one flight: a dict with `carrier`, `date` ("YYYY-MM-DD",
+        or `year`/`month`/`day`), `scheduled_departure_time` (hhmm) and
+        `scheduled_elapsed_time` (minutes). An optional BTS `day_of_week` (1 =
+        Monday) takes precedence over the weekday of the date.
+        """
+        vector = self._base(flight).copy()
+        self._fill(vector, flight)
+        return vector
+
+    def build_batch(self, flights: list[Mapping]) -> np.ndarray:
+        """Feature matrix of several flights, one row per flight."""
+        if self.store is None:
+            matrix = np.repeat(self._template[np.newaxis, :], len(flights), axis=0)
+        else:
+            matrix = np.stack([self._base(flight) for flight in flights])
+        for row, flight in zip(matrix, flights):
+            self._fill(row, flight)
+        return matrix
+
+
+def _departure_label(dep_min: int) -> Optional[str]:
+    for edge, label in zip(DEPARTURE_BIN_EDGES, DEPARTURE_BIN_LABELS):
+        if dep_min < edge:
+            return label
+    return None
+
+
+def _is_missing(value) -> bool:
+    return value is None or (not isinstance(value, str) and bool(pd.isna(value)))
+
+
+def _parse_date(flight: Mapping) -> tuple[int, int, int]:
+    value = flight.get("date")
+    if value is None:
+        return int(flight["year"]), int(flight["month"]), int(flight["day"])
+    if isinstance(value, date):
+        return value.year, value.month, value.day
+    year, month, day = value.split("-")
+    return int(year), int(month), int(day)
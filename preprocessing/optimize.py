@@ -1,132 +1,145 @@
-from datetime import datetime
-
-import holidays
 import numpy as np
 import pandas as pd
 
-US_HOLIDAYS = holidays.US(years=range(2014, 2025))
-
-
-def convert_time_to_minutes(time_val):
-    if pd.isna(time_val):
-        return np.nan
-    h, m = divmod(int(time_val), 100)
-    return h * 60 + m
-
-
-def label_delay(delay_val):
-    if pd.isna(delay_val):
-        return np.nan
-    return "delayed" if delay_val > 0 else "not_delayed"
-
-
-def get_season(month):
-    if pd.isna(month):
-        return np.nan
-    month = int(month)
-    return (
-        "winter"
-        if month in [12, 1, 2]
-        else "spring"
-        if month in [3, 4, 5]
-        else "summer"
-        if month in [6, 7, 8]
-        else "fall"
+from preprocessing import instrument
+from preprocessing.augment import WEATHER_HISTORY_PREFIX
+from preprocessing.calendar_features import add_calendar_features
+from preprocessing.delay_history import (
+    DELAY_RATE_PREFIX,
+    DelayHistory,
+    add_delay_rates,
+    delay_history_path,
+)
+from preprocessing.kernels import RUNWAY_CROSSWIND_PREFIX
+from preprocessing.storage import compact_frame, read_frame, write_frame
+
+DEPARTURE_BIN_LABELS = ["night", "morning", "afternoon", "evening"]
+
+WEATHER_MERGE_COLUMNS = [
+    "temperature",
+    "wind_direction",
+    "wind_speed",
+    "altimeter",
+    "pressure",
+    "precipitation",
+    "visibility",
+    "cloud_height",
+    "temperature_celsius",
+    "freezing_conditions",
+    "wind_speed_category",
+    "crosswind_component",
+    "visibility_category",
+    "cloud_coverage_score",
+    "ceiling_height",
+    "ifr_conditions",
+    "mvfr_conditions",
+    "has_precipitation",
+    "precipitation_category",
+    "low_pressure",
+    "pressure_category",
+]
+
+
+def weather_feature_columns(columns) -> list[str]:
+    """Weather columns carried onto flights, in dataset order, that exist in `columns`."""
+    columns = list(columns)
+    feature_cols = list(WEATHER_MERGE_COLUMNS)
+    feature_cols.extend(
+        col for col in columns if col.startswith(RUNWAY_CROSSWIND_PREFIX)
     )
+    feature_cols.append("min_crosswind_component")
+    feature_cols.extend(col for col in columns if col.startswith("weather_"))
+    feature_cols.extend(
+        col for col in columns if col.startswith(WEATHER_HISTORY_PREFIX)
+    )
+    return [col for col in feature_cols if col in columns]
 
 
-def is_holiday_or_weekend(row):
-    try:
-        date = datetime(int(row["year"]), int(row["month"]), int(row["day"]))
-        return int(date in US_HOLIDAYS or int(row["day_of_week"]) in [6, 7])
-    except Exception:
-        return 0
-
-
-def get_day_of_year(row):
-    try:
-        return (
-            datetime(int(row["year"]), int(row["month"]), int(row["day"]))
-            .timetuple()
-            .tm_yday
+@instrument.traced("weather_merge")
+def merge_with_weather(
+    flight_df, weather, tolerance=pd.Timedelta(hours=2), direction="nearest"
+):
+    """
+    Attach the closest weather observation to every flight with a sorted as-of join.
+
+    `weather` is the path of the processed weather table or an already loaded frame.
+
+    `direction` is "nearest", "backward" (only observations at or before departure)
+    or "forward" (only at or after). Flights without an observation inside
+    `tolerance` are dropped. The `history_*` trailing-window columns always come
+    from the latest observation at or before departure, whatever `direction`, so
+    they never summarize weather reported after the flight left.
+    """
+    if direction not in ("nearest", "backward", "forward"):
+        raise ValueError(
+            f"direction must be 'nearest', 'backward' or 'forward', got {direction!r}"
         )
-    except Exception:
-        return np.nan
-
 
-def merge_with_weather(flight_df, weather_path):
-    weather_df = pd.read_csv(weather_path)
+    if isinstance(weather, pd.DataFrame):
+        weather_df = weather.copy()
+    else:
+        weather_df = read_frame(weather, stage="weather")
     weather_df["datetime"] = pd.to_datetime(weather_df["datetime"])
 
     flight_df["flight_datetime"] = pd.to_datetime(
         flight_df[["year", "month", "day"]]
     ) + pd.to_timedelta(flight_df["dep_min"], unit="minutes")
 
-    weather_df = weather_df.sort_values("datetime").reset_index(drop=True)
-    flight_df = flight_df.sort_values("flight_datetime").reset_index(drop=True)
-
-    merged_data = []
-
-    print("Merging flight data with weather data...")
-    for idx, flight_row in flight_df.iterrows():
-        flight_time = flight_row["flight_datetime"]
-
-        time_diff = abs(weather_df["datetime"] - flight_time)
-        closest_idx = time_diff.idxmin()
-
-        if time_diff.iloc[closest_idx] <= pd.Timedelta(hours=2):
-            weather_row = weather_df.iloc[closest_idx]
-
-            combined_row = flight_row.copy()
-
-            weather_cols_to_add = [
-                "temperature",
-                "wind_direction",
-                "wind_speed",
-                "altimeter",
-                "pressure",
-                "precipitation",
-                "visibility",
-                "cloud_height",
-                "temperature_celsius",
-                "freezing_conditions",
-                "wind_speed_category",
-                "crosswind_component",
-                "visibility_category",
-                "cloud_coverage_score",
-                "ceiling_height",
-                "ifr_conditions",
-                "mvfr_conditions",
-                "has_precipitation",
-                "precipitation_category",
-                "low_pressure",
-                "pressure_category",
-            ]
-
-            weather_cols_to_add.extend(
-                [col for col in weather_df.columns if col.startswith("weather_")]
-            )
-
-            for col in weather_cols_to_add:
-                if col in weather_df.columns:
-                    combined_row[col] = weather_row[col]
-
-            merged_data.append(combined_row)
-
-        if idx % 10000 == 0:
-            print(f"Processed {idx:,} flight records...")
-
-    merged_df = pd.DataFrame(merged_data)
+    weather_cols_to_add = weather_feature_columns(weather_df.columns)
+
+    # Keep the first observation per timestamp so ties resolve like the old idxmin scan
+    weather_df = (
+        weather_df[["datetime"] + weather_cols_to_add]
+        .sort_values("datetime", kind="stable")
+        .drop_duplicates(subset="datetime", keep="first")
+        .rename(columns={"datetime": "observation_datetime"})
+        .reset_index(drop=True)
+    )
+    flight_df = (
+        flight_df.drop(
+            columns=[c for c in weather_cols_to_add if c in flight_df.columns]
+        )
+        .dropna(subset=["flight_datetime"])
+        .sort_values("flight_datetime", kind="stable")
+        .reset_index(drop=True)
+    )
+
+    print(f"Merging flight data with weather data ({direction}, ±{tolerance})...")
+    merged_df = pd.merge_asof(
+        flight_df,
+        weather_df,
+        left_on="flight_datetime",
+        right_on="observation_datetime",
+        direction=direction,
+        tolerance=tolerance,
+    )
+
+    merged_df = merged_df[merged_df["observation_datetime"].notna()]
+    merged_df = merged_df.drop(columns=["observation_datetime"]).reset_index(drop=True)
+
+    history_cols = [
+        col for col in weather_cols_to_add if col.startswith(WEATHER_HISTORY_PREFIX)
+    ]
+    if history_cols and direction != "backward":
+        # merged_df is still sorted by flight_datetime
+        merged_df = pd.merge_asof(
+            merged_df.drop(columns=history_cols),
+            weather_df[["observation_datetime"] + history_cols],
+            left_on="flight_datetime",
+            right_on="observation_datetime",
+            direction="backward",
+            tolerance=tolerance,
+        ).drop(columns=["observation_datetime"])
     print(f"Successfully merged {len(merged_df):,} records")
 
     return merged_df
 
 
-def preprocess_flight_data(
-    input_path, output_path, weather_path="dataset/processed/jfk_weather_processed.csv"
-):
-    df = pd.read_csv(input_path)
-
+def prepare_flights(df):
+    """
+    Cleans pruned flights and adds the label and departure-time columns that
+    the delay history and the flight features are built from.
+    """
     # Rename day_of_month to day for pd.to_datetime compatibility
     df = df.rename(columns={"day_of_month": "day"})
 
@@ -152,39 +165,63 @@ def preprocess_flight_data(
     ]
     df.dropna(subset=essential_cols, inplace=True)
 
-    df["label"] = df["departure_delay"].apply(label_delay)
-    df["dep_min"] = df["scheduled_departure_time"].apply(convert_time_to_minutes)
+    df["label"] = np.where(df["departure_delay"] > 0, "delayed", "not_delayed")
+    hhmm = df["scheduled_departure_time"].astype("int64")
+    df["dep_min"] = (hhmm // 100) * 60 + hhmm % 100
     df["dep_sin"] = np.sin(2 * np.pi * df["dep_min"] / 1440)
     df["dep_cos"] = np.cos(2 * np.pi * df["dep_min"] / 1440)
 
     df["departure_bin"] = pd.cut(
         df["dep_min"],
         bins=[0, 360, 720, 1080, 1440],
-        labels=["night", "morning", "afternoon", "evening"],
+        labels=DEPARTURE_BIN_LABELS,
         include_lowest=True,
         right=False,
     )
-
-    df["day_of_year"] = df.apply(get_day_of_year, axis=1)
-    df["days_in_year"] = df["year"].apply(
-        lambda y: 366 if y % 4 == 0 and (y % 100 != 0 or y % 400 == 0) else 365
-    )
-    df["day_of_year_sin"] = np.sin(2 * np.pi * df["day_of_year"] / df["days_in_year"])
-    df["day_of_year_cos"] = np.cos(2 * np.pi * df["day_of_year"] / df["days_in_year"])
-
-    df["season"] = df["month"].apply(get_season)
-    df["is_holiday_or_weekend"] = df.apply(is_holiday_or_weekend, axis=1).astype(bool)
-
-    df["part_of_month_early"] = (df["day"] <= 10).astype(bool)
-    df["part_of_month_mid"] = ((df["day"] > 10) & (df["day"] <= 20)).astype(bool)
-    df["part_of_month_late"] = (df["day"] > 20).astype(bool)
-
-    df = merge_with_weather(df, weather_path)
-
-    for col in ["month", "day_of_week", "carrier", "departure_bin", "season"]:
-        if col in df.columns:
-            dummies = pd.get_dummies(df[col], prefix=col, drop_first=False, dtype=bool)
-            df = pd.concat([df, dummies], axis=1)
+    return df
+
+
+def build_flight_features(
+    df,
+    weather,
+    tolerance=pd.Timedelta(hours=2),
+    direction="nearest",
+    keep_columns=(),
+    calendar=None,
+    delay_history=None,
+    prepared=False,
+):
+    """
+    Builds the model features for pruned flights and joins them with `weather`.
+
+    Columns named in `keep_columns` (e.g. a flight key) are carried through to the
+    returned frame after the feature columns. `calendar` is a precomputed calendar
+    indexed by date, as a feature store returns it; by default it is built.
+    `delay_history` is the `DelayHistory` the delay-rate features are read from;
+    by default it is built from `df`. With `prepared`, `df` has already been
+    through `prepare_flights` and is not prepared again.
+    """
+    if not prepared:
+        df = prepare_flights(df)
+
+    with instrument.span("delay_rates", rows_in=len(df)):
+        df, _ = add_delay_rates(df, delay_history)
+
+    # Day of year, season, holiday/weekend and part of month come from a calendar
+    # table keyed by date instead of being computed per flight
+    with instrument.span("calendar_features", rows_in=len(df)):
+        df = add_calendar_features(df, calendar)
+
+    df = merge_with_weather(df, weather, tolerance=tolerance, direction=direction)
+
+    with instrument.span("dummy_encoding", rows_in=len(df)) as span:
+        for col in ["month", "day_of_week", "carrier", "departure_bin", "season"]:
+            if col in df.columns:
+                dummies = pd.get_dummies(
+                    df[col], prefix=col, drop_first=False, dtype=bool
+                )
+                df = pd.concat([df, dummies], axis=1)
+        span.set(columns=len(df.columns))
 
     final_cols = [
         "scheduled_elapsed_time",
@@ -203,34 +240,47 @@ def preprocess_flight_data(
     for prefix in ["month_", "day_of_week_", "carrier_", "departure_bin_", "season_"]:
         final_cols.extend([col for col in df.columns if col.startswith(prefix)])
 
-    weather_cols = [
-        "temperature",
-        "wind_direction",
-        "wind_speed",
-        "altimeter",
-        "pressure",
-        "precipitation",
-        "visibility",
-        "cloud_height",
-        "temperature_celsius",
-        "freezing_conditions",
-        "wind_speed_category",
-        "crosswind_component",
-        "visibility_category",
-        "cloud_coverage_score",
-        "ceiling_height",
-        "ifr_conditions",
-        "mvfr_conditions",
-        "has_precipitation",
-        "precipitation_category",
-        "low_pressure",
-        "pressure_category",
-    ]
+    final_cols.extend([col for col in df.columns if col.startswith(DELAY_RATE_PREFIX)])
 
-    weather_cols.extend([col for col in df.columns if col.startswith("weather_")])
+    weather_cols = weather_feature_columns(df.columns)
 
     final_cols.extend([col for col in weather_cols if col in df.columns])
+    final_cols.extend([col for col in keep_columns if col in df.columns])
+
+    return df[final_cols]
+
+
+def preprocess_flight_data(
+    input_path,
+    output_path,
+    weather_path="dataset/processed/jfk_weather_processed.parquet",
+    tolerance=pd.Timedelta(hours=2),
+    direction="nearest",
+    calendar=None,
+):
+    """
+    Builds the optimized dataset from the pruned flights. `weather_path` is a
+    processed weather table or an already loaded frame (e.g. a feature store's
+    `weather_frame`), and `calendar` an optional precomputed calendar. The delay
+    history of the flights is saved next to the output for serving and
+    incremental updates.
+    """
+    df = prepare_flights(read_frame(input_path, stage="pruned"))
+
+    # The history and the features are built from the same prepared flights
+    delay_history = DelayHistory().update(df)
+    final_df = build_flight_features(
+        df,
+        weather_path,
+        tolerance=tolerance,
+        direction=direction,
+        calendar=calendar,
+        delay_history=delay_history,
+        prepared=True,
+    )
+    final_df = compact_frame(final_df, "optimized")
 
-    df[final_cols].to_csv(output_path, index=False)
+    write_frame(final_df, output_path, stage="optimized")
+    delay_history.save(delay_history_path(output_path))
     print(f"✅ Combined flight and weather data saved to {output_path}")
-    print(f"Final dataset shape: {df[final_cols].shape}")
+    print(f"Final dataset shape: {final_df.shape}")
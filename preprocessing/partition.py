@@ -0,0 +1,366 @@
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional, Union
+
+import pandas as pd
+
+from preprocessing.amalgamate import collect_csv_files, ordered_results
+from preprocessing.delay_history import DelayHistory, delay_history_path
+from preprocessing.filter import select_carriers_and_destination
+from preprocessing.impute import impute_and_clean_dataset
+from preprocessing.kernels import JFK_RUNWAY_HEADINGS
+from preprocessing.optimize import (
+    DEPARTURE_BIN_LABELS,
+    build_flight_features,
+    prepare_flights,
+)
+from preprocessing.prune import prune_frame
+from preprocessing.storage import (
+    DEFAULT_FORMAT,
+    FLIGHT_COLUMN_DTYPES,
+    ONE_HOT_PREFIXES,
+    apply_schema,
+    concat_aligned,
+    read_frame,
+    write_frame,
+)
+
+
+def route_name(route: dict) -> str:
+    return f"{route['origin']}_{route['destination']}"
+
+
+def partition_dir(
+    root: Union[str, Path], origin: int, destination: int, carrier: str, year: int
+) -> Path:
+    """Hive-style directory of one (origin, destination, carrier, year) partition."""
+    return (
+        Path(root)
+        / f"origin={origin}"
+        / f"destination={destination}"
+        / f"carrier={carrier}"
+        / f"year={year}"
+    )
+
+
+def route_partitions(root: Union[str, Path], route: dict) -> list[Path]:
+    """Partition directories of `route`, ordered by carrier and year."""
+    route_dir = Path(root) / f"origin={route['origin']}"
+    route_dir = route_dir / f"destination={route['destination']}"
+    return sorted(
+        path
+        for carrier in route["carriers"]
+        for path in (route_dir / f"carrier={carrier}").glob("year=*")
+        if path.is_dir()
+    )
+
+
+def read_partition(path: Union[str, Path], stage: str = "pruned") -> pd.DataFrame:
+    """Concatenates the part files of one partition directory."""
+    parts = sorted(Path(path).glob("part-*"))
+    frames = [read_frame(part, stage=stage) for part in parts]
+    return apply_schema(pd.concat(frames, ignore_index=True), stage)
+
+
+def partition_csv(
+    file_path: Path, routes: list[dict], chunksize: int = 250_000
+) -> dict[tuple, pd.DataFrame]:
+    """
+    Streams one raw CSV and splits the pruned flights of every route by
+    (origin, destination, carrier, year).
+    """
+    header = pd.read_csv(file_path, nrows=0).columns
+    if "ORIGIN_AIRPORT_ID" not in header:
+        return {}
+
+    usecols = [col for col in header if col in FLIGHT_COLUMN_DTYPES]
+    dtypes = {col: FLIGHT_COLUMN_DTYPES[col] for col in usecols}
+    origins = {route["origin"] for route in routes}
+
+    partitions = {}
+    for chunk in pd.read_csv(
+        file_path, usecols=usecols, dtype=dtypes, chunksize=chunksize
+    ):
+        chunk = chunk[chunk["ORIGIN_AIRPORT_ID"].isin(origins)]
+        for route in routes:
+            combined = chunk[chunk["ORIGIN_AIRPORT_ID"] == route["origin"]]
+            filtered = select_carriers_and_destination(
+                combined, route["carriers"], route["destination"]
+            )
+            pruned = prune_frame(filtered)
+            for (carrier, year), df in pruned.groupby(["carrier", "year"]):
+                key = (route["origin"], route["destination"], carrier, int(year))
+                partitions.setdefault(key, []).append(df)
+
+    return {
+        key: pd.concat(frames, ignore_index=True) for key, frames in partitions.items()
+    }
+
+
+def partition_flight_data(
+    raw_data_path: Union[str, Path],
+    routes: list[dict],
+    output_dir: Union[str, Path] = "dataset/processed/partitions",
+    fmt: str = DEFAULT_FORMAT,
+    workers: Optional[int] = None,
+    chunksize: int = 250_000,
+) -> dict[tuple, int]:
+    """
+    Scans the raw BTS files once for every route in `routes` and writes the pruned
+    flights to `output_dir`, partitioned by (origin, destination, carrier, year).
+
+    Each route is a dict with `origin`, `destination` and `carriers`. Every raw file
+    contributes one `part-<index>-<file>` per partition, written in sorted file
+    order, so every run lays out the same files and a partition reads back in raw
+    file order. Returns the row count per partition key.
+    """
+    output_dir = Path(output_dir)
+    if output_dir.exists():
+        shutil.rmtree(output_dir)
+
+    csv_files = collect_csv_files(raw_data_path, exclude=["jfk_weather_2014_24.csv"])
+    print(f"Found {len(csv_files)} CSV files.")
+
+    workers = workers or os.cpu_count() or 1
+    rows = {}
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = ordered_results(
+            executor, partition_csv, csv_files, routes, chunksize, window=workers
+        )
+        for index, (file, partitions) in enumerate(zip(csv_files, results)):
+            for key, df in partitions.items():
+                part = f"part-{index:05d}-{file.stem}.{fmt}"
+                write_frame(df, partition_dir(output_dir, *key) / part, stage="pruned")
+                rows[key] = rows.get(key, 0) + len(df)
+
+    print(f"Partitioned {sum(rows.values()):,} flights into {len(rows)} partitions")
+    return rows
+
+
+@lru_cache(maxsize=None)
+def load_station_weather(weather_path: str) -> pd.DataFrame:
+    """
+    Processed weather table of a station, read once per worker process and shared
+    by every partition that worker handles.
+    """
+    weather = read_frame(weather_path, stage="weather")
+    return weather.sort_values("datetime", kind="stable").reset_index(drop=True)
+
+
+def build_partition_features(
+    partition: Path,
+    output_dir: Path,
+    weather_path: str,
+    fmt: str = DEFAULT_FORMAT,
+    tolerance: pd.Timedelta = pd.Timedelta(hours=2),
+    direction: str = "nearest",
+    delay_history: Optional[DelayHistory] = None,
+) -> Optional[Path]:
+    """
+    Builds the optimized features of one partition, joined with the observations of
+    its year (± `tolerance`) from the station's weather table. `delay_history`
+    is the history of the partition's route.
+    """
+    df = read_partition(partition)
+    if df.empty:
+        return None
+
+    year = int(df["year"].iloc[0])
+    weather = load_station_weather(weather_path)
+    window = weather["datetime"].between(
+        pd.Timestamp(year, 1, 1) - tolerance,
+        pd.Timestamp(year + 1, 1, 1) + tolerance,
+    )
+
+    features = build_flight_features(
+        df,
+        weather[window],
+        tolerance=tolerance,
+        direction=direction,
+        keep_columns=["flight_datetime"],
+        delay_history=delay_history,
+    )
+    output_path = output_dir / f"{partition.parent.name}_{partition.name}.{fmt}"
+    write_frame(features, output_path, stage="optimized")
+    return output_path
+
+
+def route_delay_history(partitions_dir: Union[str, Path], route: dict) -> DelayHistory:
+    """
+    Delay history of every flight of `route`, shared by all its partitions so
+    the rates of a carrier-year partition also see the route's other flights
+    and earlier years.
+    """
+    history = DelayHistory()
+    for partition in route_partitions(partitions_dir, route):
+        history.update(prepare_flights(read_partition(partition)))
+    return history
+
+
+def _flag_order(prefix: str, column: str):
+    suffix = column[len(prefix) :]
+    if prefix == "departure_bin_" and suffix in DEPARTURE_BIN_LABELS:
+        return (0, DEPARTURE_BIN_LABELS.index(suffix), "")
+    if suffix.isdigit():
+        return (0, int(suffix), "")
+    return (1, 0, suffix)
+
+
+def order_feature_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Sorts each one-hot and `weather_*` block the way `pd.get_dummies` emits it, so
+    datasets assembled from partitions match a single build_flight_features run.
+    """
+    prefixes = list(ONE_HOT_PREFIXES) + ["weather_"]
+    blocks = {
+        prefix: sorted(
+            (col for col in df.columns if col.startswith(prefix)),
+            key=lambda col, prefix=prefix: _flag_order(prefix, col),
+        )
+        for prefix in prefixes
+    }
+
+    ordered = []
+    for col in df.columns:
+        prefix = next((p for p in prefixes if col.startswith(p)), None)
+        if prefix is None:
+            ordered.append(col)
+        elif blocks[prefix]:
+            ordered.extend(blocks[prefix])
+            blocks[prefix] = []
+    return df[ordered]
+
+
+def assemble_route_dataset(
+    feature_files: list[Path],
+    output_path: Path,
+    runway_heading: float = 40,
+    runway_headings: tuple = JFK_RUNWAY_HEADINGS,
+    impute_chunksize: Optional[int] = 250_000,
+) -> Path:
+    """
+    Concatenates a route's partition features into its optimized dataset, ordered
+    by departure time like the single-route dataset, and imputes it into
+    `<name>_clean`.
+    """
+    frames = [read_frame(path, stage="optimized") for path in feature_files]
+    df = concat_aligned(frames, "optimized")
+    # Partitions are split by carrier and year; time-ordered splits of the route
+    # dataset need the flights back in departure order
+    df = df.sort_values("flight_datetime", kind="stable").reset_index(drop=True)
+    df = order_feature_columns(df.drop(columns=["flight_datetime"]))
+    write_frame(df, output_path, stage="optimized")
+
+    impute_and_clean_dataset(
+        output_path,
+        runway_heading=runway_heading,
+        runway_headings=runway_headings,
+        chunksize=impute_chunksize,
+    )
+    return output_path.with_name(f"{output_path.stem}_clean{output_path.suffix}")
+
+
+def route_clean_path(
+    output_dir: Union[str, Path], route: dict, fmt: str = DEFAULT_FORMAT
+) -> Path:
+    return Path(output_dir) / route_name(route) / f"optimized_clean.{fmt}"
+
+
+def build_route_datasets(
+    raw_data_path: Union[str, Path],
+    routes: list[dict],
+    weather_paths: dict[int, Union[str, Path]],
+    output_dir: Union[str, Path] = "dataset/processed/routes",
+    partitions_dir: Union[str, Path] = "dataset/processed/partitions",
+    fmt: str = DEFAULT_FORMAT,
+    tolerance: pd.Timedelta = pd.Timedelta(hours=2),
+    direction: str = "nearest",
+    runway_heading: float = 40,
+    runway_headings: tuple = JFK_RUNWAY_HEADINGS,
+    workers: Optional[int] = None,
+    chunksize: int = 250_000,
+) -> dict[str, Path]:
+    """
+    Builds an optimized and a clean dataset for every route in one run.
+
+    The raw files are scanned once into (origin, destination, carrier, year)
+    partitions; feature engineering and the weather join then run per partition
+    and imputation per route, both across a process pool. `weather_paths` maps
+    each origin to the processed weather table of its station. Outputs land in
+    `output_dir/<origin>_<destination>/`. Returns the clean dataset per route.
+    """
+    routes = list(routes)
+    names = [route_name(route) for route in routes]
+    if len(set(names)) != len(names):
+        raise ValueError("Each origin/destination pair may only appear in one route")
+    missing = {route["origin"] for route in routes} - set(weather_paths)
+    if missing:
+        raise ValueError(f"No processed weather table for origins {sorted(missing)}")
+
+    partition_flight_data(
+        raw_data_path,
+        routes,
+        output_dir=partitions_dir,
+        fmt=fmt,
+        workers=workers,
+        chunksize=chunksize,
+    )
+
+    output_dir = Path(output_dir)
+    workers = workers or os.cpu_count() or 1
+    clean_paths = {}
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        feature_futures = {}
+        for route in routes:
+            features_dir = output_dir / route_name(route) / "partitions"
+            if features_dir.exists():
+                shutil.rmtree(features_dir)
+            features_dir.mkdir(parents=True)
+            delay_history = route_delay_history(partitions_dir, route)
+            delay_history.save(
+                delay_history_path(output_dir / route_name(route) / f"optimized.{fmt}")
+            )
+            for partition in route_partitions(partitions_dir, route):
+                future = executor.submit(
+                    build_partition_features,
+                    partition,
+                    features_dir,
+                    str(weather_paths[route["origin"]]),
+                    fmt,
+                    tolerance,
+                    direction,
+                    delay_history,
+                )
+                feature_futures[future] = route_name(route)
+
+        feature_files = {name: [] for name in names}
+        for future in as_completed(feature_futures):
+            path = future.result()
+            if path is not None:
+                feature_files[feature_futures[future]].append(path)
+
+        route_futures = {}
+        for route in routes:
+            name = route_name(route)
+            if not feature_files[name]:
+                print(f"⚠️  No flights found for route {name}")
+                continue
+            future = executor.submit(
+                assemble_route_dataset,
+                sorted(feature_files[name]),
+                output_dir / name / f"optimized.{fmt}",
+                runway_heading,
+                runway_headings,
+            )
+            route_futures[future] = name
+
+        for future in as_completed(route_futures):
+            clean_paths[route_futures[future]] = future.result()
+            print(f"✅ Route {route_futures[future]} ready: {future.result()}")
+
+    return clean_paths
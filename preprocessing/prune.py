@@ -1,7 +1,7 @@
-import os
-
 import pandas as pd
 
+from preprocessing.storage import read_frame, write_frame
+
 
 def rename_columns(df: pd.DataFrame) -> pd.DataFrame:
     """
@@ -40,9 +40,25 @@ def rename_columns(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 
+def prune_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Removes cancelled or diverted flights and rows with null values, drops the
+    status columns and applies `rename_columns`.
+    """
+    df = df[df["CANCELLED"] == 0.0]
+
+    df = df[df["DIVERTED"] == 0.0]
+
+    df = df.dropna()
+
+    df = df.drop(columns=["CANCELLED", "DIVERTED", "DISTANCE"])
+
+    return rename_columns(df)
+
+
 def prune_flight_data(
-    input_path: str = "dataset/processed/airline_filtered.csv",
-    output_path: str = "dataset/processed/airline_filtered_pruned.csv",
+    input_path: str = "dataset/processed/airline_filtered.parquet",
+    output_path: str = "dataset/processed/airline_filtered_pruned.parquet",
 ) -> None:
     """
     Prunes the flight dataset by removing cancelled or diverted flights and rows with null values.
@@ -50,29 +66,19 @@ def prune_flight_data(
     Parameters:
     -----------
     input_path : str
-        Path to the input CSV file
+        Path to the input dataset (CSV, Parquet or Feather)
     output_path : str
-        Path to save the pruned CSV file
+        Path to save the pruned dataset; the suffix selects the format
     """
     try:
-        df = pd.read_csv(input_path)
+        df = read_frame(input_path, stage="filtered")
         print(f"Initial shape: {df.shape}")
 
-        df = df[df["CANCELLED"] == 0.0]
-
-        df = df[df["DIVERTED"] == 0.0]
-
-        df = df.dropna()
-
-        df = df.drop(columns=["CANCELLED", "DIVERTED", "DISTANCE"])
-
-        df = rename_columns(df)
+        df = prune_frame(df)
 
         print(f"Final shape after filtering: {df.shape}")
 
-        os.makedirs(os.path.dirname(output_path), exist_ok=True)
-
-        df.to_csv(output_path, index=False)
+        write_frame(df, output_path, stage="pruned")
         print(f"Filtered data saved to {output_path}")
     except FileNotFoundError:
         print(f"File not found. Please check the path: {input_path}")
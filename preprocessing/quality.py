@@ -0,0 +1,395 @@
+import json
+from pathlib import Path
+from typing import Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from preprocessing.storage import iter_frames
+
+
+def _column_kind(dtype) -> str:
+    if isinstance(dtype, pd.SparseDtype):
+        dtype = dtype.subtype
+    if pd.api.types.is_bool_dtype(dtype):
+        return "flag"
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        return "datetime"
+    if pd.api.types.is_numeric_dtype(dtype):
+        return "numeric"
+    return "category"
+
+
+def _add(total: pd.Series, counts: pd.Series) -> pd.Series:
+    return total.add(counts, fill_value=0)
+
+
+def _fold(current: pd.Series, values: pd.Series, reduction: str) -> pd.Series:
+    """Running per-column min or max, ignoring NaN."""
+    if current.empty:
+        return values.astype("float64")
+    return getattr(pd.concat([current, values], axis=1), reduction)(axis=1)
+
+
+def _combine(
+    counts: pd.Series,
+    mean: pd.Series,
+    m2: pd.Series,
+    other_counts: pd.Series,
+    other_mean: pd.Series,
+    other_m2: pd.Series,
+) -> tuple[pd.Series, pd.Series, pd.Series]:
+    """
+    Chan et al.'s pairwise update of per-column counts, means and sums of squared
+    deviations (M2). Unlike a sum of squares it does not cancel catastrophically
+    when the mean is large compared to the spread.
+    """
+    index = counts.index.union(other_counts.index)
+    n_a = counts.reindex(index, fill_value=0)
+    n_b = other_counts.reindex(index, fill_value=0)
+    # Columns without values on one side have a NaN mean that must not spread
+    mean_a = mean.reindex(index).where(n_a > 0, 0)
+    mean_b = other_mean.reindex(index).where(n_b > 0, 0)
+    n = n_a + n_b
+    safe_n = n.where(n > 0)
+    delta = mean_b - mean_a
+    combined_mean = (mean_a + delta * n_b / safe_n).where(n > 0)
+    combined_m2 = (
+        m2.reindex(index, fill_value=0)
+        + other_m2.reindex(index, fill_value=0)
+        + (delta * delta * n_a * n_b / safe_n).fillna(0)
+    )
+    return n, combined_mean, combined_m2
+
+
+def _top(frequencies: pd.Series) -> Optional[str]:
+    return frequencies.idxmax() if len(frequencies) else None
+
+
+class DataProfile:
+    """
+    Null counts, value ranges, category frequencies and flag rates of a dataset,
+    fed chunk by chunk.
+
+    `update` reduces each chunk with one vectorized call per column kind (numeric,
+    flag, datetime) plus a value count per categorical column, so profiling costs
+    a single scan of the data. Numeric columns keep their min, max, count, mean and
+    sum of squared deviations (M2), combined across chunks with Chan's update, so
+    the standard deviation stays accurate for large values without a second pass.
+    Partial profiles from parallel workers are combined with `merge`; `drift`
+    compares a profile against a saved baseline.
+    """
+
+    def __init__(self):
+        self.rows = 0
+        self.dtypes = {}
+        self.nulls = pd.Series(dtype="int64")
+        self.minimum = pd.Series(dtype="float64")
+        self.maximum = pd.Series(dtype="float64")
+        self.counts = pd.Series(dtype="float64")
+        self.mean = pd.Series(dtype="float64")
+        self.m2 = pd.Series(dtype="float64")
+        self.true_counts = pd.Series(dtype="int64")
+        self.first = {}
+        self.last = {}
+        self.categories = {}
+
+    def _columns(self, kind: str) -> list[str]:
+        return [
+            col for col, dtype in self.dtypes.items() if _column_kind(dtype) == kind
+        ]
+
+    def update(self, df: pd.DataFrame) -> "DataProfile":
+        kinds = {col: _column_kind(df[col].dtype) for col in df.columns}
+        by_kind = {
+            kind: [col for col, col_kind in kinds.items() if col_kind == kind]
+            for kind in ("numeric", "flag", "datetime", "category")
+        }
+        self.rows += len(df)
+        self.dtypes.update({col: str(df[col].dtype) for col in df.columns})
+        self.nulls = _add(self.nulls, df.isna().sum()).astype("int64")
+
+        numeric = df[by_kind["numeric"]]
+        if len(numeric.columns) and len(df):
+            values = numeric.astype("float64")
+            self.minimum = _fold(self.minimum, values.min(), "min")
+            self.maximum = _fold(self.maximum, values.max(), "max")
+            mean = values.mean()
+            self.counts, self.mean, self.m2 = _combine(
+                self.counts,
+                self.mean,
+                self.m2,
+                values.count().astype("float64"),
+                mean,
+                ((values - mean) ** 2).sum(),
+            )
+
+        if by_kind["flag"]:
+            true_counts = df[by_kind["flag"]].sum().astype("int64")
+            self.true_counts = _add(self.true_counts, true_counts).astype("int64")
+
+        for col in by_kind["datetime"]:
+            values = df[col].dropna()
+            if values.empty:
+                continue
+            first, last = values.min(), values.max()
+            self.first[col] = min(self.first.get(col, first), first)
+            self.last[col] = max(self.last.get(col, last), last)
+
+        for col in by_kind["category"]:
+            counts = df[col].value_counts()
+            counts.index = counts.index.astype(str)
+            previous = self.categories.get(col)
+            self.categories[col] = (
+                counts if previous is None else _add(previous, counts).astype("int64")
+            )
+        return self
+
+    def merge(self, other: "DataProfile") -> "DataProfile":
+        self.rows += other.rows
+        self.dtypes.update(other.dtypes)
+        self.nulls = _add(self.nulls, other.nulls).astype("int64")
+        self.minimum = _fold(self.minimum, other.minimum, "min")
+        self.maximum = _fold(self.maximum, other.maximum, "max")
+        self.counts, self.mean, self.m2 = _combine(
+            self.counts, self.mean, self.m2, other.counts, other.mean, other.m2
+        )
+        self.true_counts = _add(self.true_counts, other.true_counts).astype("int64")
+        for col, first in other.first.items():
+            self.first[col] = min(self.first.get(col, first), first)
+        for col, last in other.last.items():
+            self.last[col] = max(self.last.get(col, last), last)
+        for col, counts in other.categories.items():
+            previous = self.categories.get(col)
+            self.categories[col] = (
+                counts if previous is None else _add(previous, counts).astype("int64")
+            )
+        return self
+
+    @property
+    def columns(self) -> list[str]:
+        return list(self.dtypes)
+
+    def null_rates(self) -> pd.Series:
+        return self.nulls / self.rows if self.rows else self.nulls.astype("float64")
+
+    def flag_rates(self) -> pd.Series:
+        return (
+            self.true_counts / self.rows
+            if self.rows
+            else self.true_counts.astype("float64")
+        )
+
+    def means(self) -> pd.Series:
+        return self.mean.where(self.counts > 0)
+
+    def stds(self) -> pd.Series:
+        return np.sqrt(self.m2 / self.counts.where(self.counts > 0))
+
+    def frequencies(self, column: str) -> pd.Series:
+        counts = self.categories.get(column, pd.Series(dtype="int64"))
+        total = counts.sum()
+        return counts / total if total else counts.astype("float64")
+
+    def summary(self) -> pd.DataFrame:
+        """One row per numeric column: nulls, min, max, mean and std."""
+        columns = self._columns("numeric")
+        return pd.DataFrame(
+            {
+                "nulls": self.nulls.reindex(columns),
+                "min": self.minimum.reindex(columns),
+                "max": self.maximum.reindex(columns),
+                "mean": self.means().reindex(columns),
+                "std": self.stds().reindex(columns),
+            }
+        )
+
+    def drift(
+        self,
+        baseline: "DataProfile",
+        null_threshold: float = 0.05,
+        rate_threshold: float = 0.05,
+        mean_threshold: float = 0.5,
+        psi_threshold: float = 0.2,
+    ) -> list[dict]:
+        """
+        Columns that moved away from `baseline`: null or flag rates changing by
+        more than the given absolute thresholds, numeric means shifting by more
+        than `mean_threshold` baseline standard deviations, category frequencies
+        with a population stability index above `psi_threshold`, and columns
+        that appeared or disappeared.
+        """
+        drifted = []
+
+        def record(column, metric, before, after, change):
+            drifted.append(
+                {
+                    "column": column,
+                    "metric": metric,
+                    "baseline": before,
+                    "current": after,
+                    "change": round(float(change), 4),
+                }
+            )
+
+        for col in sorted(set(baseline.columns) ^ set(self.columns)):
+            present = col in self.dtypes
+            record(col, "column", not present, present, 1.0)
+
+        shared = [col for col in self.columns if col in baseline.dtypes]
+        null_change = (self.null_rates() - baseline.null_rates()).reindex(shared)
+        for col, change in null_change[null_change.abs() > null_threshold].items():
+            record(
+                col,
+                "null_rate",
+                round(float(baseline.null_rates()[col]), 4),
+                round(float(self.null_rates()[col]), 4),
+                change,
+            )
+
+        flags = [col for col in self._columns("flag") if col in baseline.true_counts]
+        rate_change = (self.flag_rates() - baseline.flag_rates()).reindex(flags)
+        for col, change in rate_change[rate_change.abs() > rate_threshold].items():
+            record(
+                col,
+                "flag_rate",
+                round(float(baseline.flag_rates()[col]), 4),
+                round(float(self.flag_rates()[col]), 4),
+                change,
+            )
+
+        numeric = [col for col in self._columns("numeric") if col in baseline.mean]
+        before, after = baseline.means().reindex(numeric), self.means().reindex(numeric)
+        shift = ((after - before) / baseline.stds().reindex(numeric)).replace(
+            [np.inf, -np.inf], np.nan
+        )
+        for col, change in shift[shift.abs() > mean_threshold].items():
+            record(
+                col,
+                "mean",
+                round(float(before[col]), 4),
+                round(float(after[col]), 4),
+                change,
+            )
+
+        for col in self.categories:
+            if col not in baseline.categories:
+                continue
+            expected, actual = baseline.frequencies(col), self.frequencies(col)
+            index = expected.index.union(actual.index)
+            # Categories missing on one side get a small floor so the log is finite
+            expected = expected.reindex(index, fill_value=0).clip(lower=1e-4)
+            actual = actual.reindex(index, fill_value=0).clip(lower=1e-4)
+            psi = float(((actual - expected) * np.log(actual / expected)).sum())
+            if psi > psi_threshold:
+                record(col, "psi", _top(expected), _top(actual), psi)
+
+        for item in drifted:
+            print(
+                f"❌ {item['column']} {item['metric']}: "
+                f"{item['baseline']} -> {item['current']} ({item['change']:+})"
+            )
+        if not drifted:
+            print("✅ No drift from the baseline profile")
+        return drifted
+
+    def report(self, flags: int = 10, categories: int = 5):
+        """Prints the missing-value, flag-rate and category summary."""
+        print(f"Total records: {self.rows:,}")
+        for col in self._columns("datetime"):
+            if col in self.first:
+                print(f"{col} range: {self.first[col]} to {self.last[col]}")
+
+        missing = self.nulls[self.nulls > 0].sort_values(ascending=False)
+        if len(missing):
+            print("\n--- Missing Data Summary ---")
+            for col, count in missing.items():
+                print(f"{col}: {count:,} ({count / self.rows * 100:.2f}%)")
+
+        rates = self.true_counts[self.true_counts > 0].sort_values(ascending=False)
+        if len(rates):
+            print("\n--- Flag Rates ---")
+            for col, count in rates.head(flags).items():
+                print(f"{col}: {count:,} ({count / self.rows * 100:.2f}%)")
+
+        for col, counts in self.categories.items():
+            print(f"\n--- {col} ---")
+            for value, count in (
+                counts.sort_values(ascending=False).head(categories).items()
+            ):
+                print(f"{value}: {count:,} ({count / max(counts.sum(), 1) * 100:.2f}%)")
+
+    def to_dict(self) -> dict:
+        def floats(series: pd.Series) -> dict:
+            return {col: None if pd.isna(v) else float(v) for col, v in series.items()}
+
+        return {
+            "rows": self.rows,
+            "dtypes": self.dtypes,
+            "nulls": {col: int(v) for col, v in self.nulls.items()},
+            "minimum": floats(self.minimum),
+            "maximum": floats(self.maximum),
+            "counts": floats(self.counts),
+            "mean": floats(self.mean),
+            "m2": floats(self.m2),
+            "true_counts": {col: int(v) for col, v in self.true_counts.items()},
+            "first": {col: str(v) for col, v in self.first.items()},
+            "last": {col: str(v) for col, v in self.last.items()},
+            "categories": {
+                col: {value: int(v) for value, v in counts.items()}
+                for col, counts in self.categories.items()
+            },
+        }
+
+    def save(self, path: Union[str, Path]) -> Path:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(self.to_dict(), indent=1))
+        return path
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> "DataProfile":
+        data = json.loads(Path(path).read_text())
+        profile = cls()
+        profile.rows = data["rows"]
+        profile.dtypes = data["dtypes"]
+        profile.nulls = pd.Series(data["nulls"], dtype="int64")
+        for name in ("minimum", "maximum"):
+            setattr(profile, name, pd.Series(data[name], dtype="float64"))
+        if "total" in data:
+            # Profiles saved before M2 was tracked hold sums and sums of squares
+            total = pd.Series(data["total"], dtype="float64")
+            squares = pd.Series(data["squares"], dtype="float64")
+            counts = profile.rows - profile.nulls.reindex(total.index, fill_value=0)
+            profile.counts = counts.astype("float64")
+            profile.mean = total / counts.where(counts > 0)
+            profile.m2 = (squares - total * profile.mean).fillna(0).clip(lower=0)
+        else:
+            for name in ("counts", "mean", "m2"):
+                setattr(profile, name, pd.Series(data[name], dtype="float64"))
+        profile.true_counts = pd.Series(data["true_counts"], dtype="int64")
+        profile.first = {col: pd.Timestamp(v) for col, v in data["first"].items()}
+        profile.last = {col: pd.Timestamp(v) for col, v in data["last"].items()}
+        profile.categories = {
+            col: pd.Series(counts, dtype="int64")
+            for col, counts in data["categories"].items()
+        }
+        return profile
+
+
+def profile_path(data_path: Union[str, Path]) -> Path:
+    """`<stem>_profile.json` next to a dataset."""
+    data_path = Path(data_path)
+    return data_path.with_name(f"{data_path.stem}_profile.json")
+
+
+def profile_dataset(
+    path: Union[str, Path],
+    stage: Optional[str] = None,
+    batch_size: int = 250_000,
+) -> DataProfile:
+    """Profiles an intermediate in one streaming pass of `batch_size`-row frames."""
+    profile = DataProfile()
+    for df in iter_frames(path, stage=stage, batch_size=batch_size):
+        profile.update(df)
+    return profile
@@ -1,20 +1,119 @@
+import json
 from pathlib import Path
 from typing import Union
 
 import pandas as pd
 
+from preprocessing.storage import iter_frames
+
+CARRIER_COLUMN = "OP_UNIQUE_CARRIER"
+DESTINATION_COLUMN = "DEST_AIRPORT_ID"
+
+
+class RouteStats:
+    """
+    Exact flight counts per carrier + destination route, fed chunk by chunk.
+
+    Destination and carrier totals are derived from the route counts, so a few
+    thousand routes at most are kept however many flights go through `update`.
+    Partial results from parallel workers are combined with `merge`.
+    """
+
+    def __init__(self):
+        self.routes = pd.Series(
+            dtype="int64",
+            index=pd.MultiIndex.from_arrays(
+                [[], []], names=[CARRIER_COLUMN, DESTINATION_COLUMN]
+            ),
+        )
+
+    def update(self, df: pd.DataFrame) -> "RouteStats":
+        counts = df.groupby([CARRIER_COLUMN, DESTINATION_COLUMN]).size()
+        return self._add(counts)
+
+    def merge(self, other: "RouteStats") -> "RouteStats":
+        return self._add(other.routes)
+
+    def _add(self, counts: pd.Series) -> "RouteStats":
+        if len(counts):
+            self.routes = self.routes.add(counts, fill_value=0).astype("int64")
+        return self
+
+    @property
+    def flights(self) -> int:
+        return int(self.routes.sum())
+
+    @staticmethod
+    def _top(counts: pd.Series, k: int) -> pd.Series:
+        # Ties are broken by key so the ranking does not depend on feeding order
+        counts = counts.sort_index(kind="stable")
+        return counts.sort_values(ascending=False, kind="stable").head(k)
+
+    def top_destinations(self, k: int = 5) -> pd.Series:
+        counts = self.routes.groupby(level=DESTINATION_COLUMN).sum()
+        return self._top(counts, k).rename("count")
+
+    def top_carriers(self, k: int = 5) -> pd.Series:
+        counts = self.routes.groupby(level=CARRIER_COLUMN).sum()
+        return self._top(counts, k).rename("count")
+
+    def top_routes(self, k: int = 10) -> pd.DataFrame:
+        return (
+            self._top(self.routes, k)
+            .reset_index(name="Flight Count")
+            .rename(
+                columns={CARRIER_COLUMN: "Carrier", DESTINATION_COLUMN: "Destination"}
+            )
+        )
+
+    def save(self, path: Union[str, Path]) -> Path:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        routes = [
+            [carrier, int(destination), int(count)]
+            for (carrier, destination), count in self.routes.items()
+        ]
+        path.write_text(json.dumps({"routes": routes}, indent=1))
+        return path
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> "RouteStats":
+        routes = json.loads(Path(path).read_text())["routes"]
+        df = pd.DataFrame(routes, columns=[CARRIER_COLUMN, DESTINATION_COLUMN, "count"])
+        stats = cls()
+        return stats._add(df.set_index([CARRIER_COLUMN, DESTINATION_COLUMN])["count"])
+
+    def report(
+        self, k: int = 5, routes: int = 10
+    ) -> tuple[pd.Series, pd.Series, pd.DataFrame]:
+        """Prints and returns the top destinations, carriers and routes."""
+        top_destinations = self.top_destinations(k)
+        top_carriers = self.top_carriers(k)
+        route_counts = self.top_routes(routes)
+
+        print("Top 5 Destinations:\n", top_destinations)
+        print("\nTop 5 Airline Carriers:\n", top_carriers)
+        print("\nTop 5 Routes (Carrier + Destination):\n", route_counts)
+
+        return top_destinations, top_carriers, route_counts
+
 
 def analyze_flight_statistics(
-    data_file: Union[str, Path] = "dataset/processed/jfk_combined.csv",
+    data_file: Union[str, Path] = "dataset/processed/jfk_combined.parquet",
+    chunksize: int = 250_000,
 ) -> tuple[pd.Series, pd.Series, pd.DataFrame]:
     """
     Analyzes flight data and returns the top 5 destinations, airline carriers,
     and airline+destination route combinations.
 
+    The file is streamed in chunks of `chunksize` rows into a `RouteStats`. During
+    ingestion the same counts are collected by `amalgamate.scan_flight_data`, and
+    `amalgamate.scan_route_stats` computes them straight from the raw BTS files.
+
     Parameters:
     -----------
     data_file : str or Path
-        Path to the combined CSV file to analyze
+        Path to the combined dataset to analyze (CSV, Parquet or Feather)
 
     Returns:
     --------
@@ -24,36 +123,28 @@ def analyze_flight_statistics(
         - top_5_carriers: pd.Series
         - top_5_routes: pd.DataFrame with columns ['Carrier', 'Destination', 'Flight Count']
     """
-    df = pd.read_csv(data_file)
-
-    top_5_destinations = df["DEST_AIRPORT_ID"].value_counts().head(5)
+    stats = RouteStats()
+    for chunk in iter_frames(
+        data_file, columns=[CARRIER_COLUMN, DESTINATION_COLUMN], batch_size=chunksize
+    ):
+        stats.update(chunk)
 
-    top_5_carriers = df["OP_UNIQUE_CARRIER"].value_counts().head(5)
-
-    route_counts = (
-        df.groupby(["OP_UNIQUE_CARRIER", "DEST_AIRPORT_ID"])
-        .size()
-        .sort_values(ascending=False)
-        .reset_index(name="Flight Count")
-        .rename(
-            columns={"OP_UNIQUE_CARRIER": "Carrier", "DEST_AIRPORT_ID": "Destination"}
-        )
-        .head(10)
-    )
-
-    print("Top 5 Destinations:\n", top_5_destinations)
-    print("\nTop 5 Airline Carriers:\n", top_5_carriers)
-    print("\nTop 5 Routes (Carrier + Destination):\n", route_counts)
-
-    return top_5_destinations, top_5_carriers, route_counts
+    return stats.report()
 
 
 def check_class_imbalance_from_csv(
-    csv_path="dataset/processed/jfk_optimized.csv", target_col="label"
+    csv_path="dataset/processed/jfk_optimized.parquet",
+    target_col="label",
+    chunksize=250_000,
 ):
-    df = pd.read_csv(csv_path)
-    counts = df[target_col].value_counts()
-    percentages = df[target_col].value_counts(normalize=True) * 100
+    counts = pd.Series(dtype="int64")
+    for chunk in iter_frames(csv_path, columns=[target_col], batch_size=chunksize):
+        counts = counts.add(
+            chunk[target_col].astype(object).value_counts(), fill_value=0
+        )
+    counts = counts.astype("int64").sort_values(ascending=False).rename("count")
+    counts.index.name = target_col
+    percentages = (counts / counts.sum() * 100).rename("proportion")
     print(f"Class distribution for '{target_col}':\n")
     print("Counts:")
     print(counts)
@@ -0,0 +1,546 @@
+import shutil
+from pathlib import Path
+from typing import Iterator, Optional, Union
+
+import pandas as pd
+
+# Output format for pipeline intermediates: "parquet", "feather" or "csv".
+DEFAULT_FORMAT = "parquet"
+
+WIND_SPEED_LABELS = ["calm", "light", "moderate", "strong"]
+VISIBILITY_LABELS = ["very_poor", "poor", "marginal", "good", "excellent"]
+PRECIPITATION_LABELS = ["none", "trace", "light", "heavy"]
+PRESSURE_LABELS = ["very_low", "low", "normal", "high"]
+LABEL_CLASSES = ["delayed", "not_delayed"]
+
+# BTS columns consumed downstream by filter.py and prune.py.
+FLIGHT_COLUMN_DTYPES = {
+    "YEAR": "int16",
+    "MONTH": "int8",
+    "DAY_OF_MONTH": "int8",
+    "DAY_OF_WEEK": "int8",
+    "OP_UNIQUE_CARRIER": "object",
+    "ORIGIN_AIRPORT_ID": "int32",
+    "DEST_AIRPORT_ID": "int32",
+    "CRS_DEP_TIME": "float32",
+    "DEP_DELAY": "float32",
+    "CANCELLED": "float32",
+    "DIVERTED": "float32",
+    "CRS_ELAPSED_TIME": "float32",
+    "DISTANCE": "float32",
+}
+
+PRUNED_COLUMN_DTYPES = {
+    "year": "int16",
+    "month": "int8",
+    "day_of_month": "int8",
+    "day_of_week": "int8",
+    "carrier": "object",
+    "scheduled_departure_time": "float32",
+    "departure_delay": "float32",
+    "scheduled_elapsed_time": "float32",
+}
+
+WEATHER_COLUMN_DTYPES = {
+    "datetime": "datetime64[ns]",
+    "temperature": "float64",
+    "wind_direction": "float64",
+    "wind_speed": "float64",
+    "altimeter": "float64",
+    "pressure": "float64",
+    "precipitation": "float64",
+    "visibility": "float64",
+    "cloud_height": "float64",
+    "temperature_celsius": "float64",
+    "freezing_conditions": "bool",
+    "wind_speed_category": pd.CategoricalDtype(WIND_SPEED_LABELS, ordered=True),
+    "crosswind_component": "float64",
+    "min_crosswind_component": "float64",
+    "visibility_category": pd.CategoricalDtype(VISIBILITY_LABELS, ordered=True),
+    "cloud_coverage_score": "int64",
+    "ceiling_height": "float64",
+    "ifr_conditions": "bool",
+    "mvfr_conditions": "bool",
+    "has_precipitation": "bool",
+    "precipitation_category": pd.CategoricalDtype(PRECIPITATION_LABELS, ordered=True),
+    "low_pressure": "bool",
+    "pressure_category": pd.CategoricalDtype(PRESSURE_LABELS, ordered=True),
+}
+
+# Compact dtypes of the final ML datasets: float32 for continuous values, int8 for
+# small scores, bool for flags and categoricals for the binned columns.
+COMPACT_WEATHER_DTYPES = {
+    col: {"float64": "float32", "int64": "int8"}.get(dtype, dtype)
+    for col, dtype in WEATHER_COLUMN_DTYPES.items()
+    if col != "datetime"
+}
+
+OPTIMIZED_COLUMN_DTYPES = {
+    **COMPACT_WEATHER_DTYPES,
+    "scheduled_elapsed_time": "float32",
+    "label": pd.CategoricalDtype(LABEL_CLASSES),
+    "dep_min": "float32",
+    "dep_sin": "float32",
+    "dep_cos": "float32",
+    "day_of_year_sin": "float32",
+    "day_of_year_cos": "float32",
+    "part_of_month_early": "bool",
+    "part_of_month_mid": "bool",
+    "part_of_month_late": "bool",
+    "is_holiday_or_weekend": "bool",
+}
+
+ONE_HOT_PREFIXES = ["month_", "day_of_week_", "carrier_", "departure_bin_", "season_"]
+
+# In-memory layouts for the one-hot and `weather_*` flag columns. "sparse" stores
+# only the True positions, which pays off for the mostly-False dummies; files on
+# disk always hold the dense bool columns.
+ONE_HOT_LAYOUTS = ("dense", "sparse")
+
+# Pinned schema per pipeline stage: exact column dtypes plus dtypes for column
+# families identified by prefix (METAR weather flags and one-hot dummies).
+STAGE_SCHEMAS = {
+    "combined": {"columns": FLIGHT_COLUMN_DTYPES, "prefixes": {}},
+    "filtered": {"columns": FLIGHT_COLUMN_DTYPES, "prefixes": {}},
+    "pruned": {"columns": PRUNED_COLUMN_DTYPES, "prefixes": {}},
+    "weather": {
+        "columns": WEATHER_COLUMN_DTYPES,
+        "prefixes": {
+            "weather_": "bool",
+            "crosswind_runway_": "float64",
+            "history_": "float64",
+        },
+    },
+    "optimized": {
+        "columns": OPTIMIZED_COLUMN_DTYPES,
+        "prefixes": {
+            "weather_": "bool",
+            "crosswind_runway_": "float32",
+            "history_": "float32",
+            "delay_rate_": "float32",
+            **{prefix: "bool" for prefix in ONE_HOT_PREFIXES},
+        },
+    },
+    "clean": {
+        "columns": OPTIMIZED_COLUMN_DTYPES,
+        "prefixes": {
+            "weather_": "bool",
+            "crosswind_runway_": "float32",
+            "history_": "float32",
+            "delay_rate_": "float32",
+            **{prefix: "bool" for prefix in ONE_HOT_PREFIXES},
+        },
+    },
+}
+
+
+def stage_path(
+    directory: Union[str, Path], name: str, fmt: str = DEFAULT_FORMAT
+) -> Path:
+    """Builds `directory/name.<ext>` for the selected intermediate format."""
+    if fmt not in ("parquet", "feather", "csv"):
+        raise ValueError(f"Unsupported format {fmt!r}, use parquet, feather or csv")
+    return Path(directory) / f"{name}.{fmt}"
+
+
+def part_path(path: Union[str, Path], index: int) -> Path:
+    """`path/part-<index>.<ext>`, one part of a partitioned dataset directory."""
+    path = Path(path)
+    return path / f"part-{index:05d}{path.suffix}"
+
+
+def part_files(path: Union[str, Path]) -> list[Path]:
+    """
+    Part files of a partitioned dataset directory in order, or `[path]` for a
+    dataset stored as a single file.
+    """
+    path = Path(path)
+    if path.is_dir():
+        return sorted(path.glob(f"part-*{path.suffix}"))
+    return [path]
+
+
+def remove_dataset(path: Union[str, Path]):
+    """Deletes a dataset, whether a single file or a partitioned directory."""
+    path = Path(path)
+    if path.is_dir():
+        shutil.rmtree(path)
+    elif path.exists():
+        path.unlink()
+
+
+def _target_dtype(stage: str, column: str):
+    schema = STAGE_SCHEMAS[stage]
+    if column in schema["columns"]:
+        return schema["columns"][column]
+    for prefix, dtype in schema["prefixes"].items():
+        if column.startswith(prefix):
+            return dtype
+    return None
+
+
+def apply_schema(df: pd.DataFrame, stage: str) -> pd.DataFrame:
+    """
+    Casts the columns of `df` to the pinned dtypes for `stage`.
+
+    Columns that are not part of the schema are left untouched, integer or
+    boolean casts are skipped for columns that still contain missing values, and
+    sparse flag columns keep their sparse layout.
+    """
+    if stage not in STAGE_SCHEMAS:
+        raise ValueError(f"Unknown stage {stage!r}")
+
+    casts = {}
+    for col in df.columns:
+        dtype = _target_dtype(stage, col)
+        if dtype is None or df[col].dtype == dtype:
+            continue
+        if isinstance(df[col].dtype, pd.SparseDtype):
+            continue
+        if isinstance(dtype, str) and dtype.startswith(("int", "bool")):
+            if df[col].isna().any():
+                continue
+        casts[col] = dtype
+
+    if casts:
+        df = df.astype(casts)
+    return df
+
+
+def flag_columns(columns) -> list[str]:
+    """One-hot dummies and METAR `weather_*` flags among `columns`."""
+    prefixes = ("weather_",) + tuple(ONE_HOT_PREFIXES)
+    return [col for col in columns if col.startswith(prefixes)]
+
+
+def concat_aligned(frames: list[pd.DataFrame], stage: str) -> pd.DataFrame:
+    """
+    Concatenates frames whose one-hot and `weather_*` columns may differ, filling
+    flags missing from one side with False and re-pinning the stage schema.
+    """
+    df = pd.concat([frame for frame in frames if frame is not None], ignore_index=True)
+    for col in flag_columns(df.columns):
+        if df[col].isna().any():
+            df[col] = df[col].astype("boolean").fillna(False).astype(bool)
+    return apply_schema(df, stage)
+
+
+def align_columns(df: pd.DataFrame, columns: list[str]) -> pd.DataFrame:
+    """
+    Reindexes `df` to `columns`: flags it lacks are False, other missing columns
+    are NaN.
+    """
+    missing = flag_columns(col for col in columns if col not in df.columns)
+    if missing:
+        df = df.assign(**{col: False for col in missing})
+    return df.reindex(columns=columns)
+
+
+def set_flag_layout(df: pd.DataFrame, layout: str = "dense") -> pd.DataFrame:
+    """Converts the flag columns of `df` to the "dense" or "sparse" layout."""
+    if layout not in ONE_HOT_LAYOUTS:
+        raise ValueError(f"Unsupported layout {layout!r}, use dense or sparse")
+
+    casts = {}
+    for col in flag_columns(df.columns):
+        is_sparse = isinstance(df[col].dtype, pd.SparseDtype)
+        if layout == "sparse" and not is_sparse and df[col].dtype == bool:
+            casts[col] = pd.SparseDtype(bool, False)
+        elif layout == "dense" and is_sparse:
+            casts[col] = df[col].dtype.subtype
+
+    if casts:
+        df = df.astype(casts)
+    return df
+
+
+def memory_usage_mb(df: pd.DataFrame) -> float:
+    return df.memory_usage(deep=True).sum() / (1024**2)
+
+
+def print_memory_report(stage: str, before: float, after: float):
+    saved = (1 - after / before) * 100 if before else 0.0
+    print(f"💾 {stage} memory: {before:.2f} MB -> {after:.2f} MB (-{saved:.1f}%)")
+
+
+def compact_frame(
+    df: pd.DataFrame, stage: str, one_hot: str = "dense", report: bool = True
+) -> pd.DataFrame:
+    """
+    Downcasts `df` to the compact schema of `stage` and the requested flag layout,
+    printing the memory used before and after.
+    """
+    before = memory_usage_mb(df) if report else None
+    df = set_flag_layout(apply_schema(df, stage), one_hot)
+    if report:
+        print_memory_report(stage, before, memory_usage_mb(df))
+    return df
+
+
+def read_frame(
+    path: Union[str, Path],
+    stage: Optional[str] = None,
+    columns: Optional[list[str]] = None,
+    one_hot: str = "dense",
+) -> pd.DataFrame:
+    """
+    Loads an intermediate written by `write_frame`, dispatching on the file suffix.
+
+    With `one_hot="sparse"` the flag columns are returned as sparse bool columns.
+    A partitioned dataset directory is read part by part, each aligned to the
+    columns of the whole dataset.
+    """
+    path = Path(path)
+    if path.is_dir():
+        columns = columns or dataset_columns(path)
+        frames = [
+            align_columns(_read_file(part, _present(part, columns)), columns)
+            for part in part_files(path)
+        ]
+        df = pd.concat(frames, ignore_index=True)
+    else:
+        df = _read_file(path, columns)
+
+    if stage is not None:
+        df = apply_schema(df, stage)
+    if one_hot != "dense":
+        df = set_flag_layout(df, one_hot)
+    return df
+
+
+def _read_file(path: Path, columns: Optional[list[str]]) -> pd.DataFrame:
+    suffix = path.suffix.lower()
+    if suffix == ".parquet":
+        return pd.read_parquet(path, columns=columns)
+    if suffix == ".feather":
+        return pd.read_feather(path, columns=columns)
+    return pd.read_csv(path, usecols=columns)
+
+
+def file_columns(path: Union[str, Path]) -> list[str]:
+    """Column names of a single intermediate file, read from its schema or header."""
+    path = Path(path)
+    suffix = path.suffix.lower()
+    if suffix == ".parquet":
+        import pyarrow.parquet as pq
+
+        return pq.read_schema(path).names
+    if suffix == ".feather":
+        import pyarrow as pa
+
+        with pa.memory_map(str(path)) as source:
+            return pa.ipc.open_file(source).schema.names
+    return list(pd.read_csv(path, nrows=0).columns)
+
+
+def dataset_columns(path: Union[str, Path]) -> list[str]:
+    """
+    Columns of a dataset. Parts of a partitioned dataset may lack the flags of
+    phenomena or categories they never saw; the last part is written with every
+    column, and any found only in earlier parts are added after its own.
+    """
+    parts = part_files(path)
+    if not parts:
+        return []
+    columns = file_columns(parts[-1])
+    for part in parts[:-1]:
+        columns += [col for col in file_columns(part) if col not in columns]
+    return columns
+
+
+def _present(path: Path, columns: list[str]) -> list[str]:
+    available = set(file_columns(path))
+    return [col for col in columns if col in available]
+
+
+def iter_frames(
+    path: Union[str, Path],
+    stage: Optional[str] = None,
+    columns: Optional[list[str]] = None,
+    batch_size: int = 250_000,
+) -> Iterator[pd.DataFrame]:
+    """
+    Yields an intermediate in frames of at most `batch_size` rows, so it can be
+    processed without loading the whole file. The parts of a partitioned dataset
+    directory are yielded in order, aligned to the columns of the whole dataset.
+    """
+    path = Path(path)
+    if path.is_dir():
+        all_columns = columns or dataset_columns(path)
+        frames = (
+            align_columns(df, all_columns)
+            for part in part_files(path)
+            for df in _iter_file(part, _present(part, all_columns), batch_size)
+        )
+    else:
+        frames = _iter_file(path, columns, batch_size)
+
+    for df in frames:
+        yield apply_schema(df, stage) if stage is not None else df
+
+
+def _iter_file(
+    path: Path, columns: Optional[list[str]], batch_size: int
+) -> Iterator[pd.DataFrame]:
+    suffix = path.suffix.lower()
+
+    if suffix == ".parquet":
+        import pyarrow.parquet as pq
+
+        batches = pq.ParquetFile(path).iter_batches(
+            batch_size=batch_size, columns=columns
+        )
+        frames = (batch.to_pandas() for batch in batches)
+    elif suffix == ".feather":
+        import pyarrow as pa
+
+        def read_batches():
+            with pa.memory_map(str(path)) as source:
+                reader = pa.ipc.open_file(source)
+                for i in range(reader.num_record_batches):
+                    batch = reader.get_batch(i)
+                    if columns is not None:
+                        batch = batch.select(columns)
+                    for start in range(0, batch.num_rows, batch_size):
+                        yield batch.slice(start, batch_size).to_pandas()
+
+        frames = read_batches()
+    else:
+        frames = pd.read_csv(path, usecols=columns, chunksize=batch_size)
+    yield from frames
+
+
+def write_frame(
+    df: pd.DataFrame, path: Union[str, Path], stage: Optional[str] = None
+) -> Path:
+    """
+    Saves `df` in the format given by the suffix of `path`, pinned to `stage`,
+    replacing a partitioned dataset directory at `path`.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if path.is_dir():
+        remove_dataset(path)
+
+    if stage is not None:
+        df = apply_schema(df, stage)
+    df = set_flag_layout(df, "dense")
+
+    suffix = path.suffix.lower()
+    if suffix == ".parquet":
+        df.to_parquet(path, index=False)
+    elif suffix == ".feather":
+        df.reset_index(drop=True).to_feather(path)
+    else:
+        df.to_csv(path, index=False)
+    return path
+
+
+def count_rows(path: Union[str, Path]) -> Optional[int]:
+    """
+    Row count of a Parquet or Feather intermediate from its metadata, without
+    reading the data; None for CSV and missing files. A partitioned dataset
+    directory counts the rows of all its parts.
+    """
+    path = Path(path)
+    if path.is_dir():
+        counts = [count_rows(part) for part in part_files(path)]
+        return None if None in counts else sum(counts)
+    suffix = path.suffix.lower()
+    if not path.is_file():
+        return None
+    if suffix == ".parquet":
+        import pyarrow.parquet as pq
+
+        return pq.ParquetFile(path).metadata.num_rows
+    if suffix == ".feather":
+        import pyarrow as pa
+
+        with pa.memory_map(str(path)) as source:
+            reader = pa.ipc.open_file(source)
+            return sum(
+                reader.get_batch(i).num_rows for i in range(reader.num_record_batches)
+            )
+    return None
+
+
+def export_csv(
+    input_path: Union[str, Path], output_path: Optional[Union[str, Path]] = None
+) -> Path:
+    """Exports a columnar intermediate as CSV next to it (or to `output_path`)."""
+    input_path = Path(input_path)
+    output_path = Path(output_path or input_path.with_suffix(".csv"))
+    write_frame(read_frame(input_path), output_path)
+    print(f"📄 Exported {input_path.name} to {output_path}")
+    return output_path
+
+
+class FrameAppender:
+    """
+    Appends DataFrames to a single CSV, Parquet or Feather file as they arrive.
+
+    The first frame fixes the column order and the first non-empty frame fixes the
+    Arrow schema; later frames are reindexed and cast to match them.
+    """
+
+    def __init__(self, path: Union[str, Path], stage: Optional[str] = None):
+        self.path = Path(path)
+        self.stage = stage
+        self.columns = None
+        self.rows = 0
+        self._writer = None
+        self._schema = None
+        self._empty = None
+
+    def __enter__(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        remove_dataset(self.path)
+        return self
+
+    def append(self, df: pd.DataFrame):
+        first = self.columns is None
+        if first:
+            self.columns = list(df.columns)
+        df = df.reindex(columns=self.columns)
+        if self.stage is not None:
+            df = apply_schema(df, self.stage)
+
+        suffix = self.path.suffix.lower()
+        if suffix in (".parquet", ".feather"):
+            # Empty frames carry no values to infer Arrow types from, so the schema
+            # is taken from the first non-empty frame.
+            if df.empty and self._writer is None:
+                self._empty = df
+                return
+            self._write_table(df, suffix)
+        else:
+            df.to_csv(self.path, mode="a", header=first, index=False)
+
+        self.rows += len(df)
+
+    def _write_table(self, df: pd.DataFrame, suffix: str):
+        import pyarrow as pa
+
+        if self._writer is None:
+            self._schema = pa.Schema.from_pandas(df, preserve_index=False)
+            self._writer = self._open_writer(suffix, self._schema)
+        table = pa.Table.from_pandas(df, schema=self._schema, preserve_index=False)
+        self._writer.write_table(table)
+
+    def _open_writer(self, suffix, schema):
+        if suffix == ".parquet":
+            import pyarrow.parquet as pq
+
+            return pq.ParquetWriter(self.path, schema)
+
+        import pyarrow as pa
+
+        return pa.ipc.new_file(str(self.path), schema)
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._writer is None and self._empty is not None and exc_type is None:
+            self._write_table(self._empty, self.path.suffix.lower())
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        return False
@@ -0,0 +1,227 @@
+import json
+import pickle
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import numpy as np
+
+from preprocessing.delay_history import DELAY_RATE_PREFIX, DelayHistory
+from preprocessing.feature_store import FeatureStore
+from preprocessing.online import OnlineFeatureBuilder
+
+MODEL_PATH = "models/model.pkl"
+CLEAN_PATH = "dataset/processed/jfk_optimized_clean.parquet"
+WEATHER_PATH = "dataset/processed/jfk_weather_processed.parquet"
+# Daily outcomes behind the delay-rate features, saved by the optimize stage
+DELAY_HISTORY_PATH = "dataset/processed/jfk_optimized_delay_history.json"
+# Flights are joined to the stored observations of STATION like the training data
+# when the pipeline's feature store exists; otherwise the latest observation
+# posted to /weather is used.
+FEATURE_STORE_DIR = "dataset/processed/feature_store"
+STATION = 12478
+WEATHER_TOLERANCE = "2h"
+WEATHER_DIRECTION = "nearest"
+HOST = "127.0.0.1"
+PORT = 8080
+
+# Requests arriving within MAX_WAIT_MS of each other are scored together, up to
+# MAX_BATCH_SIZE flights per model call.
+MAX_BATCH_SIZE = 256
+MAX_WAIT_MS = 2.0
+
+
+def load_model(path):
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+def predict_scores(model, features: np.ndarray) -> np.ndarray:
+    """Delay probability per row, from `predict_proba` if the model has it."""
+    if hasattr(model, "predict_proba"):
+        return np.asarray(model.predict_proba(features))[:, 1]
+    return np.asarray(model.predict(features)).reshape(len(features))
+
+
+class MicroBatcher:
+    """
+    Collects flights from concurrent requests into one feature matrix and model
+    call, trading at most `max_wait_ms` of latency for per-call overhead. Requests
+    are encoded separately, so a malformed flight only fails its own request.
+    """
+
+    def __init__(
+        self,
+        builder: OnlineFeatureBuilder,
+        model,
+        max_batch_size: int = MAX_BATCH_SIZE,
+        max_wait_ms: float = MAX_WAIT_MS,
+    ):
+        self.builder = builder
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, flights: list[dict]) -> Future:
+        """Queues flights for scoring; the future resolves to their probabilities."""
+        future = Future()
+        self._queue.put((flights, future))
+        return future
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _collect(self, first) -> list:
+        pending = [first]
+        size = len(first[0])
+        deadline = time.perf_counter() + self.max_wait
+        while size < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)
+                break
+            pending.append(item)
+            size += len(item[0])
+        return pending
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            pending = self._collect(first)
+
+            encoded = []
+            for flights, future in pending:
+                try:
+                    encoded.append((self.builder.build_batch(flights), future))
+                except Exception as exc:
+                    future.set_exception(exc)
+            if not encoded:
+                continue
+
+            try:
+                scores = predict_scores(
+                    self.model, np.concatenate([rows for rows, _ in encoded])
+                )
+            except Exception as exc:
+                for _, future in encoded:
+                    future.set_exception(exc)
+                continue
+
+            start = 0
+            for rows, future in encoded:
+                future.set_result(scores[start : start + len(rows)].tolist())
+                start += len(rows)
+
+
+def make_handler(batcher: MicroBatcher):
+    class ScoringHandler(BaseHTTPRequestHandler):
+        def _reply(self, status: int, payload: dict):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/health":
+                self._reply(200, {"status": "ok"})
+            else:
+                self._reply(404, {"error": "not found"})
+
+        def do_POST(self):
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                payload = json.loads(self.rfile.read(length) or b"{}")
+            except ValueError as exc:
+                self._reply(400, {"error": f"invalid JSON: {exc}"})
+                return
+
+            if not isinstance(payload, dict):
+                self._reply(400, {"error": "expected a JSON object"})
+                return
+
+            if self.path == "/predict":
+                flights = payload.get("flights", [payload])
+                if not isinstance(flights, list) or not all(
+                    isinstance(flight, dict) for flight in flights
+                ):
+                    self._reply(400, {"error": "flights must be a list of objects"})
+                    return
+                if not flights:
+                    self._reply(200, {"delay_probability": []})
+                    return
+                try:
+                    scores = batcher.submit(flights).result()
+                except (KeyError, TypeError, ValueError) as exc:
+                    self._reply(400, {"error": f"invalid flight: {exc!r}"})
+                    return
+                except Exception as exc:
+                    # A failing model must not drop the connection without a reply
+                    self._reply(500, {"error": f"prediction failed: {exc!r}"})
+                    return
+                self._reply(200, {"delay_probability": scores})
+            elif self.path == "/weather":
+                try:
+                    batcher.builder.update_weather(payload)
+                except (KeyError, TypeError, ValueError) as exc:
+                    self._reply(400, {"error": f"invalid observation: {exc!r}"})
+                    return
+                except Exception as exc:
+                    self._reply(500, {"error": f"weather update failed: {exc!r}"})
+                    return
+                self._reply(200, {"status": "updated"})
+            else:
+                self._reply(404, {"error": "not found"})
+
+        def log_message(self, format, *args):
+            pass
+
+    return ScoringHandler
+
+
+def serve(builder: OnlineFeatureBuilder, model, host: str = HOST, port: int = PORT):
+    """
+    Serves `POST /predict` ({"flights": [...]} or a single flight), `POST /weather`
+    (a processed observation replacing the weather state) and `GET /health`.
+    """
+    batcher = MicroBatcher(builder, model)
+    server = ThreadingHTTPServer((host, port), make_handler(batcher))
+    print(f"Scoring server listening on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        batcher.close()
+
+
+if __name__ == "__main__":
+    builder = OnlineFeatureBuilder.from_dataset(CLEAN_PATH, WEATHER_PATH)
+    store = FeatureStore(FEATURE_STORE_DIR)
+    if store.weather_paths(STATION)[-1].exists():
+        builder.use_store(store, STATION, WEATHER_DIRECTION, WEATHER_TOLERANCE)
+    if Path(DELAY_HISTORY_PATH).exists():
+        builder.use_delay_history(DelayHistory.load(DELAY_HISTORY_PATH))
+    elif any(col.startswith(DELAY_RATE_PREFIX) for col in builder.columns):
+        # Without the history every delay-rate feature would be served as 0
+        raise FileNotFoundError(
+            f"The model uses delay-rate features but {DELAY_HISTORY_PATH} is missing"
+        )
+    serve(builder, load_model(MODEL_PATH))
@@ -0,0 +1,134 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from preprocessing.delay_history import (
+    DEFAULT_PRIOR,
+    PRIOR_WEIGHT,
+    DelayHistory,
+    delay_rate_column,
+    flight_days,
+)
+
+
+@pytest.fixture
+def flights():
+    rng = np.random.default_rng(7)
+    n = 400
+    dates = pd.Timestamp("2019-01-01") + pd.to_timedelta(
+        rng.integers(0, 60, n), unit="D"
+    )
+    return pd.DataFrame(
+        {
+            "year": dates.year,
+            "month": dates.month,
+            "day": dates.day,
+            "carrier": rng.choice(["AA", "B6", "DL"], n),
+            "departure_bin": rng.choice(["morning", "afternoon", "evening"], n),
+            "departure_delay": rng.normal(0, 20, n).round(),
+        }
+    )
+
+
+def _scan_rates(history_df, df):
+    """Delay rates by scanning every earlier flight, as a reference."""
+    days = flight_days(history_df)
+    delayed = (history_df["departure_delay"] > 0).to_numpy()
+    rates = {}
+    for i, day in enumerate(flight_days(df)):
+        earlier = days < day
+        prior = delayed[earlier].mean() if earlier.any() else DEFAULT_PRIOR
+        for group in ("carrier", "departure_bin"):
+            for window in (7, 30, None):
+                start = -np.inf if window is None else day - window
+                mask = (
+                    earlier
+                    & (days >= start)
+                    & (history_df[group] == df[group].iloc[i]).to_numpy()
+                )
+                rate = (delayed[mask].sum() + PRIOR_WEIGHT * prior) / (
+                    mask.sum() + PRIOR_WEIGHT
+                )
+                rates.setdefault(delay_rate_column(group, window), []).append(rate)
+    return pd.DataFrame(rates, index=df.index)
+
+
+def test_rates_match_scan_of_earlier_flights(flights):
+    history = DelayHistory().update(flights)
+    pd.testing.assert_frame_equal(history.rates(flights), _scan_rates(flights, flights))
+
+
+def test_delays_on_a_day_only_change_later_rates(flights):
+    day = flight_days(flights)
+    changed_day = np.sort(np.unique(day))[30]
+    changed = flights.copy()
+    changed.loc[day == changed_day, "departure_delay"] *= -1
+
+    before = DelayHistory().update(flights).rates(flights)
+    after = DelayHistory().update(changed).rates(flights)
+    pd.testing.assert_frame_equal(before[day <= changed_day], after[day <= changed_day])
+    # The all-time rates of every later flight include the flipped outcomes
+    later = day > changed_day
+    assert (before[later] != after[later]).any(axis=1).all()
+
+
+def test_windows_and_prior():
+    history = DelayHistory().update(
+        pd.DataFrame(
+            {
+                "year": 2019,
+                "month": 1,
+                "day": [1, 1, 2, 20, 25, 25],
+                "carrier": ["AA", "AA", "B6", "AA", "AA", "B6"],
+                "departure_bin": "morning",
+                "departure_delay": [10.0, -5.0, 30.0, 15.0, 0.0, -20.0],
+            }
+        )
+    )
+    flights = pd.DataFrame(
+        {
+            "year": 2019,
+            "month": 1,
+            "day": [1, 26, 26],
+            "carrier": ["AA", "AA", "ZZ"],
+            "departure_bin": "morning",
+        }
+    )
+    rates = history.rates(flights)
+
+    # Nothing is known before the first day: every rate is the default prior
+    assert (rates.iloc[0] == DEFAULT_PRIOR).all()
+
+    # Three of the six earlier flights were delayed
+    prior = 3 / 6
+
+    def shrunk(delayed, total):
+        return (delayed + PRIOR_WEIGHT * prior) / (total + PRIOR_WEIGHT)
+
+    # AA before Jan 26: Jan 1 (1 of 2 delayed), Jan 20 (delayed), Jan 25 (on time)
+    assert rates.loc[1, "delay_rate_carrier_7d"] == pytest.approx(shrunk(1, 2))
+    assert rates.loc[1, "delay_rate_carrier_30d"] == pytest.approx(shrunk(2, 4))
+    assert rates.loc[1, "delay_rate_carrier_all"] == pytest.approx(shrunk(2, 4))
+    # A carrier without history gets the prior in every window
+    for window in ("7d", "30d", "all"):
+        assert rates.loc[2, f"delay_rate_carrier_{window}"] == pytest.approx(prior)
+    # Jan 19 to 25 in the morning bin: Jan 20 (delayed), Jan 25 (both on time)
+    assert rates.loc[2, "delay_rate_departure_bin_7d"] == pytest.approx(shrunk(1, 3))
+
+
+def test_updates_and_saved_history_give_the_same_rates(flights, tmp_path):
+    days = flight_days(flights)
+    split = np.median(days)
+    incremental = DelayHistory().update(flights[days <= split])
+    incremental.update(flights[days > split])
+    loaded = DelayHistory.load(incremental.save(tmp_path / "history.json"))
+
+    expected = DelayHistory().update(flights).rates(flights)
+    pd.testing.assert_frame_equal(incremental.rates(flights), expected)
+    pd.testing.assert_frame_equal(loaded.rates(flights), expected)
+
+    row = flights.iloc[0]
+    single = loaded.flight_rates(
+        int(days[0]), {"carrier": row["carrier"], "departure_bin": row["departure_bin"]}
+    )
+    assert single == pytest.approx(expected.iloc[0].to_dict())
@@ -0,0 +1,110 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from preprocessing.feature_store import FeatureStore
+from preprocessing.optimize import merge_with_weather
+from preprocessing.storage import WIND_SPEED_LABELS
+
+STATION = 12478
+TOLERANCE = pd.Timedelta(hours=2)
+START = pd.Timestamp("2019-03-01")
+
+
+@pytest.fixture(scope="module")
+def weather():
+    rng = np.random.default_rng(11)
+    # Uneven gaps, some of them longer than twice the tolerance, and repeats
+    minutes = np.cumsum(rng.choice([0, 20, 60, 60, 90, 300], 120))
+    n = len(minutes)
+    return pd.DataFrame(
+        {
+            "datetime": START + pd.to_timedelta(minutes, unit="minutes"),
+            "temperature": rng.normal(5, 3, n).round(1),
+            "wind_speed_category": pd.Categorical(
+                rng.choice(WIND_SPEED_LABELS, n), WIND_SPEED_LABELS, ordered=True
+            ),
+            "weather_rain": rng.random(n) < 0.3,
+            "history_pressure_delta_1h": np.where(
+                rng.random(n) < 0.2, np.nan, rng.normal(0, 1, n).round(1)
+            ),
+        }
+    )
+
+
+@pytest.fixture(scope="module")
+def store(weather, tmp_path_factory):
+    store = FeatureStore(tmp_path_factory.mktemp("store"))
+    store.write_weather(STATION, weather)
+    return store
+
+
+@pytest.fixture(scope="module")
+def flights(weather):
+    rng = np.random.default_rng(12)
+    observed = weather["datetime"]
+    gaps = observed.diff().dropna()
+    midpoints = (observed.shift() + gaps / 2)[1:][gaps.dt.seconds % 120 == 0]
+    edge = pd.Timedelta(minutes=1)
+    times = pd.concat(
+        [
+            pd.Series(
+                START + pd.to_timedelta(rng.integers(-300, 12_000, 200), unit="minutes")
+            ),
+            observed,  # exact ties with an observation
+            midpoints,  # as close to the previous observation as to the next
+            observed + TOLERANCE,  # on the tolerance boundary
+            observed - TOLERANCE,
+            observed + TOLERANCE + edge,  # just outside it
+            observed - TOLERANCE - edge,
+        ],
+        ignore_index=True,
+    )
+    return pd.DataFrame(
+        {
+            "flight": np.arange(len(times)),
+            "year": times.dt.year,
+            "month": times.dt.month,
+            "day": times.dt.day,
+            "dep_min": times.dt.hour * 60 + times.dt.minute,
+        }
+    )
+
+
+@pytest.mark.parametrize("direction", ["nearest", "backward", "forward"])
+def test_weather_at_matches_merge(store, weather, flights, direction):
+    merged = merge_with_weather(flights.copy(), weather, direction=direction)
+    merged = merged.set_index("flight")
+    columns = [col for col in weather.columns if col != "datetime"]
+
+    matched = 0
+    for flight in flights.itertuples():
+        timestamp = pd.Timestamp(flight.year, flight.month, flight.day) + pd.Timedelta(
+            minutes=flight.dep_min
+        )
+        observation = store.weather_at(STATION, timestamp, direction, TOLERANCE)
+        if flight.flight not in merged.index:
+            assert observation is None, timestamp
+            continue
+        matched += 1
+        expected = merged.loc[flight.flight, columns]
+        actual = pd.Series(observation)[columns]
+        for col in ("temperature", "history_pressure_delta_1h"):
+            np.testing.assert_allclose(
+                float(actual[col]), float(expected[col]), rtol=1e-6, err_msg=col
+            )
+        assert actual["weather_rain"] == expected["weather_rain"]
+        assert actual["wind_speed_category"] == expected["wind_speed_category"]
+
+    assert 0 < matched < len(flights)
+
+
+def test_nearest_ties_go_to_the_earlier_observation(store, weather):
+    observed = weather["datetime"].drop_duplicates()
+    gaps = observed.diff()
+    later = observed[(gaps > pd.Timedelta(0)) & (gaps <= 2 * TOLERANCE)].iloc[0]
+    earlier = observed[observed < later].iloc[-1]
+    midpoint = earlier + (later - earlier) / 2
+    position = store.weather_position(STATION, midpoint, "nearest", TOLERANCE)
+    keys = store._weather_table(STATION).keys
+    assert pd.Timestamp(keys[position]) == earlier
@@ -0,0 +1,134 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from preprocessing.impute import (
+    StreamingMedian,
+    fill_missing_weather,
+    fit_imputation_values,
+    imputation_values_path,
+    impute_and_clean_dataset,
+    load_imputation_values,
+)
+from preprocessing.quality import DataProfile, profile_path
+from preprocessing.storage import read_frame, write_frame
+
+
+def _per_row_imputation(df):
+    """The per-row imputation fill_missing_weather replaced, as a reference."""
+    df = df.copy()
+    clouds = df[(df["cloud_height"].notna()) & (df["cloud_height"] != 99999)]
+    cloud_median = clouds["cloud_height"].median() if len(clouds) else 5000.0
+    df["cloud_height"] = df["cloud_height"].fillna(cloud_median)
+    df["wind_direction"] = df["wind_direction"].fillna(df["wind_direction"].median())
+
+    def calculate_crosswind(wind_dir, wind_speed, runway_heading=40):
+        if pd.isna(wind_dir) or pd.isna(wind_speed):
+            return np.nan
+        wind_angle = abs(wind_dir - runway_heading)
+        if wind_angle > 180:
+            wind_angle = 360 - wind_angle
+        return wind_speed * np.sin(np.radians(wind_angle))
+
+    for col, heading in [
+        ("crosswind_component", 40),
+        ("crosswind_runway_04", 40),
+        ("crosswind_runway_13", 130),
+    ]:
+        df[col] = df.apply(
+            lambda row, heading=heading: calculate_crosswind(
+                row["wind_direction"], row["wind_speed"], heading
+            ),
+            axis=1,
+        )
+    df["min_crosswind_component"] = df[
+        ["crosswind_runway_04", "crosswind_runway_13"]
+    ].min(axis=1, skipna=False)
+    return df.dropna()
+
+
+@pytest.fixture
+def optimized():
+    rng = np.random.default_rng(1)
+    n = 200
+    df = pd.DataFrame(
+        {
+            "wind_direction": rng.choice(np.arange(0, 370, 10), n).astype(float),
+            "wind_speed": rng.integers(0, 35, n).astype(float),
+            "cloud_height": rng.choice([800.0, 2500.0, 4200.0, 99999.0], n),
+            "temperature": rng.normal(10, 8, n),
+            "crosswind_component": np.nan,
+            "crosswind_runway_04": np.nan,
+            "crosswind_runway_13": np.nan,
+            "min_crosswind_component": np.nan,
+        }
+    )
+    for col, rate in [
+        ("wind_direction", 0.2),
+        ("wind_speed", 0.05),
+        ("cloud_height", 0.3),
+        ("temperature", 0.05),
+    ]:
+        df.loc[rng.random(n) < rate, col] = np.nan
+    return df
+
+
+def test_matches_per_row_imputation(optimized):
+    values = fit_imputation_values(optimized)
+    clean = fill_missing_weather(optimized.copy(), values).dropna()
+    expected = _per_row_imputation(optimized)
+    assert 0 < len(expected) < len(optimized)
+    pd.testing.assert_frame_equal(clean, expected)
+
+
+def test_cloud_median_ignores_the_no_ceiling_sentinel(optimized):
+    optimized["cloud_height"] = [99999.0, np.nan] * (len(optimized) // 2)
+    assert fit_imputation_values(optimized)["cloud_height"] == 5000.0
+
+
+def test_streaming_median_is_exact():
+    rng = np.random.default_rng(2)
+    values = rng.choice([10.0, 20.0, 25.0, 40.0, np.nan], 1001)
+    median = StreamingMedian()
+    for chunk in np.array_split(values, 7):
+        median.update(chunk)
+    assert median.median() == np.nanmedian(values)
+    assert median.update([np.nanmax(values)]).median() == np.nanmedian(
+        np.append(values, np.nanmax(values))
+    )
+
+
+def _impute(optimized, directory, chunksize):
+    directory.mkdir()
+    path = write_frame(optimized, directory / "optimized.parquet")
+    clean = impute_and_clean_dataset(path, chunksize=chunksize)
+    clean_path = directory / "optimized_clean.parquet"
+    return (
+        clean,
+        read_frame(clean_path, stage="clean"),
+        load_imputation_values(imputation_values_path(clean_path)),
+        DataProfile.load(profile_path(clean_path)),
+    )
+
+
+def test_chunked_matches_in_memory(optimized, tmp_path):
+    optimized["label"] = pd.Categorical(
+        np.where(optimized["wind_speed"] > 15, "delayed", "not_delayed")
+    )
+    clean, in_memory, values, profile = _impute(optimized, tmp_path / "memory", None)
+    nothing, chunked, chunked_values, chunked_profile = _impute(
+        optimized, tmp_path / "chunked", 37
+    )
+
+    assert nothing is None
+    pd.testing.assert_frame_equal(clean.reset_index(drop=True), in_memory)
+    assert chunked_values == values == fit_imputation_values(optimized)
+    pd.testing.assert_frame_equal(chunked, in_memory)
+    assert chunked_profile.rows == profile.rows
+    pd.testing.assert_series_equal(chunked_profile.nulls, profile.nulls)
+    pd.testing.assert_series_equal(
+        chunked_profile.categories["label"], profile.categories["label"]
+    )
+    # Moments are combined per chunk, so only agree to rounding
+    pd.testing.assert_series_equal(chunked_profile.means(), profile.means())
+    pd.testing.assert_series_equal(chunked_profile.stds(), profile.stds())
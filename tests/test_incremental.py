@@ -0,0 +1,115 @@
+import shutil
+
+import pandas as pd
+import pytest
+
+from benchmarks.synthetic import generate_raw_dataset
+from preprocessing.amalgamate import scan_flight_data
+from preprocessing.augment import preprocess_iem_weather_data
+from preprocessing.impute import (
+    imputation_values_path,
+    impute_and_clean_dataset,
+    load_imputation_values,
+)
+from preprocessing.incremental import incremental_update
+from preprocessing.optimize import preprocess_flight_data
+from preprocessing.quality import DataProfile, profile_path
+from preprocessing.storage import part_files, read_frame, write_frame
+
+ORIGIN_ID = 12478
+# The second run's observations start mid-day, so flights already in the
+# datasets are rejoined with them
+WEATHER_SPLIT = "2018-12-31 12:00"
+
+STAGES = {
+    "airline_filtered_pruned": "pruned",
+    "jfk_weather_processed": "weather",
+    "jfk_optimized": "optimized",
+    "jfk_optimized_clean": "clean",
+}
+
+
+def _full_build(raw, processed, imputation_values):
+    processed.mkdir()
+    weather = preprocess_iem_weather_data(
+        pd.read_csv(raw / "weather_2014_2024.csv"), workers=1
+    )
+    weather_path = write_frame(
+        weather, processed / "jfk_weather_processed.parquet", stage="weather"
+    )
+    pruned_path = processed / "airline_filtered_pruned.parquet"
+    scan_flight_data(raw, pruned_path, origin_id=ORIGIN_ID, workers=2)
+    optimized_path = processed / "jfk_optimized.parquet"
+    preprocess_flight_data(pruned_path, optimized_path, weather_path=weather_path)
+    impute_and_clean_dataset(optimized_path, imputation_values=imputation_values)
+
+
+@pytest.fixture(scope="module")
+def builds(tmp_path_factory):
+    root = tmp_path_factory.mktemp("incremental")
+    raw = root / "raw"
+    generate_raw_dataset(raw, scale=0.05, first_year=2018, last_year=2019, seed=5)
+
+    lines = (raw / "weather_2014_2024.csv").read_text().splitlines(keepends=True)
+    split = next(
+        i for i, line in enumerate(lines[1:], 1) if line.split(",")[1] >= WEATHER_SPLIT
+    )
+    incremental_raw = root / "incremental_raw"
+    incremental_raw.mkdir()
+    weather_file = incremental_raw / "weather_2014_2024.csv"
+    shutil.copytree(raw / "2018", incremental_raw / "2018")
+    weather_file.write_text("".join(lines[:split]))
+
+    processed = root / "incremental"
+    run = dict(
+        raw_data_path=incremental_raw,
+        weather_file=weather_file,
+        processed_dir=processed,
+        workers=2,
+    )
+    incremental_update(**run)
+    first_parts = {
+        name: part_files(processed / f"{name}.parquet")[0].stat().st_mtime_ns
+        for name in ("airline_filtered_pruned", "jfk_weather_processed")
+    }
+
+    shutil.copytree(raw / "2019", incremental_raw / "2019")
+    with open(weather_file, "a") as f:
+        f.write("".join(lines[split:]))
+    incremental_update(**run)
+
+    values_path = imputation_values_path(processed / "jfk_optimized_clean.parquet")
+    _full_build(raw, root / "full", load_imputation_values(values_path))
+    return processed, root / "full", first_parts
+
+
+@pytest.mark.parametrize("name", list(STAGES))
+def test_incremental_matches_full_build(builds, name):
+    processed, full, _ = builds
+    path = f"{name}.parquet"
+    assert len(part_files(processed / path)) > 1
+    pd.testing.assert_frame_equal(
+        read_frame(processed / path, stage=STAGES[name]),
+        read_frame(full / path, stage=STAGES[name]),
+    )
+
+
+def test_earlier_parts_are_not_rewritten(builds):
+    processed, _, first_parts = builds
+    for name, mtime_ns in first_parts.items():
+        part = part_files(processed / f"{name}.parquet")[0]
+        assert part.stat().st_mtime_ns == mtime_ns
+
+
+def test_profile_matches_full_build(builds):
+    processed, full, _ = builds
+    path = "jfk_optimized_clean.parquet"
+    incremental = DataProfile.load(profile_path(processed / path))
+    expected = DataProfile.load(profile_path(full / path))
+    assert incremental.rows == expected.rows
+    pd.testing.assert_series_equal(
+        incremental.nulls.sort_index(), expected.nulls.sort_index()
+    )
+    pd.testing.assert_series_equal(
+        incremental.means().sort_index(), expected.means().sort_index()
+    )
@@ -0,0 +1,73 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+from preprocessing.augment import (
+    INTENSITY_MAP,
+    WEATHER_PHENOMENA,
+    extract_weather_type_from_metar,
+)
+
+METARS = [
+    "KJFK 010051Z 24010KT 3SM -TSRA BR OVC024 01/M03 A2961 RMK AO2 SLP027",
+    "KJFK 010151Z 28027KT 10SM OVC042 M04/M10 A2975 RMK AO2 SLP074",
+    np.nan,
+    "KJFK 010351Z 33006KT 1/2SM +SN FZFG VV002 M02/M03 A2990",
+    "KJFK 010451Z 00000KT 2SM VCSH BCFG -FZDZ SCT010 02/01 A3001",
+    "",
+    "KJFK 010651Z 20012G20KT 5SM HZ FU BLSN SQ FEW250 30/20 A2990 RMK TSB05",
+    "KJFK 010051Z 24010KT 3SM -TSRA BR OVC024 01/M03 A2961 RMK AO2 SLP027",
+]
+
+
+def _per_row_weather_types(df):
+    """The per-row parse extract_weather_type_from_metar replaced, as a reference."""
+
+    def parse_weather_types(metar):
+        if pd.isna(metar):
+            return set()
+        found = set()
+        pattern = r"(-|\+|VC)?(MI|PR|BC|DR|BL|SH|TS|FZ)?([A-Z]{2})"
+        for intensity, descriptor, phenomenon in re.findall(pattern, metar):
+            if phenomenon in WEATHER_PHENOMENA:
+                name = WEATHER_PHENOMENA[phenomenon]
+                if intensity and intensity in INTENSITY_MAP:
+                    name = f"{INTENSITY_MAP[intensity]}_{name}"
+                if descriptor and descriptor in WEATHER_PHENOMENA:
+                    name = f"{WEATHER_PHENOMENA[descriptor]}_{name}"
+                found.add(name)
+        return found
+
+    df = df.copy()
+    weather_types = df["metar_report"].apply(parse_weather_types)
+    for weather_type in sorted(set().union(*weather_types)):
+        df[f"weather_{weather_type}"] = weather_types.apply(
+            lambda types, weather_type=weather_type: weather_type in types
+        )
+    return df
+
+
+def test_matches_per_row_parse():
+    df = pd.DataFrame({"metar_report": METARS, "temperature": np.arange(len(METARS))})
+    df.index = df.index * 10
+
+    flags = extract_weather_type_from_metar(df.copy())
+    expected = _per_row_weather_types(df)
+    pd.testing.assert_frame_equal(flags, expected)
+    assert flags["weather_thunderstorm_light_rain"].tolist() == [
+        True,
+        False,
+        False,
+        False,
+        False,
+        False,
+        False,
+        True,
+    ]
+
+
+def test_no_phenomena():
+    df = pd.DataFrame({"metar_report": [METARS[1], np.nan]})
+    flags = extract_weather_type_from_metar(df.copy())
+    pd.testing.assert_frame_equal(flags, df)
@@ -0,0 +1,72 @@
+import pandas as pd
+import pytest
+
+from benchmarks.synthetic import generate_raw_dataset
+from preprocessing.amalgamate import scan_flight_data
+from preprocessing.augment import preprocess_iem_weather_data
+from preprocessing.impute import impute_and_clean_dataset
+from preprocessing.optimize import preprocess_flight_data
+from preprocessing.partition import build_route_datasets
+from preprocessing.storage import read_frame, write_frame
+from training.datasets import time_ordered_split
+
+ORIGIN_ID = 12478
+ROUTE = {"origin": ORIGIN_ID, "destination": 12892, "carriers": ["AA", "B6", "DL"]}
+
+
+def _canonical(df: pd.DataFrame) -> pd.DataFrame:
+    """Rows in a fixed order, so flights departing in the same minute compare equal."""
+    return df.sort_values(list(df.columns), kind="stable").reset_index(drop=True)
+
+
+@pytest.fixture(scope="module")
+def datasets(tmp_path_factory):
+    root = tmp_path_factory.mktemp("routes")
+    raw = root / "raw"
+    generate_raw_dataset(raw, scale=0.1, first_year=2019, last_year=2019, seed=7)
+
+    weather_path = root / "weather.parquet"
+    weather = preprocess_iem_weather_data(
+        pd.read_csv(raw / "weather_2014_2024.csv"), workers=1
+    )
+    write_frame(weather, weather_path, stage="weather")
+
+    pruned_path = root / "pruned.parquet"
+    optimized_path = root / "optimized.parquet"
+    scan_flight_data(
+        raw,
+        pruned_path,
+        origin_id=ORIGIN_ID,
+        carriers=ROUTE["carriers"],
+        destination=ROUTE["destination"],
+        workers=2,
+    )
+    preprocess_flight_data(pruned_path, optimized_path, weather_path=weather_path)
+    impute_and_clean_dataset(optimized_path)
+    single = read_frame(root / "optimized_clean.parquet", stage="clean")
+
+    clean_paths = build_route_datasets(
+        raw,
+        [ROUTE],
+        {ORIGIN_ID: weather_path},
+        output_dir=root / "routes",
+        partitions_dir=root / "partitions",
+        workers=2,
+    )
+    route = read_frame(next(iter(clean_paths.values())), stage="clean")
+    return single, route
+
+
+def test_route_dataset_matches_single_route(datasets):
+    single, route = datasets
+    assert list(route.columns) == list(single.columns)
+    pd.testing.assert_frame_equal(_canonical(route), _canonical(single))
+
+
+def test_route_dataset_is_time_ordered(datasets):
+    single, route = datasets
+    split = time_ordered_split(len(single))
+    assert len(route) == len(single)
+    pd.testing.assert_frame_equal(
+        _canonical(route.iloc[split:]), _canonical(single.iloc[split:])
+    )
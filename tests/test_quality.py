@@ -0,0 +1,85 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from preprocessing.quality import DataProfile
+
+
+@pytest.fixture
+def frame():
+    rng = np.random.default_rng(3)
+    n = 10_000
+    df = pd.DataFrame(
+        {
+            # Epoch-like magnitude with a spread of a few tenths: the sum of squares
+            # is ~1e22 and its difference from n * mean ** 2 is lost in float64
+            "timestamp": 1.5e9 + rng.normal(0, 0.3, n),
+            "temperature": rng.normal(10, 8, n),
+            "sparse": np.where(np.arange(n) < n // 2, np.nan, rng.normal(0, 1, n)),
+        }
+    )
+    df.loc[rng.random(n) < 0.1, "temperature"] = np.nan
+    return df
+
+
+def _chunks(df, n):
+    bounds = np.linspace(0, len(df), n + 1).astype(int)
+    return [df.iloc[start:stop] for start, stop in zip(bounds[:-1], bounds[1:])]
+
+
+def _expected(df):
+    return df.mean(), df.std(ddof=0)
+
+
+def test_moments_of_large_values_across_chunks(frame):
+    profile = DataProfile()
+    # The first chunks have no values in "sparse"
+    for chunk in _chunks(frame, 13):
+        profile.update(chunk)
+
+    means, stds = _expected(frame)
+    pd.testing.assert_series_equal(profile.means(), means, rtol=1e-12)
+    pd.testing.assert_series_equal(profile.stds(), stds, rtol=1e-9)
+
+
+def test_merged_and_loaded_profiles_agree(frame, tmp_path):
+    whole = DataProfile().update(frame)
+    parts = [DataProfile().update(chunk) for chunk in _chunks(frame, 4)]
+    merged = parts[0]
+    for part in parts[1:]:
+        merged.merge(part)
+    loaded = DataProfile.load(merged.save(tmp_path / "profile.json"))
+
+    for profile in (merged, loaded):
+        assert profile.rows == whole.rows
+        pd.testing.assert_series_equal(profile.means(), whole.means(), rtol=1e-12)
+        pd.testing.assert_series_equal(profile.stds(), whole.stds(), rtol=1e-9)
+    assert merged.drift(whole) == []
+
+
+def test_loads_profiles_saved_with_sums(frame, tmp_path):
+    values = frame[["temperature"]].dropna()
+    path = tmp_path / "old_profile.json"
+    path.write_text(
+        json.dumps(
+            {
+                "rows": len(values),
+                "dtypes": {"temperature": "float64"},
+                "nulls": {"temperature": 0},
+                "minimum": {"temperature": float(values.min().iloc[0])},
+                "maximum": {"temperature": float(values.max().iloc[0])},
+                "total": {"temperature": float(values.sum().iloc[0])},
+                "squares": {"temperature": float((values**2).sum().iloc[0])},
+                "true_counts": {},
+                "first": {},
+                "last": {},
+                "categories": {},
+            }
+        )
+    )
+    means, stds = _expected(values)
+    profile = DataProfile.load(path)
+    pd.testing.assert_series_equal(profile.means(), means, rtol=1e-9)
+    pd.testing.assert_series_equal(profile.stds(), stds, rtol=1e-9)
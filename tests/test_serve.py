@@ -0,0 +1,125 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+from http.server import ThreadingHTTPServer
+
+import numpy as np
+import pytest
+
+from preprocessing.online import OnlineFeatureBuilder
+from serve import MicroBatcher, make_handler
+
+COLUMNS = [
+    "scheduled_elapsed_time",
+    "dep_min",
+    "month_1",
+    "carrier_AA",
+    "carrier_B6",
+    "temperature",
+]
+FLIGHT = {
+    "carrier": "AA",
+    "date": "2019-01-15",
+    "scheduled_departure_time": 830,
+    "scheduled_elapsed_time": 190,
+}
+
+
+class SumModel:
+    """Scores each row by its feature sum, remembering the size of every call."""
+
+    def __init__(self):
+        self.calls = []
+
+    def predict(self, features):
+        self.calls.append(len(features))
+        return features.sum(axis=1)
+
+
+class FailingModel:
+    def predict(self, features):
+        raise RuntimeError("model unavailable")
+
+
+def _builder():
+    builder = OnlineFeatureBuilder(
+        COLUMNS, {}, {"cloud_height": 5000.0, "wind_direction": 200.0}
+    )
+    builder.update_weather({"temperature": 3.0})
+    return builder
+
+
+@pytest.fixture
+def server():
+    servers = []
+
+    def start(model):
+        batcher = MicroBatcher(_builder(), model, max_wait_ms=20)
+        httpd = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(batcher))
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+        servers.append((httpd, batcher))
+        return httpd.server_address[1]
+
+    yield start
+    for httpd, batcher in servers:
+        httpd.shutdown()
+        httpd.server_close()
+        batcher.close()
+
+
+def _post(port, path, payload):
+    request = urllib.request.Request(
+        f"http://127.0.0.1:{port}{path}", data=json.dumps(payload).encode()
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=5) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as exc:
+        return exc.code, json.loads(exc.read())
+
+
+def test_bad_request_only_fails_itself():
+    model = SumModel()
+    batcher = MicroBatcher(_builder(), model, max_wait_ms=200)
+    try:
+        good = batcher.submit([FLIGHT, dict(FLIGHT, carrier="B6")])
+        bad = batcher.submit([dict(FLIGHT, date="2019-02-30")])
+        missing = batcher.submit([{"carrier": "AA"}])
+        other = batcher.submit([dict(FLIGHT, scheduled_elapsed_time=60)])
+        results = good.result(timeout=5), other.result(timeout=5)
+        with pytest.raises(ValueError):
+            bad.result(timeout=5)
+        with pytest.raises(KeyError):
+            missing.result(timeout=5)
+    finally:
+        batcher.close()
+
+    builder = _builder()
+    expected = [
+        builder.build_batch([FLIGHT, dict(FLIGHT, carrier="B6")]).sum(axis=1),
+        builder.build(dict(FLIGHT, scheduled_elapsed_time=60)).sum(keepdims=True),
+    ]
+    for scores, values in zip(results, expected):
+        np.testing.assert_allclose(scores, values, rtol=1e-6)
+    # The valid requests were still scored together, in one model call
+    assert model.calls == [3]
+
+
+def test_predict_replies(server):
+    port = server(SumModel())
+    assert _post(port, "/predict", {"flights": []}) == (
+        200,
+        {"delay_probability": []},
+    )
+    status, body = _post(port, "/predict", FLIGHT)
+    assert status == 200 and len(body["delay_probability"]) == 1
+    status, body = _post(port, "/predict", {"flights": [FLIGHT, {"carrier": "AA"}]})
+    assert status == 400 and body["error"].startswith("invalid flight")
+
+
+def test_model_failure_is_a_server_error(server):
+    port = server(FailingModel())
+    status, body = _post(port, "/predict", {"flights": [FLIGHT]})
+    assert status == 500
+    assert "model unavailable" in body["error"]
@@ -0,0 +1,90 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmarks.synthetic import generate_raw_dataset
+from preprocessing.amalgamate import scan_flight_data
+from preprocessing.augment import (
+    WEATHER_HISTORY_PREFIX,
+    add_weather_history,
+    preprocess_iem_weather_data,
+)
+from preprocessing.impute import impute_and_clean_dataset
+from preprocessing.optimize import preprocess_flight_data
+from preprocessing.storage import read_frame, write_frame
+
+ORIGIN_ID = 12478
+
+
+def _clean_dataset(root, raw, pruned_path, history_windows) -> pd.DataFrame:
+    root.mkdir()
+    weather_path = root / "weather.parquet"
+    weather = preprocess_iem_weather_data(
+        pd.read_csv(raw / "weather_2014_2024.csv"),
+        history_windows=history_windows,
+        workers=1,
+    )
+    write_frame(weather, weather_path, stage="weather")
+    optimized_path = root / "optimized.parquet"
+    preprocess_flight_data(pruned_path, optimized_path, weather_path=weather_path)
+    impute_and_clean_dataset(optimized_path)
+    return read_frame(root / "optimized_clean.parquet", stage="clean")
+
+
+@pytest.fixture(scope="module")
+def datasets(tmp_path_factory):
+    root = tmp_path_factory.mktemp("history")
+    raw = root / "raw"
+    generate_raw_dataset(raw, scale=0.05, first_year=2018, last_year=2019, seed=3)
+    pruned_path = root / "pruned.parquet"
+    scan_flight_data(
+        raw,
+        pruned_path,
+        origin_id=ORIGIN_ID,
+        carriers=["AA", "B6", "DL"],
+        destination=12892,
+        workers=2,
+    )
+    with_history = _clean_dataset(root / "with", raw, pruned_path, ("1h", "3h", "6h"))
+    without_history = _clean_dataset(root / "without", raw, pruned_path, ())
+    return with_history, without_history
+
+
+def test_history_columns_drop_no_clean_rows(datasets):
+    with_history, without_history = datasets
+    history = [c for c in with_history.columns if c.startswith(WEATHER_HISTORY_PREFIX)]
+    assert history
+    assert len(with_history) == len(without_history)
+    pd.testing.assert_frame_equal(
+        with_history.drop(columns=history), without_history, check_like=True
+    )
+
+
+def test_deltas_compare_with_the_report_before_the_window():
+    weather = pd.DataFrame(
+        {
+            "datetime": pd.to_datetime(
+                [
+                    "2019-01-01 00:51",
+                    "2019-01-01 01:51",
+                    "2019-01-01 02:51",
+                    "2019-01-01 03:51",
+                    "2019-01-01 04:51",
+                ]
+            ),
+            "pressure": [1010.0, 1012.0, np.nan, 1011.0, 1015.0],
+        }
+    )
+    history = add_weather_history(weather, windows=("1h", "3h"))
+    np.testing.assert_array_equal(
+        history["history_pressure_delta_1h"], [np.nan, 2.0, np.nan, -1.0, 4.0]
+    )
+    np.testing.assert_array_equal(
+        history["history_pressure_delta_3h"], [np.nan, np.nan, np.nan, 1.0, 3.0]
+    )
+
+
+def test_hourly_deltas_vary(datasets):
+    with_history, _ = datasets
+    for col in ("history_pressure_delta_1h", "history_temperature_delta_1h"):
+        assert with_history[col].std() > 0
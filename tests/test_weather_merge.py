@@ -0,0 +1,105 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from preprocessing.optimize import merge_with_weather
+
+# The second 09:51 report duplicates the first one's timestamp and is ignored
+WEATHER = pd.DataFrame(
+    {
+        "datetime": pd.to_datetime(
+            [
+                "2019-01-01 08:51",
+                "2019-01-01 09:51",
+                "2019-01-01 09:51",
+                "2019-01-01 12:51",
+            ]
+        ),
+        "temperature": [1.0, 2.0, 99.0, 4.0],
+        "weather_rain": [False, True, False, False],
+        "history_pressure_delta_1h": [0.5, 1.5, 9.0, -2.0],
+    }
+)
+
+# 11:21 is 1h30 from both 09:51 and 12:51; 15:30 and 06:00 have no report in 2h
+FLIGHTS = pd.DataFrame(
+    {
+        "flight": [0, 1, 2, 3, 4],
+        "year": 2019,
+        "month": 1,
+        "day": 1,
+        "dep_min": [9 * 60, 9 * 60 + 30, 11 * 60 + 21, 15 * 60 + 30, 6 * 60],
+    }
+)
+
+
+@pytest.mark.parametrize(
+    "direction, temperature, rain, history",
+    [
+        ("nearest", [1.0, 2.0, 2.0], [False, True, True], [0.5, 0.5, 1.5]),
+        ("backward", [1.0, 1.0, 2.0], [False, False, True], [0.5, 0.5, 1.5]),
+        ("forward", [2.0, 2.0, 4.0], [True, True, False], [0.5, 0.5, 1.5]),
+    ],
+)
+def test_merge_with_weather(direction, temperature, rain, history):
+    merged = merge_with_weather(FLIGHTS.copy(), WEATHER, direction=direction)
+    expected = pd.DataFrame(
+        {
+            "flight": [0, 1, 2],
+            "year": 2019,
+            "month": 1,
+            "day": 1,
+            "dep_min": [540, 570, 681],
+            "flight_datetime": pd.to_datetime(
+                ["2019-01-01 09:00", "2019-01-01 09:30", "2019-01-01 11:21"]
+            ),
+            "temperature": temperature,
+            "weather_rain": rain,
+            # Always the latest report at or before departure
+            "history_pressure_delta_1h": history,
+        }
+    )
+    # Flags come out of the as-of join as objects until the stage schema is applied
+    pd.testing.assert_frame_equal(merged, expected, check_dtype=False)
+
+
+def _closest_observation_loop(flight_df, weather_df):
+    """The row-by-row scan merge_with_weather replaced, as a reference."""
+    weather_df = weather_df.sort_values("datetime", kind="stable").reset_index(
+        drop=True
+    )
+    rows = []
+    for _, flight in flight_df.iterrows():
+        time_diff = abs(weather_df["datetime"] - flight["flight_datetime"])
+        closest = time_diff.idxmin()
+        if time_diff.iloc[closest] <= pd.Timedelta(hours=2):
+            rows.append((flight["flight"], weather_df.loc[closest, "temperature"]))
+    return pd.DataFrame(rows, columns=["flight", "temperature"])
+
+
+def test_nearest_matches_closest_observation_scan():
+    rng = np.random.default_rng(0)
+    times = pd.Timestamp("2019-01-01") + pd.to_timedelta(
+        np.sort(rng.integers(0, 3 * 24 * 60, 60)), unit="minutes"
+    )
+    weather = pd.DataFrame({"datetime": times, "temperature": rng.normal(size=60)})
+    flights = pd.DataFrame(
+        {
+            "flight": np.arange(300),
+            "year": 2019,
+            "month": 1,
+            "day": rng.integers(1, 4, 300),
+            "dep_min": rng.integers(0, 1440, 300),
+        }
+    )
+    flights["flight_datetime"] = pd.to_datetime(
+        flights[["year", "month", "day"]]
+    ) + pd.to_timedelta(flights["dep_min"], unit="minutes")
+    flights = flights.sort_values("flight_datetime", kind="stable")
+
+    merged = merge_with_weather(flights.copy(), weather)
+    expected = _closest_observation_loop(flights, weather)
+    assert 0 < len(expected) < len(flights)
+    pd.testing.assert_frame_equal(
+        merged[["flight", "temperature"]], expected, check_dtype=False
+    )
@@ -0,0 +1,43 @@
+import pandas as pd
+
+from benchmarks.synthetic import generate_iem_weather
+from preprocessing.augment import concat_weather_shards, preprocess_iem_weather_data
+
+
+def test_sharded_matches_serial():
+    raw = generate_iem_weather("2019-01-01", "2019-03-01", seed=4)
+    serial = preprocess_iem_weather_data(raw.copy(), workers=1)
+    sharded = preprocess_iem_weather_data(raw.copy(), workers=4, shard_rows=300)
+    pd.testing.assert_frame_equal(sharded, serial)
+
+
+def test_shard_flags_are_unioned_in_serial_position():
+    first = pd.DataFrame(
+        {
+            "datetime": pd.to_datetime(["2019-01-01 00:51", "2019-01-01 01:51"]),
+            "weather_rain": [True, False],
+            "temperature_celsius": [1.0, 2.0],
+        },
+        index=[0, 1],
+    )
+    second = pd.DataFrame(
+        {
+            "datetime": pd.to_datetime(["2019-01-01 02:51"]),
+            "weather_mist": [True],
+            "weather_snow": [False],
+            "temperature_celsius": [3.0],
+        },
+        index=[2],
+    )
+    expected = pd.DataFrame(
+        {
+            "datetime": pd.to_datetime(
+                ["2019-01-01 00:51", "2019-01-01 01:51", "2019-01-01 02:51"]
+            ),
+            "weather_mist": [False, False, True],
+            "weather_rain": [True, False, False],
+            "weather_snow": [False, False, False],
+            "temperature_celsius": [1.0, 2.0, 3.0],
+        }
+    )
+    pd.testing.assert_frame_equal(concat_weather_shards([first, second]), expected)
@@ -0,0 +1,95 @@
+import shutil
+import time
+
+from training.datasets import BinnedDatasets
+from training.models import LIBRARIES, evaluate, train_model
+from training.search import hyperband
+
+CLEAN_PATH = "dataset/processed/jfk_optimized_clean.parquet"
+MODEL_DIR = "models"
+
+# Binned datasets are cached per dataset fingerprint under TRAINING_CACHE_DIR, so
+# repeat runs skip parsing and binning.
+TRAINING_CACHE_DIR = "dataset/processed/.cache/training"
+VALID_FRACTION = 0.2
+MAX_BIN = 255
+
+# The latest TEST_FRACTION of flights are held out from early stopping, the search
+# and the model choice; the final metrics are reported on them.
+TEST_FRACTION = 0.1
+
+NUM_BOOST_ROUND = 1000
+EARLY_STOPPING_ROUNDS = 50
+PARAMS = {
+    "lightgbm": {"learning_rate": 0.05, "num_leaves": 63},
+    "xgboost": {"eta": 0.05, "max_depth": 8},
+    "catboost": {"learning_rate": 0.05, "depth": 8},
+}
+
+# Tune each booster with Hyperband before the final training, replacing PARAMS and
+# NUM_BOOST_ROUND with the best trial. Trials run on SEARCH_JOBS processes.
+SEARCH = False
+SEARCH_MIN_ROUNDS = 25
+SEARCH_ETA = 3
+SEARCH_JOBS = None
+
+if __name__ == "__main__":
+    datasets = BinnedDatasets(
+        CLEAN_PATH,
+        cache_dir=TRAINING_CACHE_DIR,
+        valid_fraction=VALID_FRACTION,
+        max_bin=MAX_BIN,
+        test_fraction=TEST_FRACTION,
+    )
+    valid_features, valid_labels = datasets.arrays()["valid"]
+    test_features, test_labels = datasets.arrays()["test"]
+
+    results = {}
+    for library in LIBRARIES:
+        start = time.perf_counter()
+        datasets.build(library)
+        binned = time.perf_counter()
+
+        params, num_boost_round = PARAMS.get(library), NUM_BOOST_ROUND
+        if SEARCH:
+            print(f"🔍 Searching {library} hyperparameters...")
+            best_trial = hyperband(
+                library,
+                datasets,
+                max_rounds=NUM_BOOST_ROUND,
+                min_rounds=SEARCH_MIN_ROUNDS,
+                eta=SEARCH_ETA,
+                early_stopping_rounds=EARLY_STOPPING_ROUNDS,
+                n_jobs=SEARCH_JOBS,
+            )
+            params = best_trial["params"]
+            num_boost_round = best_trial["num_boost_round"]
+            print(
+                f"   {best_trial['trials']} trials in {time.perf_counter() - binned:.1f}s"
+                f" ({best_trial['trial_seconds']:.1f}s of training), best validation AUC "
+                f"{best_trial['auc']:.4f} at {num_boost_round} rounds: {params}"
+            )
+        searched = time.perf_counter()
+
+        model = train_model(
+            library,
+            datasets,
+            params=params,
+            num_boost_round=num_boost_round,
+            early_stopping_rounds=EARLY_STOPPING_ROUNDS,
+        )
+        trained = time.perf_counter()
+
+        # The model is chosen on the validation fold and reported on the test fold
+        results[library] = evaluate(model, valid_features, valid_labels)
+        metrics = evaluate(model, test_features, test_labels)
+        model.save(f"{MODEL_DIR}/{library}.pkl")
+        print(
+            f"✅ {library}: test AUC {metrics['auc']:.4f}, "
+            f"logloss {metrics['logloss']:.4f} "
+            f"(datasets {binned - start:.1f}s, training {trained - searched:.1f}s)"
+        )
+
+    best = max(results, key=lambda library: results[library]["auc"])
+    shutil.copyfile(f"{MODEL_DIR}/{best}.pkl", f"{MODEL_DIR}/model.pkl")
+    print(f"\n🏆 Best model: {best}, copied to {MODEL_DIR}/model.pkl for serve.py")
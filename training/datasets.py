@@ -0,0 +1,234 @@
+import json
+from pathlib import Path
+from typing import Union
+
+import numpy as np
+
+from preprocessing import matrix, online
+from preprocessing.cache import StageCache
+from preprocessing.matrix import export_feature_matrix, load_feature_matrix
+
+SPLITS = ("train", "valid", "test")
+
+
+def time_ordered_split(n_rows: int, valid_fraction: float = 0.2) -> int:
+    """
+    Row where the validation fold starts. The clean dataset is ordered by
+    departure time, so the last `valid_fraction` of rows are the latest flights.
+    """
+    if not 0 < valid_fraction < 1:
+        raise ValueError(f"valid_fraction must be in (0, 1), got {valid_fraction}")
+    return int(round(n_rows * (1 - valid_fraction)))
+
+
+def time_ordered_splits(
+    n_rows: int, valid_fraction: float = 0.2, test_fraction: float = 0.0
+) -> tuple[int, int]:
+    """
+    Rows where the validation and test folds start: the latest `test_fraction`
+    of flights are the test fold and the `valid_fraction` before them the
+    validation fold.
+    """
+    if not 0 <= test_fraction < 1:
+        raise ValueError(f"test_fraction must be in [0, 1), got {test_fraction}")
+    if not 0 < valid_fraction < 1 - test_fraction:
+        raise ValueError(
+            f"valid_fraction must be in (0, {1 - test_fraction:g}), got {valid_fraction}"
+        )
+    test_start = int(round(n_rows * (1 - test_fraction)))
+    valid_start = int(round(n_rows * (1 - test_fraction - valid_fraction)))
+    return valid_start, test_start
+
+
+class BinnedDatasets:
+    """
+    Training data of a clean dataset, cached per dataset fingerprint.
+
+    The latest `test_fraction` of flights form a test fold that neither early
+    stopping nor any search sees, so the metrics reported on it are unbiased.
+
+    The fingerprint covers the content of `clean_path`, the split and binning
+    parameters and the feature encoding code. Under it the clean dataset is
+    exported with `export_feature_matrix` (loaded memory-mapped and split into
+    row views), together with LightGBM's binary
+    `Dataset` and CatBoost's quantized `Pool`, so later runs skip both parsing and
+    binning. XGBoost's `QuantileDMatrix` cannot be serialized; it is quantized
+    from the cached arrays. Every object is built once per instance and then
+    shared by all trainings that use it.
+    """
+
+    def __init__(
+        self,
+        clean_path: Union[str, Path],
+        cache_dir: Union[str, Path] = "dataset/processed/.cache/training",
+        valid_fraction: float = 0.2,
+        max_bin: int = 255,
+        test_fraction: float = 0.0,
+    ):
+        self.clean_path = Path(clean_path)
+        self.valid_fraction = valid_fraction
+        self.test_fraction = test_fraction
+        self.max_bin = max_bin
+
+        cache_dir = Path(cache_dir)
+        self.fingerprint = StageCache(cache_dir).fingerprint(
+            inputs=[self.clean_path],
+            params={
+                "valid_fraction": valid_fraction,
+                "test_fraction": test_fraction,
+                "max_bin": max_bin,
+            },
+            code=[online, matrix],
+        )
+        self.directory = cache_dir / self.fingerprint[:16]
+        self._arrays = None
+        self._built = {}
+
+    def __getstate__(self):
+        # Pickles as its cache location only, so process pool workers reopen the
+        # cached files (the arrays memory-mapped) instead of receiving copies.
+        # The binned library objects are native and are loaded once per worker.
+        state = self.__dict__.copy()
+        state["_arrays"] = None
+        state["_built"] = {}
+        return state
+
+    def _path(self, name: str) -> Path:
+        return self.directory / name
+
+    @property
+    def feature_names(self) -> list[str]:
+        self.arrays()
+        return json.loads(self._path("features.json").read_text())["columns"]
+
+    def arrays(self) -> dict[str, tuple[np.ndarray, np.ndarray]]:
+        """
+        Features and 0/1 labels (1 = delayed) of the train, valid and test splits,
+        parsed only once.
+        """
+        if self._arrays is not None:
+            return self._arrays
+
+        if not self._path("features.json").exists():
+            print(f"Encoding {self.clean_path} -> {self.directory}")
+            export_feature_matrix(self.clean_path, self.directory)
+
+        features, labels, sidecar = load_feature_matrix(self.directory)
+        valid_start, test_start = time_ordered_splits(
+            sidecar["rows"], self.valid_fraction, self.test_fraction
+        )
+        # Row slices of the memmap are views, so no split is copied
+        self._arrays = {
+            "train": (features[:valid_start], np.asarray(labels[:valid_start])),
+            "valid": (
+                features[valid_start:test_start],
+                np.asarray(labels[valid_start:test_start]),
+            ),
+            "test": (features[test_start:], np.asarray(labels[test_start:])),
+        }
+        return self._arrays
+
+    def _memoized(self, library: str, build):
+        if library not in self._built:
+            self._built[library] = build()
+        return self._built[library]
+
+    def lightgbm(self):
+        """LightGBM (train, valid) `Dataset`s, loaded from their binary files."""
+        return self._memoized("lightgbm", self._build_lightgbm)
+
+    def _build_lightgbm(self):
+        import lightgbm as lgb
+
+        train_path = self._path("lightgbm_train.bin")
+        valid_path = self._path("lightgbm_valid.bin")
+        # Without pre-filtering, trials may change min_data_in_leaf on the same
+        # constructed Dataset
+        params = {"max_bin": self.max_bin, "feature_pre_filter": False, "verbose": -1}
+
+        if not (train_path.exists() and valid_path.exists()):
+            arrays = self.arrays()
+            train = lgb.Dataset(
+                np.asarray(arrays["train"][0]),
+                arrays["train"][1],
+                feature_name=self.feature_names,
+                params=params,
+                free_raw_data=False,
+            )
+            valid = lgb.Dataset(
+                np.asarray(arrays["valid"][0]), arrays["valid"][1], reference=train
+            )
+            train.save_binary(str(train_path))
+            valid.save_binary(str(valid_path))
+
+        train = lgb.Dataset(str(train_path), params=params)
+        valid = lgb.Dataset(str(valid_path), reference=train, params=params)
+        return train.construct(), valid.construct()
+
+    def xgboost(self):
+        """XGBoost (train, valid) `QuantileDMatrix`es; valid reuses train's cuts."""
+        return self._memoized("xgboost", self._build_xgboost)
+
+    def _build_xgboost(self):
+        import xgboost as xgb
+
+        arrays = self.arrays()
+        names = self.feature_names
+        train = xgb.QuantileDMatrix(
+            arrays["train"][0],
+            arrays["train"][1],
+            max_bin=self.max_bin,
+            feature_names=names,
+            nthread=-1,
+        )
+        valid = xgb.QuantileDMatrix(
+            arrays["valid"][0],
+            arrays["valid"][1],
+            ref=train,
+            feature_names=names,
+            nthread=-1,
+        )
+        return train, valid
+
+    def catboost(self):
+        """CatBoost (train, valid) quantized `Pool`s, loaded from their saved files."""
+        return self._memoized("catboost", self._build_catboost)
+
+    def _build_catboost(self):
+        from catboost import Pool
+
+        train_path = self._path("catboost_train.pool")
+        valid_path = self._path("catboost_valid.pool")
+
+        if not (train_path.exists() and valid_path.exists()):
+            arrays = self.arrays()
+            names = self.feature_names
+            borders_path = self._path("catboost_borders.tsv")
+
+            train = Pool(
+                np.asarray(arrays["train"][0]), arrays["train"][1], feature_names=names
+            )
+            train.quantize(border_count=self.max_bin)
+            train.save_quantization_borders(str(borders_path))
+            valid = Pool(
+                np.asarray(arrays["valid"][0]), arrays["valid"][1], feature_names=names
+            )
+            valid.quantize(input_borders=str(borders_path))
+
+            train.save(str(train_path))
+            valid.save(str(valid_path))
+
+        return Pool(f"quantized://{train_path}"), Pool(f"quantized://{valid_path}")
+
+    def build(self, library: str):
+        """(train, valid) datasets for "lightgbm", "xgboost" or "catboost"."""
+        builders = {
+            "lightgbm": self.lightgbm,
+            "xgboost": self.xgboost,
+            "catboost": self.catboost,
+        }
+        if library not in builders:
+            raise ValueError(
+                f"Unsupported library {library!r}, use lightgbm, xgboost or catboost"
+            )
+        return builders[library]()
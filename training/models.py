@@ -0,0 +1,183 @@
+import os
+import pickle
+from pathlib import Path
+from typing import Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from training.datasets import BinnedDatasets
+
+LIBRARIES = ("lightgbm", "xgboost", "catboost")
+
+
+def default_threads() -> int:
+    return os.cpu_count() or 1
+
+
+class ScoringModel:
+    """
+    A trained booster behind one `predict_proba`, for `serve.py` and evaluation.
+
+    Predictions use the best iteration found by early stopping.
+    """
+
+    def __init__(self, library: str, booster, best_iteration: Optional[int] = None):
+        self.library = library
+        self.booster = booster
+        self.best_iteration = best_iteration
+
+    @property
+    def best_num_rounds(self) -> Optional[int]:
+        """Boosting rounds up to the best iteration (LightGBM counts from 1)."""
+        if self.best_iteration is None:
+            return None
+        if self.library == "lightgbm":
+            return self.best_iteration
+        return self.best_iteration + 1
+
+    def predict_proba(self, features: np.ndarray) -> np.ndarray:
+        features = np.asarray(features, dtype=np.float32)
+        if self.library == "lightgbm":
+            scores = self.booster.predict(features, num_iteration=self.best_iteration)
+        elif self.library == "xgboost":
+            # (0, 0) uses every tree
+            iteration_range = (
+                (0, self.best_iteration + 1)
+                if self.best_iteration is not None
+                else (0, 0)
+            )
+            scores = self.booster.inplace_predict(
+                features, iteration_range=iteration_range
+            )
+        else:
+            scores = self.booster.predict_proba(features)[:, 1]
+        scores = np.asarray(scores, dtype=np.float64)
+        return np.column_stack([1 - scores, scores])
+
+    def save(self, path: Union[str, Path]) -> Path:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "wb") as f:
+            pickle.dump(self, f)
+        return path
+
+
+def roc_auc(labels: np.ndarray, scores: np.ndarray) -> float:
+    """Rank-based ROC AUC (ties share their average rank)."""
+    labels = np.asarray(labels).astype(bool)
+    positives = labels.sum()
+    negatives = len(labels) - positives
+    if positives == 0 or negatives == 0:
+        return float("nan")
+    ranks = pd.Series(scores).rank().to_numpy()
+    return float(
+        (ranks[labels].sum() - positives * (positives + 1) / 2)
+        / (positives * negatives)
+    )
+
+
+def log_loss(labels: np.ndarray, scores: np.ndarray, eps: float = 1e-15) -> float:
+    scores = np.clip(scores, eps, 1 - eps)
+    return float(-np.mean(labels * np.log(scores) + (1 - labels) * np.log(1 - scores)))
+
+
+def evaluate(model: ScoringModel, features: np.ndarray, labels: np.ndarray) -> dict:
+    scores = model.predict_proba(features)[:, 1]
+    return {"auc": roc_auc(labels, scores), "logloss": log_loss(labels, scores)}
+
+
+def train_lightgbm(
+    datasets: BinnedDatasets,
+    params: Optional[dict] = None,
+    num_boost_round: int = 1000,
+    early_stopping_rounds: Optional[int] = 50,
+    threads: Optional[int] = None,
+) -> ScoringModel:
+    import lightgbm as lgb
+
+    train, valid = datasets.lightgbm()
+    params = {
+        "objective": "binary",
+        "metric": "binary_logloss",
+        "num_threads": threads or default_threads(),
+        "verbose": -1,
+        **(params or {}),
+    }
+    callbacks = []
+    if early_stopping_rounds:
+        callbacks.append(lgb.early_stopping(early_stopping_rounds, verbose=False))
+
+    booster = lgb.train(
+        params, train, num_boost_round, valid_sets=[valid], callbacks=callbacks
+    )
+    return ScoringModel("lightgbm", booster, booster.best_iteration or None)
+
+
+def train_xgboost(
+    datasets: BinnedDatasets,
+    params: Optional[dict] = None,
+    num_boost_round: int = 1000,
+    early_stopping_rounds: Optional[int] = 50,
+    threads: Optional[int] = None,
+) -> ScoringModel:
+    import xgboost as xgb
+
+    train, valid = datasets.xgboost()
+    params = {
+        "objective": "binary:logistic",
+        "eval_metric": "logloss",
+        "tree_method": "hist",
+        "max_bin": datasets.max_bin,
+        "nthread": threads or default_threads(),
+        **(params or {}),
+    }
+    booster = xgb.train(
+        params,
+        train,
+        num_boost_round,
+        evals=[(valid, "valid")],
+        early_stopping_rounds=early_stopping_rounds,
+        verbose_eval=False,
+    )
+    best_iteration = booster.best_iteration if early_stopping_rounds else None
+    return ScoringModel("xgboost", booster, best_iteration)
+
+
+def train_catboost(
+    datasets: BinnedDatasets,
+    params: Optional[dict] = None,
+    num_boost_round: int = 1000,
+    early_stopping_rounds: Optional[int] = 50,
+    threads: Optional[int] = None,
+) -> ScoringModel:
+    from catboost import CatBoostClassifier
+
+    train, valid = datasets.catboost()
+    model = CatBoostClassifier(
+        iterations=num_boost_round,
+        loss_function="Logloss",
+        thread_count=threads or default_threads(),
+        early_stopping_rounds=early_stopping_rounds,
+        verbose=False,
+        **(params or {}),
+    )
+    model.fit(train, eval_set=valid)
+    # predict_proba already stops at the best iteration (use_best_model)
+    return ScoringModel("catboost", model, model.get_best_iteration())
+
+
+TRAINERS = {
+    "lightgbm": train_lightgbm,
+    "xgboost": train_xgboost,
+    "catboost": train_catboost,
+}
+
+
+def train_model(library: str, datasets: BinnedDatasets, **kwargs) -> ScoringModel:
+    """Trains `library` ("lightgbm", "xgboost" or "catboost") on `datasets`."""
+    if library not in TRAINERS:
+        raise ValueError(
+            f"Unsupported library {library!r}, use lightgbm, xgboost or catboost"
+        )
+    return TRAINERS[library](datasets, **kwargs)
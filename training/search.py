@@ -0,0 +1,213 @@
+import math
+import os
+import time
+from typing import Optional
+
+import numpy as np
+from joblib import Parallel, delayed
+
+from training.datasets import BinnedDatasets
+from training.models import evaluate, train_model
+
+# (kind, low, high) per parameter; "log" samples uniformly in log space
+PARAM_SPACES = {
+    "lightgbm": {
+        "learning_rate": ("log", 0.01, 0.3),
+        "num_leaves": ("int", 15, 255),
+        "min_child_samples": ("int", 5, 100),
+        "feature_fraction": ("float", 0.5, 1.0),
+        "lambda_l2": ("log", 1e-3, 10.0),
+    },
+    "xgboost": {
+        "eta": ("log", 0.01, 0.3),
+        "max_depth": ("int", 3, 10),
+        "min_child_weight": ("log", 0.5, 20.0),
+        "subsample": ("float", 0.5, 1.0),
+        "colsample_bytree": ("float", 0.5, 1.0),
+        "lambda": ("log", 1e-3, 10.0),
+    },
+    "catboost": {
+        "learning_rate": ("log", 0.01, 0.3),
+        "depth": ("int", 4, 10),
+        "l2_leaf_reg": ("log", 1.0, 10.0),
+        "random_strength": ("float", 0.0, 2.0),
+    },
+}
+
+_worker_datasets = {}
+
+
+def sample_params(space: dict, rng: np.random.Generator) -> dict:
+    params = {}
+    for name, (kind, low, high) in space.items():
+        if kind == "int":
+            params[name] = int(rng.integers(low, high + 1))
+        elif kind == "log":
+            params[name] = float(math.exp(rng.uniform(math.log(low), math.log(high))))
+        else:
+            params[name] = float(rng.uniform(low, high))
+    return params
+
+
+def _shared_datasets(datasets: BinnedDatasets) -> BinnedDatasets:
+    """
+    One `BinnedDatasets` per worker process and fingerprint, so every trial the
+    worker runs reuses the same loaded (train, valid) objects.
+    """
+    return _worker_datasets.setdefault(datasets.fingerprint, datasets)
+
+
+def run_trial(
+    library: str,
+    datasets: BinnedDatasets,
+    params: dict,
+    num_boost_round: int,
+    early_stopping_rounds: Optional[int] = 50,
+    threads: int = 1,
+) -> dict:
+    """Trains one configuration for up to `num_boost_round` rounds and scores it."""
+    datasets = _shared_datasets(datasets)
+    start = time.perf_counter()
+    model = train_model(
+        library,
+        datasets,
+        params=params,
+        num_boost_round=num_boost_round,
+        early_stopping_rounds=early_stopping_rounds,
+        threads=threads,
+    )
+    valid_features, valid_labels = datasets.arrays()["valid"]
+    metrics = evaluate(model, valid_features, valid_labels)
+
+    best_rounds = model.best_num_rounds
+    stopped = (
+        early_stopping_rounds is not None
+        and best_rounds is not None
+        and best_rounds + early_stopping_rounds <= num_boost_round
+    )
+    return {
+        "library": library,
+        "params": params,
+        "rounds": num_boost_round,
+        "best_rounds": best_rounds,
+        "stopped": stopped,
+        "seconds": time.perf_counter() - start,
+        **metrics,
+    }
+
+
+def successive_halving(
+    library: str,
+    datasets: BinnedDatasets,
+    configs: list[dict],
+    min_rounds: int,
+    max_rounds: int,
+    eta: int = 3,
+    early_stopping_rounds: Optional[int] = 50,
+    parallel: Optional[Parallel] = None,
+    threads: int = 1,
+) -> list[dict]:
+    """
+    Runs every configuration with `min_rounds` boosting rounds, keeps the best
+    1/`eta` by validation AUC and multiplies their rounds by `eta`, until one
+    configuration or `max_rounds` is left. Configurations that already early
+    stopped keep their result instead of being retrained with a larger budget.
+    Returns every trial run.
+    """
+    parallel = parallel or Parallel(n_jobs=1)
+    trials = []
+    rounds = min_rounds
+    survivors = [{"params": params, "stopped": False} for params in configs]
+
+    while True:
+        pending = [trial for trial in survivors if not trial["stopped"]]
+        results = parallel(
+            delayed(run_trial)(
+                library,
+                datasets,
+                trial["params"],
+                rounds,
+                early_stopping_rounds,
+                threads,
+            )
+            for trial in pending
+        )
+        trials.extend(results)
+        rung = [trial for trial in survivors if trial["stopped"]] + results
+        print(
+            f"   {library}: {len(pending)} trials at {rounds} rounds, "
+            f"best AUC {max(trial['auc'] for trial in rung):.4f}"
+        )
+
+        if len(rung) <= 1 or rounds >= max_rounds:
+            return trials
+        rung.sort(key=lambda trial: trial["auc"], reverse=True)
+        survivors = rung[: max(1, len(rung) // eta)]
+        rounds = min(max_rounds, rounds * eta)
+
+
+def hyperband(
+    library: str,
+    datasets: BinnedDatasets,
+    max_rounds: int = 1000,
+    min_rounds: int = 25,
+    eta: int = 3,
+    early_stopping_rounds: Optional[int] = 50,
+    n_jobs: Optional[int] = None,
+    seed: int = 0,
+    space: Optional[dict] = None,
+) -> dict:
+    """
+    Hyperband search over `space` (default `PARAM_SPACES[library]`) with boosting
+    rounds as the budget: brackets of successive halving that trade many short
+    trials against few long ones.
+
+    Trials run across a joblib process pool of `n_jobs` workers, each booster
+    using its share of the cores. Workers receive `datasets` as its cache location
+    and load the binned datasets from disk once each, so the data is never copied
+    per trial. Returns the best trial, with its `num_boost_round` set to the
+    iteration early stopping picked.
+
+    Memory still grows with `n_jobs`: the feature arrays are memory-mapped and
+    shared through the page cache, but every worker holds its own library
+    `Dataset`/`QuantileDMatrix`/`Pool`, about one byte per train and valid value
+    at `max_bin` <= 255 (a quarter of the float32 matrix). Lower `n_jobs` when
+    that times the number of workers does not fit.
+    """
+    space = space or PARAM_SPACES[library]
+    rng = np.random.default_rng(seed)
+    n_jobs = n_jobs or os.cpu_count() or 1
+    threads = max(1, (os.cpu_count() or 1) // n_jobs)
+
+    # Bins once in this process; workers then only read the cached files
+    datasets.build(library)
+
+    s_max = int(math.log(max_rounds / min_rounds, eta) + 1e-9)
+    trials = []
+    with Parallel(n_jobs=n_jobs, backend="loky") as parallel:
+        for s in range(s_max, -1, -1):
+            n_configs = math.ceil((s_max + 1) / (s + 1) * eta**s)
+            configs = [sample_params(space, rng) for _ in range(n_configs)]
+            trials += successive_halving(
+                library,
+                datasets,
+                configs,
+                min_rounds=max(1, int(max_rounds * eta**-s)),
+                max_rounds=max_rounds,
+                eta=eta,
+                early_stopping_rounds=early_stopping_rounds,
+                parallel=parallel,
+                threads=threads,
+            )
+
+    # Each configuration is judged by its largest budget, not by an early rung
+    final = {}
+    for trial in trials:
+        final[tuple(sorted(trial["params"].items()))] = trial
+    best = max(final.values(), key=lambda trial: trial["auc"])
+    return {
+        **best,
+        "num_boost_round": best["best_rounds"] or best["rounds"],
+        "trials": len(trials),
+        "trial_seconds": sum(trial["seconds"] for trial in trials),
+    }